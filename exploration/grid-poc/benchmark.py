@@ -0,0 +1,518 @@
+#!/bin/python3
+# vim: et:ts=4:sts=4:sw=4
+
+# SPDX-License-Identifier: BSD-2-Clause
+# Copyright © 2024 The Alan Turing Institute
+
+# Benchmark
+
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from multiprocessing import get_context
+from time import perf_counter
+
+import numpy as np
+
+from world import (
+    Grid,
+    ArrayGrid,
+)
+
+from src.mappedgrid import (
+    MappedGrid,
+)
+
+from src.parallelgrid import (
+    ParallelGrid,
+)
+
+from src.profiling import (
+    Profiler,
+)
+
+SIZES = [
+    (16, 16, 8),
+    (32, 32, 16),
+    (64, 64, 32),
+    (128, 128, 32),
+    (256, 256, 64),
+]
+
+HISTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks", "history.jsonl")
+
+def parse_size(text):
+    """
+    Parse a world size of the form WIDTHxDEPTHxHEIGHT
+
+    Args:
+        text the size as a string
+
+    Returns:
+        Tuple (width, depth, height)
+    """
+    width, depth, height = (int(value) for value in text.lower().split("x"))
+    return (width, depth, height)
+
+def git_commit():
+    """
+    Returns the commit the benchmark is being run against
+
+    Returns:
+        The commit hash, with a "+" appended if there are uncommitted changes,
+        or None if it can't be determined
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=here,
+            capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=here,
+            capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ("+" if dirty else "")
+
+def peak_memory():
+    """
+    Returns the peak resident memory of this process in bytes
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+def measure(size, backend, seed, ticks, warmup, processes=None):
+    """
+    Benchmark Grid.update for one world size and backend
+
+    Each phase of the tick is timed separately.
+
+    Args:
+        size tuple (width, depth, height)
+        backend "objects", "arrays", "mapped" or "parallel"
+        seed random seed used to populate the world
+        ticks number of ticks to time
+        warmup number of ticks to run before timing starts
+        processes number of worker processes for the parallel backend, or
+            None for one per CPU
+
+    Returns:
+        Dictionary of results
+    """
+    width, depth, height = size
+    grid = Grid()
+    grid.width = width
+    grid.depth = depth
+    grid.height = height
+
+    random.seed(seed)
+    start = perf_counter()
+    if backend == "mapped":
+        grid = MappedGrid(width, depth, height)
+    elif backend == "arrays":
+        grid = ArrayGrid(width, depth, height)
+    elif backend == "parallel":
+        grid = ParallelGrid(width, depth, height, processes=processes)
+    grid.populate()
+    if backend == "parallel":
+        grid.start()
+    populate = perf_counter() - start
+
+    for _ in range(warmup):
+        grid.update()
+
+    grid.profiler = Profiler()
+    start = perf_counter()
+    for _ in range(ticks):
+        grid.update()
+    elapsed = perf_counter() - start
+    report = grid.profiler.report()
+    if backend == "mapped":
+        shutil.rmtree(grid.directory)
+    elif backend == "parallel":
+        processes = len(grid.workers)
+        grid.close()
+
+    cells = width * depth * height
+    return {
+        "size": "{}x{}x{}".format(width, depth, height),
+        "cells": cells,
+        "backend": backend,
+        "processes": processes if backend == "parallel" else 1,
+        "seed": seed,
+        "ticks": ticks,
+        "populate_seconds": populate,
+        "seconds": elapsed,
+        "ticks_per_second": ticks / elapsed,
+        "ns_per_cell": 1e9 * elapsed / (ticks * cells),
+        "phases": {name: phase["seconds"] for name, phase in report["phases"].items()},
+        "counters": report["counters"],
+        "peak_memory": peak_memory(),
+    }
+
+def measure_memory(size, backend, seed, ticks):
+    """
+    Measure the memory used to hold a world
+
+    Everything allocated while populating the world and running it for a
+    few ticks, and still held at the end, is counted. This includes the
+    neighbour tables shared by grids of the same size.
+
+    Args:
+        size tuple (width, depth, height)
+        backend "objects" or "arrays"
+        seed random seed used to populate the world
+        ticks number of ticks to run before measuring
+
+    Returns:
+        Dictionary of results
+    """
+    width, depth, height = size
+    tracemalloc.start()
+    grid = Grid()
+    grid.width = width
+    grid.depth = depth
+    grid.height = height
+
+    random.seed(seed)
+    if backend == "arrays":
+        grid = ArrayGrid(width, depth, height)
+    grid.populate()
+    for _ in range(ticks):
+        grid.update()
+    used, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    cells = width * depth * height
+    return {
+        "size": "{}x{}x{}".format(width, depth, height),
+        "cells": cells,
+        "backend": backend,
+        "seed": seed,
+        "ticks": ticks,
+        "bytes": used,
+        "peak_bytes": peak,
+        "bytes_per_cell": used / cells,
+    }
+
+def memory(sizes, backends, seed, ticks):
+    """
+    Report the memory used per cell
+
+    Each case is run in a fresh process.
+
+    Args:
+        sizes list of (width, depth, height) tuples
+        backends list of backend names
+        seed random seed used to populate the worlds
+        ticks number of ticks to run before measuring
+
+    Returns:
+        List of results
+    """
+    context = get_context("spawn")
+    results = []
+    for size in sizes:
+        for backend in backends:
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                result = executor.submit(measure_memory, size, backend, seed, ticks).result()
+            results.append(result)
+            print("{size:>12} {backend:>8} {bytes_per_cell:10.1f} bytes/cell {total:8.1f} MiB".format(
+                total=result["bytes"] / 2**20, **result))
+    return results
+
+def measure_paging(size, seed, ticks, chunk_width, cold, directory):
+    """
+    Time a memory-mapped world with its files in or out of the page cache
+
+    With a warm cache the files stay in memory between ticks, as they do
+    when the world fits in memory. With a cold cache they're dropped from
+    the page cache before every tick, so each tick reads them back from
+    disk, as happens when the world is much larger than memory.
+
+    Args:
+        size tuple (width, depth, height)
+        seed random seed used to populate the world
+        ticks number of ticks to time
+        chunk_width x slabs in each chunk, or None for the default
+        cold whether to drop the files from the page cache before each tick
+        directory to create the world in, or None for the system temporary
+            directory
+
+    Returns:
+        Dictionary of results
+    """
+    width, depth, height = size
+    directory = tempfile.mkdtemp(prefix="plantworld-", dir=directory)
+    try:
+        random.seed(seed)
+        grid = MappedGrid(width, depth, height, directory=directory, chunk_width=chunk_width)
+        grid.populate()
+        grid.update()
+
+        elapsed = 0.0
+        before = resource.getrusage(resource.RUSAGE_SELF)
+        for _ in range(ticks):
+            if cold:
+                grid.evict()
+            start = perf_counter()
+            grid.update()
+            elapsed += perf_counter() - start
+        after = resource.getrusage(resource.RUSAGE_SELF)
+        disk = grid.disk_usage()
+        chunks = len(grid.chunks())
+        chunk_width = grid.chunk_width
+    finally:
+        shutil.rmtree(directory)
+
+    cells = width * depth * height
+    return {
+        "size": "{}x{}x{}".format(width, depth, height),
+        "cells": cells,
+        "backend": "mapped",
+        "cache": "cold" if cold else "warm",
+        "chunk_width": chunk_width,
+        "chunks": chunks,
+        "seed": seed,
+        "ticks": ticks,
+        "seconds": elapsed,
+        "ticks_per_second": ticks / elapsed,
+        "ns_per_cell": 1e9 * elapsed / (ticks * cells),
+        "major_faults_per_tick": (after.ru_majflt - before.ru_majflt) / ticks,
+        "minor_faults_per_tick": (after.ru_minflt - before.ru_minflt) / ticks,
+        "disk_bytes": disk,
+        "disk_bytes_per_cell": disk / cells,
+        "peak_memory": peak_memory(),
+    }
+
+def paging(sizes, seed, ticks, chunk_widths, directory):
+    """
+    Report how memory-mapped worlds run with a warm and a cold page cache
+
+    Each case is run in a fresh process.
+
+    Args:
+        sizes list of (width, depth, height) tuples
+        seed random seed used to populate the worlds
+        ticks number of ticks to time for each case
+        chunk_widths list of chunk widths to try, with None for the default
+        directory to create the worlds in, or None for the system temporary
+            directory
+
+    Returns:
+        List of results
+    """
+    context = get_context("spawn")
+    results = []
+    for size in sizes:
+        for chunk_width in chunk_widths:
+            for cold in (False, True):
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                    result = executor.submit(measure_paging, size, seed, ticks, chunk_width, cold,
+                        directory).result()
+                results.append(result)
+                print("{size:>12} {chunk_width:>4} wide {cache:>4} {ticks_per_second:8.2f} ticks/s "
+                    "{ns_per_cell:8.1f} ns/cell {major_faults_per_tick:8.0f} major "
+                    "{minor_faults_per_tick:8.0f} minor faults/tick {memory:8.1f} MiB peak "
+                    "{disk:8.1f} MiB on disk".format(memory=result["peak_memory"] / 2**20,
+                    disk=result["disk_bytes"] / 2**20, **result))
+    return results
+
+def scaling(sizes, processes, seed, ticks, warmup):
+    """
+    Report how the parallel backend speeds up with the number of workers
+
+    The speedup is given against the arrays backend, which runs the same
+    tick in a single process. Each case is run in a fresh process.
+
+    Args:
+        sizes list of (width, depth, height) tuples
+        processes list of the numbers of workers to try
+        seed random seed used to populate the worlds
+        ticks number of ticks to time for each case
+        warmup number of ticks to run before timing
+
+    Returns:
+        List of results
+    """
+    context = get_context("spawn")
+    results = []
+    for size in sizes:
+        serial = None
+        for count in [None] + list(processes):
+            backend = "arrays" if count is None else "parallel"
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                result = executor.submit(measure, size, backend, seed, ticks, warmup, count).result()
+            if serial is None:
+                serial = result["ticks_per_second"]
+            result["speedup"] = result["ticks_per_second"] / serial
+            result["efficiency"] = result["speedup"] / result["processes"]
+            results.append(result)
+            print("{size:>12} {backend:>8} {processes:>3} {ticks_per_second:10.2f} ticks/s "
+                "{speedup:6.2f}x {efficiency:6.0%} efficiency".format(**result))
+    return results
+
+def run(sizes, backends, seed, ticks, warmup, history):
+    """
+    Run the benchmarks and record the results
+
+    Each case is run in a fresh process so that its peak memory isn't
+    affected by the cases before it.
+
+    Args:
+        sizes list of (width, depth, height) tuples
+        backends list of backend names
+        seed random seed used to populate the worlds
+        ticks number of ticks to time for each case
+        warmup number of ticks to run before timing
+        history file to append the results to, or None
+
+    Returns:
+        List of results
+    """
+    context = get_context("spawn")
+    environment = {
+        "time": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "processor": platform.processor() or None,
+    }
+    results = []
+    for size in sizes:
+        for backend in backends:
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                result = executor.submit(measure, size, backend, seed, ticks, warmup).result()
+            result.update(environment)
+            results.append(result)
+            print("{size:>12} {backend:>8} {ticks_per_second:10.2f} ticks/s {ns_per_cell:10.1f} ns/cell "
+                "{memory:8.1f} MiB".format(memory=result["peak_memory"] / 2**20, **result))
+            if history:
+                os.makedirs(os.path.dirname(os.path.abspath(history)), exist_ok=True)
+                with open(history, "a") as output:
+                    output.write(json.dumps(result) + "\n")
+    return results
+
+def compare(history, field, first, second):
+    """
+    Compare two sets of results from the history
+
+    Results are matched by world size and, when comparing commits, by
+    backend. The most recent result of each is used.
+
+    Args:
+        history file holding the results
+        field "backend" or "commit"
+        first, second the values of the field to compare; commits may be
+            given as a prefix
+    """
+    def matches(result, value):
+        if field == "commit":
+            return (result.get("commit") or "").startswith(value)
+        return result.get(field) == value
+
+    latest = {}
+    with open(history) as results:
+        for line in results:
+            result = json.loads(line)
+            for which, value in ((0, first), (1, second)):
+                if matches(result, value):
+                    key = (result["size"], None if field == "backend" else result["backend"])
+                    latest[(which,) + key] = result
+
+    keys = sorted({key[1:] for key in latest}, key=lambda key: (parse_size(key[0]), key[1] or ""))
+    print("{:>12} {:>8} {:>12} {:>12} {:>8}".format("size", "backend", first[:12], second[:12], "speedup"))
+    for key in keys:
+        a = latest.get((0,) + key)
+        b = latest.get((1,) + key)
+        if a is None or b is None:
+            continue
+        print("{:>12} {:>8} {:>12.2f} {:>12.2f} {:>7.2f}x".format(key[0], key[1] or "",
+            a["ticks_per_second"], b["ticks_per_second"], b["ticks_per_second"] / a["ticks_per_second"]))
+        for name in a["phases"]:
+            if name in b["phases"] and b["phases"][name] > 0:
+                print("{:>34} {:>12.3g} {:>12.3g} {:>7.2f}x".format(name,
+                    a["phases"][name], b["phases"][name], a["phases"][name] / b["phases"][name]))
+
+def parse_args(argv=None):
+    """
+    Parse the command line arguments
+
+    Args:
+        argv list of arguments, or None to use sys.argv
+
+    Returns:
+        Parsed arguments
+    """
+    parser = argparse.ArgumentParser(description="Benchmark the Plantworld update")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    command = commands.add_parser("run", help="run the benchmarks")
+    command.add_argument("--sizes", nargs="+", type=parse_size, default=SIZES,
+        help="world sizes as WIDTHxDEPTHxHEIGHT (default 16x16x8 up to 256x256x64)")
+    command.add_argument("--backend", nargs="+", choices=["objects", "arrays", "mapped", "parallel"],
+        default=["arrays"], help="backends to benchmark")
+    command.add_argument("--seed", type=int, default=4, help="random seed used to populate the worlds")
+    command.add_argument("--ticks", type=int, default=10, help="ticks to time for each case")
+    command.add_argument("--warmup", type=int, default=2, help="ticks to run before timing")
+    command.add_argument("--history", default=HISTORY, help="file to append the results to")
+
+    command = commands.add_parser("memory", help="measure the memory used per cell")
+    command.add_argument("--sizes", nargs="+", type=parse_size, default=SIZES[:3],
+        help="world sizes as WIDTHxDEPTHxHEIGHT (default 16x16x8 up to 64x64x32)")
+    command.add_argument("--backend", nargs="+", choices=["objects", "arrays"], default=["objects"],
+        help="backends to measure")
+    command.add_argument("--seed", type=int, default=4, help="random seed used to populate the worlds")
+    command.add_argument("--ticks", type=int, default=1, help="ticks to run before measuring")
+
+    command = commands.add_parser("paging", help="time memory-mapped worlds with a warm and cold page cache")
+    command.add_argument("--sizes", nargs="+", type=parse_size, default=SIZES[2:4],
+        help="world sizes as WIDTHxDEPTHxHEIGHT (default 64x64x32 and 128x128x32)")
+    command.add_argument("--chunk-width", nargs="+", type=int, default=[None],
+        help="x slabs in each chunk (default about a million cells)")
+    command.add_argument("--seed", type=int, default=4, help="random seed used to populate the worlds")
+    command.add_argument("--ticks", type=int, default=5, help="ticks to time for each case")
+    command.add_argument("--directory", default=None,
+        help="directory to create the worlds in (default the system temporary directory)")
+
+    command = commands.add_parser("scaling", help="time the parallel backend with more and more workers")
+    command.add_argument("--sizes", nargs="+", type=parse_size, default=SIZES[3:],
+        help="world sizes as WIDTHxDEPTHxHEIGHT (default 128x128x32 and 256x256x64)")
+    command.add_argument("--processes", nargs="+", type=int, default=[1, 2, 4, 8, 16],
+        help="numbers of worker processes to try")
+    command.add_argument("--seed", type=int, default=4, help="random seed used to populate the worlds")
+    command.add_argument("--ticks", type=int, default=10, help="ticks to time for each case")
+    command.add_argument("--warmup", type=int, default=2, help="ticks to run before timing")
+
+    command = commands.add_parser("compare", help="compare results from the history")
+    command.add_argument("field", choices=["backend", "commit"], help="what to compare")
+    command.add_argument("first", help="baseline backend or commit")
+    command.add_argument("second", help="backend or commit to compare against the baseline")
+    command.add_argument("--history", default=HISTORY, help="file holding the results")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    """
+    Benchmark entry point
+    """
+    args = parse_args()
+    if args.command == "run":
+        run(args.sizes, args.backend, args.seed, args.ticks, args.warmup, args.history)
+    elif args.command == "memory":
+        memory(args.sizes, args.backend, args.seed, args.ticks)
+    elif args.command == "scaling":
+        scaling(args.sizes, args.processes, args.seed, args.ticks, args.warmup)
+    elif args.command == "paging":
+        paging(args.sizes, args.seed, args.ticks, args.chunk_width, args.directory)
+    else:
+        compare(args.history, args.field, args.first, args.second)
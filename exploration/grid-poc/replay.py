@@ -0,0 +1,158 @@
+#!/bin/python3
+# vim: et:ts=4:sts=4:sw=4
+
+# SPDX-License-Identifier: BSD-2-Clause
+# Copyright © 2024 The Alan Turing Institute
+
+# Replay
+
+import argparse
+from time import perf_counter
+
+from src.recording import (
+    Replay,
+)
+
+class Player():
+    """
+    Shows a recording in the voxel viewer
+
+    No physics is run: the colours of each tick are read from the
+    recording. Playback runs at a given number of ticks per second, which
+    can be changed while playing, and can be paused, stepped and moved to
+    any tick.
+
+    Keys:
+        space pause or resume
+        Right, Left step forward or back one tick
+        Up, Down double or halve the speed
+        Home, End go to the first or last tick
+    """
+    # Milliseconds between frames
+    interval = 50
+
+    def __init__(self, replay, speed=10.0):
+        self.replay = replay
+        self.speed = speed
+        self.paused = False
+        # Ticks owed to the playback since the last frame shown
+        self.owed = 0.0
+        self.last = perf_counter()
+
+    def advance(self):
+        """
+        Move the replay on by the number of ticks due since the last call
+
+        Returns:
+            True if the tick shown has changed
+        """
+        now = perf_counter()
+        elapsed, self.last = now - self.last, now
+        if self.paused:
+            return False
+        self.owed += elapsed * self.speed
+        ticks = int(self.owed)
+        if ticks == 0:
+            return False
+        self.owed -= ticks
+        if ticks == 1:
+            return self.replay.step()
+        tick = self.replay.tick
+        self.replay.seek(tick + ticks)
+        return self.replay.tick != tick
+
+    def seek(self, tick):
+        """
+        Show a tick, clamped to those in the recording
+
+        Args:
+            tick to show
+        """
+        self.replay.seek(min(max(tick, self.replay.ticks[0]), self.replay.ticks[-1]))
+        self.owed = 0.0
+
+    def step_back(self):
+        """
+        Show the recorded tick before the current one
+        """
+        position = self.replay.position
+        if position > 0:
+            self.seek(self.replay.ticks[position - 1])
+
+    def toggle(self):
+        self.paused = not self.paused
+        self.owed = 0.0
+
+    def main(self):
+        """
+        Open the window and play the recording
+        """
+        # Only pay for the Qt/VTK imports when a window is wanted
+        import src.voxels as vxm
+
+        replay = self.replay
+        pl, voxels = vxm.draw(replay.width, replay.depth, replay.height)
+        voxels.set_colours(replay.colours)
+        text = pl.add_text("", position="upper_left", font_size=10)
+
+        def show():
+            text.SetText(2, "tick {}  speed {:g}/s{}".format(
+                replay.tick, self.speed, "  paused" if self.paused else ""))
+            voxels.set_colours(replay.colours)
+
+        def update():
+            if self.advance():
+                show()
+
+        def key(action):
+            def handler():
+                action()
+                show()
+            return handler
+
+        pl.add_key_event("space", key(self.toggle))
+        pl.add_key_event("Right", key(lambda: self.seek(replay.tick + 1)))
+        pl.add_key_event("Left", key(self.step_back))
+        pl.add_key_event("Up", key(lambda: setattr(self, "speed", self.speed * 2)))
+        pl.add_key_event("Down", key(lambda: setattr(self, "speed", self.speed / 2)))
+        pl.add_key_event("Home", key(lambda: self.seek(replay.ticks[0])))
+        pl.add_key_event("End", key(lambda: self.seek(replay.ticks[-1])))
+        pl.add_callback(update, interval=self.interval)
+        show()
+        pl.show()
+
+        while True:
+            pl.render()
+            pl.app.processEvents()
+
+def parse_args(argv=None):
+    """
+    Parse the command line arguments
+
+    Args:
+        argv list of arguments, or None to use sys.argv
+
+    Returns:
+        Parsed arguments
+    """
+    parser = argparse.ArgumentParser(description="Play back a Plantworld recording")
+    parser.add_argument("recording", help="file written by world.py --record")
+    parser.add_argument("--speed", type=float, default=10.0, help="ticks per second")
+    parser.add_argument("--start", type=int, default=None, metavar="TICK", help="tick to start from")
+    parser.add_argument("--paused", action="store_true", help="start paused")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    """
+    Replay entry point
+    """
+    args = parse_args()
+    replay = Replay(args.recording)
+    player = Player(replay, args.speed)
+    if args.start is not None:
+        player.seek(args.start)
+    player.paused = args.paused
+    try:
+        player.main()
+    finally:
+        replay.close()
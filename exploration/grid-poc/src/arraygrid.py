@@ -0,0 +1,1265 @@
+#!/bin/python3
+# vim: et:ts=4:sts=4:sw=4
+
+# SPDX-License-Identifier: BSD-2-Clause
+# Copyright © 2024 The Alan Turing Institute
+
+# Array grid
+
+import copy
+import math
+import random
+from bisect import bisect_left
+from array import array
+from time import perf_counter
+import numpy as np
+
+from src.cells import (
+    UNSATURATED_PRESSURE_GRADIENT,
+    SATURATED_PRESSURE_GRADIENT,
+    Direction,
+    State,
+    Cell,
+    Air,
+    Soil,
+    Rock,
+    CellType,
+    CELL_TYPE_NAMES,
+)
+
+from src.plants import (
+    Plant,
+    PRESSURE_UNSATURATED,
+    PRESSURE_SATURATED,
+)
+from src.plants import SATURATED_PRESSURE_GRADIENT as PLANT_SATURATED_PRESSURE_GRADIENT
+
+from src.flux import (
+    limit_flux,
+)
+
+from src.utils import (
+    OPPOSITE,
+)
+
+from src.topology import (
+    topology,
+    neighbours_of,
+)
+
+from src.batch import (
+    batched,
+    CellBatch,
+    posted,
+)
+
+from src.scheduler import (
+    Schedule,
+)
+
+from src.checkpoint import (
+    write_checkpoint,
+    read_checkpoint,
+    save_plants,
+    load_plants,
+    class_name,
+)
+
+from src.lighting import (
+    Sun,
+    Lighting,
+)
+
+from src.terrain import (
+    terrain,
+    topsoil,
+)
+
+from src.weather import (
+    Climate,
+    Weather,
+)
+
+AIR = CellType.AIR.value
+ROCK = CellType.ROCK.value
+SOIL = CellType.SOIL.value
+PLANT = CellType.PLANT.value
+
+BELOW = Direction.BELOW.value
+ABOVE = Direction.ABOVE.value
+
+FACES = len(Direction)
+REVERSE = list(OPPOSITE)
+TYPES = [CellType(value) for value in range(len(CellType))]
+
+# Used as the incoming message for faces that don't border a plant
+EMPTY_STATE = State()
+
+class ArrayGrid():
+    """
+    Holds the data for the cells in the world as dense NumPy arrays
+
+    This is a structure-of-arrays alternative to the object model used by
+    Grid. Each piece of cell state is stored in a flat array with one row
+    per cell, indexed in the same order as Grid.cells, including the ghost
+    cell at the end (see Topology). The water physics is applied to the
+    whole grid at once as stencil operations.
+
+    Plant cells keep their Plant object so that species behaviour can still
+    be written as a Plant subclass. Each tick the object is loaded with the
+    cell's state, its update() method is called and the actions it takes are
+    copied back into the arrays. The water and sunlight physics of plants is
+    taken from the Plant base class.
+
+    Stepping an ArrayGrid gives the same results as stepping the Grid it
+    was created from. A world can also be populated straight into the
+    arrays, see populate().
+    """
+    width = 16
+    depth = 16
+    height = 8
+    periodic = True
+
+    # Terrain and seeding, as Grid
+    peak_x = 5
+    peak_y = 5
+    spread = 2.5
+    spring = 8192
+    species = (Plant,)
+    seeds = 16
+
+    # Set to a Profiler to instrument each tick
+    profiler = None
+
+    # Set by start_recording to stream each tick to disk
+    recorder = None
+
+    # Set to a Sandbox to run each species' program in a process of its own
+    sandbox = None
+
+    # Shading and the time of day, see set_sun(), or None for the sun to
+    # light every Plant face touching Air evenly
+    lighting = None
+
+    # Rain and evaporation, see set_climate(), or None for no weather
+    weather = None
+
+    # How often each subsystem is updated, and the number of ticks so far
+    schedule = Schedule()
+    ticks = 0
+
+    # Whether to build the neighbour tables for the whole grid up front, see
+    # chunk_neighbours()
+    tables = True
+
+    # Outgoing messages of plants held by another process, keyed by flat
+    # index, see ParallelGrid
+    halo = {}
+
+    def __init__(self, width=16, depth=16, height=8, periodic=True):
+        self.width = width
+        self.depth = depth
+        self.height = height
+        self.periodic = periodic
+        self.topology = topology(width, depth, height, periodic, self.tables)
+        self.neighbours = self.topology.neighbours
+        size = self.topology.storage
+        self.size = size
+
+        # Cell type and per-cell parameters
+        self.cell_type = self.allocate("cell_type", size, np.int8, AIR)
+        self.wsat = self.allocate("wsat", size, np.float64, Cell.wsat)
+        self.permeability = self.allocate("permeability", size, np.float64, Cell.permeability)
+
+        # Resources
+        self.water = self.allocate("water", size)
+        self.energy = self.allocate("energy", size)
+
+        # Per-face state
+        self.water_pressure_external = self.allocate("water_pressure_external", (size, FACES))
+        self.pressure_gradient = self.allocate("pressure_gradient", (size, FACES))
+        self.flux = self.allocate("flux", (size, FACES))
+        self.energy_outgoing = self.allocate("energy_outgoing", (size, FACES))
+
+        # Reproduction direction decided by fight, or -1 for none
+        self.reproduce = self.allocate("reproduce", size, np.int8, -1)
+
+        # Reproduction attempts made during the update, as pairs of arrays
+        # of the cells and the directions they tried to reproduce in, and
+        # the cells that won their fights, in index order, see fight()
+        self.attempts = []
+        self.winners = np.empty(0, dtype=np.intp)
+
+        # Render colours
+        self.colours = self.allocate("colours", (size, 4))
+
+        # Types of each cell's neighbours, refreshed by preupdate
+        self.neighbour_type = self.allocate("neighbour_type", (size, FACES), np.int8, AIR)
+
+        # Signals posted on each face by batched programs, see plantlang.
+        # Ticks alternate between the two buffers, so a signal posted in one
+        # tick is read by the neighbour in the next.
+        self.signal = self.allocate("signal", (size, 2, FACES), np.float32)
+
+        # Whether each cell type calculates its water flow this tick, and
+        # the scales applied, refreshed by start_tick
+        self.flowing = np.array([False, False, True, True])
+        self.flow_scale = [1, 1, 1, 1]
+        self.sunlight_due = True
+        self.sunlight_scale = 1
+        self.reproduction_due = True
+
+        # Plant objects keyed by flat index
+        self.plants = {}
+
+        # Flat index and species name of each seed the world started with
+        self.seed_cells = []
+
+    def allocate(self, name, shape, dtype=np.float64, value=0):
+        """
+        Create one of the arrays holding the state of the cells
+
+        Args:
+            name of the attribute the array is stored in
+            shape of the array
+            dtype of the array
+            value to fill it with
+
+        Returns:
+            The new array
+        """
+        if value == 0:
+            return np.zeros(shape, dtype=dtype)
+        return np.full(shape, value, dtype=dtype)
+
+    def chunks(self):
+        """
+        Returns the ranges of cells the phases of a tick are applied to
+
+        Each phase is applied to the chunks in turn, in index order, which
+        gives the same result as applying it to every cell at once. An
+        ArrayGrid holds everything in memory so has a single chunk covering
+        all of its rows; see MappedGrid for a world that doesn't.
+
+        Returns:
+            List of slices of the arrays
+        """
+        return [slice(0, self.size)]
+
+    def chunk_neighbours(self, cells):
+        """
+        Returns the neighbours of a range of cells
+
+        Args:
+            cells slice of the arrays
+
+        Returns:
+            (N, 6) array of the flat indices of the neighbours of each cell
+        """
+        return self.neighbours[cells]
+
+    @classmethod
+    def from_grid(cls, grid):
+        """
+        Create an array grid from an object model grid
+
+        The Plant objects are copied, so the two grids can be stepped
+        independently.
+
+        Args:
+            grid a populated Grid
+
+        Returns:
+            ArrayGrid holding the same state as the grid
+        """
+        arrays = cls(grid.width, grid.depth, grid.height, grid.periodic)
+        arrays.seed_cells = list(grid.seed_cells)
+        arrays.schedule = grid.schedule
+        arrays.ticks = grid.ticks
+        if grid.lighting is not None:
+            arrays.set_sun(grid.lighting.sun)
+        if grid.weather is not None:
+            arrays.set_climate(grid.weather.climate)
+
+        # Gather each column in one go, see set_cell
+        cells = grid.cells
+        arrays.cell_type[:] = [cell.cell_type.value for cell in cells]
+        arrays.wsat[:] = [cell.wsat for cell in cells]
+        arrays.permeability[:] = [cell.permeability for cell in cells]
+        arrays.water[:] = [cell.water for cell in cells]
+        arrays.energy[:] = [cell.energy for cell in cells]
+        arrays.water_pressure_external[:] = [cell.water_pressure_external for cell in cells]
+        arrays.pressure_gradient[:] = [cell.pressure_gradient for cell in cells]
+        arrays.flux[:] = [cell.flux for cell in cells]
+        arrays.energy_outgoing[:] = [cell.energy_outgoing for cell in cells]
+        arrays.colours[:] = [cell.colour[:4] for cell in cells]
+        arrays.plants = {
+            index: copy.deepcopy(cell)
+            for index, cell in enumerate(cells)
+            if cell.cell_type == CellType.PLANT
+        }
+        # Signals posted last tick are read from the buffer for the ticks
+        # before this one
+        previous = (grid.ticks + 1) % 2
+        for index, plant in arrays.plants.items():
+            if plant.signals:
+                arrays.signal[index, previous] = [getattr(state, "signal", 0.0) for state in plant.outgoing]
+        for index, direction in enumerate(grid.reproduce):
+            arrays.reproduce[index] = -1 if direction in (None, False) else direction
+        arrays.winners = np.flatnonzero(arrays.reproduce >= 0)
+        return arrays
+
+    # Arrays saved in a checkpoint, see checkpoint(). The first are saved
+    # for every cell, the rest only for Soil and Plant cells.
+    CELL_ARRAYS = (
+        "cell_type",
+        "energy",
+        "reproduce",
+    )
+    WET_ARRAYS = (
+        "wsat",
+        "permeability",
+        "water",
+        "water_pressure_external",
+        "pressure_gradient",
+        "flux",
+        "energy_outgoing",
+        "colours",
+        "signal",
+    )
+    CHECKPOINT_ARRAYS = CELL_ARRAYS + WET_ARRAYS
+
+    # Arrays copied from the parent when a cell reproduces, see
+    # apply_reproduce()
+    REPRODUCED_ARRAYS = (
+        "cell_type",
+        "wsat",
+        "permeability",
+        "water_pressure_external",
+        "pressure_gradient",
+        "flux",
+        "energy_outgoing",
+        "colours",
+        "signal",
+    )
+
+    def checkpoint(self):
+        """
+        Returns the state of the world for saving in a checkpoint
+
+        Everything needed to carry on exactly where the world left off is
+        included. Values that are worked out afresh each tick, such as the
+        neighbour types, are not. Air and Rock cells only change their
+        energy, so the rest of their state isn't saved.
+
+        Returns:
+            Tuple of a dictionary of metadata and a dictionary of arrays
+        """
+        meta = {
+            "width": self.width,
+            "depth": self.depth,
+            "height": self.height,
+            "periodic": self.periodic,
+            "ticks": self.ticks,
+            "schedule": self.schedule.periods,
+            "seed_cells": [list(seed) for seed in self.seed_cells],
+            "sun": self.lighting.sun.settings if self.lighting is not None else None,
+            "climate": self.weather.climate.settings if self.weather is not None else None,
+        }
+        arrays = {name: getattr(self, name) for name in self.CELL_ARRAYS}
+        wet = np.flatnonzero((self.cell_type == SOIL) | (self.cell_type == PLANT))
+        arrays["wet"] = wet
+        for name in self.WET_ARRAYS:
+            arrays[name] = getattr(self, name)[wet]
+        # Save the plants' outgoing messages in step with the signals they
+        # posted, for a Grid loading the checkpoint. The running plants are
+        # left as they are.
+        previous = (self.ticks + 1) % 2
+        plants = dict(self.plants)
+        for index, plant in plants.items():
+            if plant.signals:
+                plants[index] = copy.copy(plant)
+                plants[index].outgoing = [posted(signal) for signal in self.signal[index, previous].tolist()]
+        arrays["plants"] = save_plants(sorted(plants.items()))
+        return meta, arrays
+
+    @classmethod
+    def from_checkpoint(cls, meta, arrays):
+        """
+        Create an array grid from the state returned by checkpoint()
+
+        Args:
+            meta dictionary of metadata
+            arrays dictionary of arrays
+
+        Returns:
+            ArrayGrid holding the saved state
+        """
+        grid = cls(meta["width"], meta["depth"], meta["height"], meta["periodic"])
+        grid.ticks = meta["ticks"]
+        grid.schedule = Schedule(**meta["schedule"])
+        grid.seed_cells = [tuple(seed) for seed in meta["seed_cells"]]
+        if meta.get("sun"):
+            grid.set_sun(Sun(**meta["sun"]))
+        if meta.get("climate"):
+            grid.set_climate(Climate(**meta["climate"]))
+        for name in cls.CELL_ARRAYS:
+            getattr(grid, name)[:] = arrays[name]
+        # A new grid already holds the fixed state of Air, apart from the
+        # pressure on its faces. Rock only differs from Air in its colour.
+        grid.water_pressure_external[:] = Air.water_pressure_external
+        grid.colours[grid.cell_type == ROCK] = Rock.colour
+        wet = arrays["wet"]
+        for name in cls.WET_ARRAYS:
+            getattr(grid, name)[wet] = arrays[name]
+        grid.plants = load_plants(arrays["plants"])
+        return grid
+
+    def save_checkpoint(self, filename):
+        """
+        Save the state of the world to a file
+
+        Args:
+            filename file to write
+        """
+        meta, arrays = self.checkpoint()
+        meta["backend"] = "arrays"
+        write_checkpoint(filename, meta, arrays)
+
+    @classmethod
+    def load_checkpoint(cls, filename):
+        """
+        Create an array grid from a checkpoint file
+
+        Checkpoints saved by either backend can be loaded.
+
+        Args:
+            filename file to read
+
+        Returns:
+            ArrayGrid holding the saved state
+        """
+        return cls.from_checkpoint(*read_checkpoint(filename))
+
+    # Arrays set from the Cell objects by fill(), with the attribute each is
+    # copied from
+    FILLED_ARRAYS = (
+        ("wsat", "wsat"),
+        ("permeability", "permeability"),
+        ("water", "water"),
+        ("energy", "energy"),
+        ("water_pressure_external", "water_pressure_external"),
+        ("pressure_gradient", "pressure_gradient"),
+        ("flux", "flux"),
+        ("energy_outgoing", "energy_outgoing"),
+    )
+
+    def fill(self, cells, kinds, prototypes):
+        """
+        Copy the state of Cell objects into a range of new cells
+
+        Each array is filled by indexing a small table of the prototypes'
+        values, see set_cell, rather than by masking once per prototype.
+        The cells must still hold the values they were allocated with, as
+        arrays that are zero for every prototype are left alone. So the
+        files of a MappedGrid stay sparse.
+
+        Args:
+            cells slice of the arrays
+            kinds array with a value for each cell of the slice, picking the
+                prototype it's copied from
+            prototypes list of Cell objects
+        """
+        self.cell_type[cells] = np.array([cell.cell_type.value for cell in prototypes], dtype=np.int8)[kinds]
+        for name, attribute in self.FILLED_ARRAYS:
+            array = getattr(self, name)
+            table = np.array([getattr(cell, attribute) for cell in prototypes], dtype=array.dtype)
+            if table.any():
+                array[cells] = table[kinds]
+        self.colours[cells] = np.array([cell.colour[:4] for cell in prototypes])[kinds]
+
+    def populate(self):
+        """
+        Populate a new world with the same terrain and seeds as Grid.populate
+
+        The terrain is laid out a chunk at a time as array operations, see
+        terrain(), so no Cell objects are made apart from the seeds, and a
+        MappedGrid never has to fit in memory. Given the same random seed,
+        the result is the same as populating a Grid of the same size and
+        converting it.
+        """
+        self.ticks = 0
+        self.plants = {}
+        depth, height = self.depth, self.height
+        plane = depth * height
+        ghost = self.topology.ghost
+
+        # A cell of each type, indexed by CellType value
+        prototypes = [None] * (max(AIR, ROCK, SOIL) + 1)
+        prototypes[AIR], prototypes[ROCK], prototypes[SOIL] = Air(), Rock(), Soil()
+
+        # Lay out the terrain, counting the soil in each chunk so that the
+        # seeds can be found without a list of every fertile cell
+        fertile = []
+        highest = (0, 0)
+        for cells in self.chunks():
+            # Leave out the ghost cell at the end of the arrays
+            cells = slice(cells.start, min(cells.stop, ghost))
+            rock, soil = terrain(cells.start // plane, cells.stop // plane, depth, height,
+                self.peak_x, self.peak_y, self.spread)
+            rock = rock.ravel()
+            soil = soil.ravel()
+            self.fill(cells, np.where(rock, ROCK, np.where(soil, SOIL, AIR)), prototypes)
+
+            # The first of the highest soil cells gets the spring
+            fertile.append(int(np.count_nonzero(soil)))
+            if fertile[-1]:
+                soil = np.flatnonzero(soil)
+                top = soil % height
+                best = int(np.argmax(top))
+                if top[best] > highest[1]:
+                    highest = (cells.start + int(soil[best]), int(top[best]))
+        self.fill(slice(ghost, ghost + 1), np.array([AIR]), prototypes)
+
+        self.water[highest[0]] = self.spring
+
+        # Place seeds on the map, taking each species in turn
+        counts = np.cumsum(fertile)
+        chunks = self.chunks()
+        self.seed_cells = []
+        for seed in range(self.seeds):
+            species = self.species[seed % len(self.species)]
+            plant_seed = random.randint(0, int(counts[-1])) % int(counts[-1])
+            chunk = int(np.searchsorted(counts, plant_seed, side="right"))
+            cells = chunks[chunk]
+            offset = plant_seed - (int(counts[chunk - 1]) if chunk else 0)
+            # Seeds are only planted in soil, so the cells that started out
+            # as soil are those that are now Soil or Plant
+            soil = np.flatnonzero(np.isin(self.cell_type[cells], (SOIL, PLANT)))
+            index = cells.start + int(soil[offset])
+            # The topsoil of the seed's column
+            column = index - index % height
+            index = column + int(topsoil(np.isin(self.cell_type[column:column + height], (SOIL, PLANT))))
+            self.set_cell(index, species())
+            self.seed_cells.append((index, class_name(species)))
+
+        # Set rock to have "infinite" water pressure on the faces of the
+        # cells next to it
+        for cells in chunks:
+            table = self.chunk_neighbours(cells)
+            cell_type = self.cell_type[cells]
+            wet = (cell_type == SOIL) | (cell_type == PLANT)
+            water_pressure_external = self.water_pressure_external[cells]
+            for direction in range(FACES):
+                faces = wet & (self.cell_type[table[:, direction]] == ROCK)
+                water_pressure_external[faces, direction] = 10000.0
+
+    def index(self, x, y, z):
+        """
+        Returns the flat index of a cell
+
+        See Topology.index.
+
+        Args:
+            x, y, z: the co-ordinate of the cell
+
+        Returns:
+            Flat index of the cell in the arrays
+        """
+        return self.topology.index(x, y, z)
+
+    def set_cell(self, index, cell):
+        """
+        Copy the state of a Cell object into the arrays
+
+        Args:
+            index flat index of the cell to write
+            cell the Cell object to copy from
+        """
+        self.cell_type[index] = cell.cell_type.value
+        self.wsat[index] = cell.wsat
+        self.permeability[index] = cell.permeability
+        self.water[index] = cell.water
+        self.energy[index] = cell.energy
+        self.water_pressure_external[index] = cell.water_pressure_external
+        self.pressure_gradient[index] = cell.pressure_gradient
+        self.flux[index] = cell.flux
+        self.energy_outgoing[index] = cell.energy_outgoing
+        self.colours[index] = cell.colour[:4]
+        if cell.cell_type == CellType.PLANT:
+            self.plants[index] = cell
+        else:
+            self.plants.pop(index, None)
+        if self.lighting is not None:
+            self.lighting.changed(index)
+        if self.weather is not None:
+            self.weather.changed(index)
+
+    def cell(self, x, y, z):
+        """
+        Returns a Cell object holding the state of a cell
+
+        Unlike Grid.cell the object returned is a copy: changing it has no
+        effect on the grid. Plant cells return their Plant object with its
+        state brought up to date. See Topology.index for how co-ordinates
+        outside the grid are treated.
+
+        Args:
+            x, y, z: the co-ordinate of the cell
+
+        Returns:
+            Cell data structure
+        """
+        index = self.index(x, y, z)
+        cell_type = self.cell_type[index]
+        if cell_type == PLANT:
+            cell = self.plants[index]
+        elif cell_type == SOIL:
+            cell = Soil()
+        elif cell_type == ROCK:
+            cell = Rock()
+        else:
+            cell = Air()
+        cell.energy = float(self.energy[index])
+        if cell.static:
+            # The rest of the state is held by the class
+            return cell
+        cell.water = float(self.water[index])
+        cell.water_pressure_external = array("d", self.water_pressure_external[index])
+        cell.flux = array("d", self.flux[index])
+        neighbours = self.chunk_neighbours(slice(index, index + 1))[0]
+        cell.neighbour_type = [TYPES[value] for value in self.cell_type[neighbours]]
+        cell.colour = tuple(self.colours[index])
+        if cell_type == PLANT:
+            cell.pressure_gradient = array("d", self.pressure_gradient[index])
+            cell.energy_outgoing = array("d", self.energy_outgoing[index])
+        return cell
+
+    def species_at(self, index):
+        """
+        Returns the import path of the plant species occupying a cell
+
+        Args:
+            index flat index of the cell
+
+        Returns:
+            Import path of the species, or None if the cell isn't a Plant
+        """
+        plant = self.plants.get(index)
+        if plant is None:
+            return None
+        return class_name(type(plant))
+
+    def statistics(self):
+        """
+        Summarise the current state of the world
+
+        See Grid.statistics.
+
+        Returns:
+            Dictionary of cell counts and resource totals, overall and for
+            each plant species
+        """
+        size = self.topology.size
+        cell_type = self.cell_type[:size]
+        counts = {
+            name: int(np.count_nonzero(cell_type == value))
+            for value, name in enumerate(CELL_TYPE_NAMES)
+        }
+        species = {}
+        for index in sorted(self.plants):
+            plant = self.plants[index]
+            totals = species.setdefault(class_name(type(plant)), {"cells": 0, "water": 0.0, "energy": 0.0})
+            totals["cells"] += 1
+            totals["water"] += float(self.water[index])
+            totals["energy"] += float(self.energy[index])
+        return {
+            "cells": counts,
+            "water": math.fsum(self.water[:size].tolist()),
+            "species": species,
+        }
+
+    def run(self, ticks):
+        """
+        Run the world without rendering
+
+        Args:
+            ticks number of updates to perform
+
+        Returns:
+            Time taken in seconds
+        """
+        start = perf_counter()
+        for _ in range(ticks):
+            self.update()
+        return perf_counter() - start
+
+    def update_water(self, cells=slice(None)):
+        """
+        Calculate the preliminary flux across every face of a range of cells
+
+        Applies Cell.update_water to the Soil cells and Plant.update_water to
+        the Plant cells, followed by Plant.update_sunlight. Cell types that
+        aren't due to be updated this tick are skipped (see Schedule).
+
+        Args:
+            cells slice of the arrays to update
+        """
+        if self.flowing[SOIL]:
+            self.update_soil_water(self.flow_scale[SOIL], cells)
+        if self.flowing[PLANT]:
+            self.update_plant_water(self.flow_scale[PLANT], cells)
+
+        # Sunlight, in the same order as Plant.update_sunlight
+        if self.sunlight_due:
+            neighbour_type = self.neighbour_type[cells]
+            energy = self.energy[cells]
+            plant = self.cell_type[cells] == PLANT
+            lighting = self.lighting
+            start = cells.indices(len(self.cell_type))[0]
+            for direction in range(FACES):
+                lit = plant & (neighbour_type[:, direction] == AIR)
+                if lighting is None:
+                    energy[lit] += (8 if direction == ABOVE else 1) * self.sunlight_scale
+                elif direction == ABOVE:
+                    energy[lit] += lighting.light(np.flatnonzero(lit) + start) * self.sunlight_scale
+                else:
+                    energy[lit] += lighting.side_light() * self.sunlight_scale
+
+    def update_soil_water(self, scale, cells=slice(None)):
+        """
+        Calculate the preliminary flux of the Soil cells
+
+        Args:
+            scale multiplier for the flux, the number of ticks since the
+                last update
+            cells slice of the arrays to update
+        """
+        soil = self.cell_type[cells] == SOIL
+        w = self.water[cells][soil]
+        permeability = self.permeability[cells][soil]
+        pressure = np.where(
+            w < self.wsat[cells][soil],
+            UNSATURATED_PRESSURE_GRADIENT * w,
+            SATURATED_PRESSURE_GRADIENT * w,
+        )
+        flux = (pressure[:, None] - self.water_pressure_external[cells][soil]) * permeability[:, None]
+        flux[:, BELOW] += w * permeability
+        if scale != 1:
+            flux *= scale
+        self.flux[cells][soil] = flux
+
+    def update_plant_water(self, scale, cells=slice(None)):
+        """
+        Calculate the preliminary flux of the Plant cells
+
+        The pumping forces applied since the last update are averaged.
+
+        Args:
+            scale multiplier for the flux, the number of ticks since the
+                last update
+            cells slice of the arrays to update
+        """
+        plant = self.cell_type[cells] == PLANT
+        w = self.water[cells][plant]
+        wsat = self.wsat[cells][plant]
+        permeability = self.permeability[cells][plant]
+        pressure = np.where(
+            w < wsat,
+            PRESSURE_UNSATURATED,
+            PRESSURE_SATURATED + ((w - wsat) * PLANT_SATURATED_PRESSURE_GRADIENT),
+        )
+        pressure_gradient = self.pressure_gradient[cells][plant]
+        if scale != 1:
+            pressure_gradient = pressure_gradient / scale
+        flux = (
+            pressure[:, None]
+            + pressure_gradient
+            - self.water_pressure_external[cells][plant]
+        ) * permeability[:, None]
+        flux[:, BELOW] += w * permeability
+        if scale != 1:
+            flux *= scale
+        self.flux[cells][plant] = flux
+        self.pressure_gradient[cells][plant] = 0.0
+
+    def update_cells(self):
+        """
+        The main Cell update cycle
+
+        Soil colours are calculated directly. Species with a batched program
+        are updated for all of their cells in the chunk at once, see
+        update_batch(). For the rest, each Plant object is loaded with its
+        cell's state, updated and its actions copied back to the arrays.
+        With a sandbox every species is updated a batch at a time by its
+        bot. The cells that try to reproduce are noted for fight().
+        """
+        sandbox = self.sandbox is not None
+        plants = self.plants
+        halo = self.halo
+        order = sorted(plants)
+        rock = (0.8, 0.3, 0.0, 0.8)
+        water = (0.075, 0.416, 0.636, 0.8)
+        for cells in self.chunks():
+            soil = self.cell_type[cells] == SOIL
+            scale = np.minimum(self.water[cells][soil] / 16.0, 1.0) / 1.0
+            colours = np.empty((len(scale), 4))
+            for channel in range(3):
+                colours[:, channel] = (water[channel] * scale) + (rock[channel] * (1 - scale))
+            colours[:, 3] = np.where(scale > 0.2, np.minimum(scale, 0.8), 0.2)
+            self.colours[cells][soil] = colours
+
+            first = bisect_left(order, cells.start)
+            last = bisect_left(order, cells.stop)
+            species = {}
+            single = []
+            for index in order[first:last]:
+                kind = type(plants[index])
+                if sandbox or batched(kind):
+                    species.setdefault(kind, []).append(index)
+                else:
+                    single.append(index)
+            table = None
+            for kind, indices in species.items():
+                indices = np.array(indices)
+                neighbours = None
+                if kind.signals or sandbox:
+                    if table is None:
+                        table = self.chunk_neighbours(cells)
+                    neighbours = table[indices - cells.start]
+                self.update_batch(kind, indices, neighbours)
+            if not single:
+                continue
+
+            if table is None:
+                table = self.chunk_neighbours(cells)
+            sources = []
+            directions = []
+            for index in single:
+                plant = plants[index]
+                neighbours = table[index - cells.start]
+                plant.water = float(self.water[index])
+                plant.energy = float(self.energy[index])
+                plant.neighbour_type = [TYPES[value] for value in self.neighbour_type[index]]
+                plant.incoming = [
+                    plants[neighbour].outgoing[REVERSE[direction]] if neighbour in plants
+                    else halo[neighbour][REVERSE[direction]] if neighbour in halo
+                    else EMPTY_STATE
+                    for direction, neighbour in enumerate(neighbours.tolist())
+                ]
+                plant.pressure_gradient = self.pressure_gradient[index].tolist()
+                plant.energy_outgoing = [0] * FACES
+                plant.reproduce = [False] * FACES
+
+                plant.update()
+
+                self.energy[index] = plant.energy
+                self.pressure_gradient[index] = plant.pressure_gradient
+                self.energy_outgoing[index] = plant.energy_outgoing
+                self.colours[index] = plant.colour[:4]
+                for direction, flag in enumerate(plant.reproduce):
+                    if flag:
+                        sources.append(index)
+                        directions.append(direction)
+            if sources:
+                self.attempts.append((np.array(sources, dtype=np.intp), np.array(directions, dtype=np.int8)))
+
+    def update_batch(self, species, indices, neighbours=None):
+        """
+        Update cells of one species together using its batched program
+
+        The cells are gathered into a CellBatch, passed to the species'
+        update_batch(), or to its bot if there's a sandbox, and its actions
+        copied back to the arrays. The Plant objects themselves aren't loaded
+        or updated.
+
+        Args:
+            species the Plant subclass
+            indices array of the flat indices of its cells
+            neighbours (N, 6) array of the neighbours of the cells, needed if
+                the species reads signals or there's a sandbox
+        """
+        cells = CellBatch(indices, self.water[indices], self.energy[indices], self.neighbour_type[indices],
+            self.pressure_gradient[indices], self.colours[indices], self.permeability[indices],
+            self.water_pressure_external[indices])
+        current = self.ticks % 2
+        if species.signals or self.sandbox is not None:
+            cells.signal = self.signal[neighbours, 1 - current, REVERSE].astype(np.float64)
+        if self.sandbox is not None:
+            self.sandbox.update(species, cells)
+        else:
+            species.update_batch(cells)
+        self.energy[indices] = cells.energy
+        self.pressure_gradient[indices] = cells.pressure_gradient
+        self.energy_outgoing[indices] = cells.energy_outgoing
+        self.colours[indices] = cells.colours
+        rows, directions = np.nonzero(cells.reproduce)
+        if len(rows):
+            self.attempts.append((indices[rows], directions.astype(np.int8)))
+        self.permeability[indices] = cells.permeability
+        if species.signals:
+            self.signal[indices, current] = cells.signal_out
+        if self.profiler is not None and cells.instructions:
+            self.profiler.count("instructions", cells.instructions)
+
+    def apply_pressure(self):
+        """
+        Update the external pressure values of the Soil and Plant cells
+
+        Faces bordering a cell that wasn't updated this tick keep their last
+        pressure, and the flux of a neighbour is scaled back down to a single
+        tick's worth, see Grid.apply_pressure.
+        """
+        flow_scale = np.array(self.flow_scale, dtype=np.float64)
+        for cells in self.chunks():
+            cell_type = self.cell_type[cells]
+            wet = (cell_type == SOIL) | (cell_type == PLANT)
+            neighbour_type = self.neighbour_type[cells][wet]
+            neighbours = self.chunk_neighbours(cells)[wet]
+            neighbour_wet = (neighbour_type == SOIL) | (neighbour_type == PLANT)
+            water_pressure_external = self.water_pressure_external[cells]
+            incoming = np.where(self.flowing[neighbour_type],
+                self.flux[neighbours, REVERSE] / flow_scale[neighbour_type], water_pressure_external[wet])
+            water_pressure_external[wet] = np.where(neighbour_wet, incoming, 9999.0)
+
+    def update_flux(self):
+        """
+        Apply the flux constraints to the Soil and Plant cells
+        """
+        for cells in self.chunks():
+            cell_type = self.cell_type[cells]
+            wet = (cell_type == SOIL) | (cell_type == PLANT)
+            flux = self.flux[cells]
+            water = self.water[cells]
+            flux[wet], water[wet] = limit_flux(flux[wet], water[wet], self.profiler)
+
+    def apply_resources(self):
+        """
+        Move the water and energy across every face
+        """
+        self.move_resources()
+        # Only once every chunk has taken its share
+        self.clear("energy_outgoing", 0)
+
+    def move_resources(self):
+        """
+        Add the water and energy arriving across each face to every cell
+        """
+        for cells in self.chunks():
+            table = self.chunk_neighbours(cells)
+            water_incoming = np.zeros(len(table))
+            energy_incoming = np.zeros(len(table))
+            for direction in range(FACES):
+                neighbours = table[:, direction]
+                water_incoming += self.flux[neighbours, REVERSE[direction]]
+                energy_incoming += self.energy_outgoing[neighbours, REVERSE[direction]]
+
+            cell_type = self.cell_type[cells]
+            wet = (cell_type == SOIL) | (cell_type == PLANT)
+            water = self.water[cells]
+            water[wet] += water_incoming[wet]
+            self.energy[cells] += energy_incoming
+            for water in water_incoming[~wet & (water_incoming > 0)].tolist():
+                print("ERROR: {}".format(water))
+
+    def apply_flux_reset(self):
+        """
+        Reset the flux of every cell
+        """
+        self.clear("flux", 0)
+
+    def clear(self, name, value):
+        """
+        Reset one of the arrays for every cell
+
+        Args:
+            name of the array
+            value to fill it with
+        """
+        array = getattr(self, name)
+        for cells in self.chunks():
+            array[cells] = value
+
+    def neighbours_of(self, indices, directions):
+        """
+        Returns the neighbour of each of some cells across one of its faces
+
+        Args:
+            indices array of flat indices of the cells
+            directions array of the Direction value of the face of each cell
+
+        Returns:
+            Array of flat indices of the neighbours
+        """
+        if self.neighbours is not None:
+            return self.neighbours[indices, directions]
+        return neighbours_of(self.width, self.depth, self.height, self.periodic, indices, directions)
+
+    def take_attempts(self):
+        """
+        Returns the reproduction attempts made during the update, which are
+        then forgotten
+
+        Returns:
+            Tuple of arrays of the flat indices of the cells that tried to
+            reproduce and the direction of each attempt
+        """
+        attempts, self.attempts = self.attempts, []
+        if not attempts:
+            return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.int8)
+        return (
+            np.concatenate([sources for sources, _ in attempts]),
+            np.concatenate([directions for _, directions in attempts]),
+        )
+
+    def fight(self):
+        """
+        Decide the result of every Plant cell's reproduction action
+
+        See Grid.fight for the rules. Ties are resolved in the same way.
+        """
+        self.find_winners(*self.take_attempts())
+
+    def find_winners(self, sources, directions):
+        """
+        Set the direction each cell will be reproduced from, if any
+
+        Each attempt gives a record of the cell fought over, the direction
+        of the attempt seen from that cell and the energy of the plant making
+        it. Sorting the records by cell, then by falling energy, then by
+        direction puts the winner of each fight first, so every fight is
+        decided in one pass over the attempts, whatever the size of the
+        world.
+
+        Args:
+            sources array of the flat indices of the cells that tried to
+                reproduce
+            directions array of the direction of each attempt
+        """
+        targets = self.neighbours_of(sources, directions)
+        inside = targets != self.topology.ghost
+        sources = sources[inside]
+        targets = targets[inside]
+        facing = np.take(REVERSE, directions[inside]).astype(np.int8)
+        energy = self.energy[sources]
+        order = np.lexsort((facing, -energy, targets))
+        targets = targets[order]
+        facing = facing[order]
+        energy = energy[order]
+        first = np.ones(len(targets), dtype=bool)
+        first[1:] = targets[1:] != targets[:-1]
+        wins = first & (energy > self.energy[targets]) & (facing != 0)
+        self.winners = targets[wins]
+        self.reproduce[self.winners] = facing[wins]
+
+    def apply_fights(self):
+        """
+        Allow cells to try to reproduce, if reproduction is due this tick
+        """
+        if self.reproduction_due:
+            self.fight()
+        else:
+            self.take_attempts()
+
+    def apply_reproductions(self):
+        """
+        Reproduce successful cells, if reproduction is due this tick
+        """
+        if self.reproduction_due:
+            self.apply_reproduce()
+
+    def apply_reproduce(self):
+        """
+        Reproduce the successful cells
+
+        Children are created in index order, so a child copied from a cell
+        that has itself just been replaced is copied from the new cell, as
+        happens with Grid.apply_reproduce.
+        """
+        targets, self.winners = self.winners, np.empty(0, dtype=np.intp)
+        if not len(targets):
+            return
+        if self.profiler is not None:
+            self.profiler.count("reproductions", len(targets))
+        sources = self.neighbours_of(targets, self.reproduce[targets])
+        for index, source in zip(targets.tolist(), sources.tolist()):
+            self.cell_type[index] = self.cell_type[source]
+            self.wsat[index] = self.wsat[source]
+            self.permeability[index] = self.permeability[source]
+            self.water_pressure_external[index] = self.water_pressure_external[source]
+            self.pressure_gradient[index] = self.pressure_gradient[source]
+            self.flux[index] = self.flux[source]
+            self.energy_outgoing[index] = self.energy_outgoing[source]
+            self.colours[index] = self.colours[source]
+            self.signal[index] = self.signal[source]
+            self.plants[index] = self.plants[source].spawn()
+            self.water[index] = 0
+            self.energy[index] = 0
+        if self.lighting is not None:
+            self.lighting.changed(targets)
+        if self.weather is not None:
+            self.weather.changed(targets)
+        self.reproduce[targets] = -1
+
+    def start_tick(self):
+        """
+        Work out which subsystems are updated this tick
+
+        See Schedule.
+        """
+        schedule = self.schedule
+        self.flowing = np.array([False, False, schedule.due("water", self.ticks), schedule.due("pumping", self.ticks)])
+        self.flow_scale = [1, 1, schedule.period("water"), schedule.period("pumping")]
+        self.sunlight_due = schedule.due("sunlight", self.ticks)
+        self.sunlight_scale = schedule.period("sunlight")
+        self.reproduction_due = schedule.due("reproduction", self.ticks)
+        if self.sunlight_due and self.lighting is not None:
+            self.lighting.update(self.ticks, self.cell_type)
+
+    def set_sun(self, sun):
+        """
+        Light the world with a sun that casts shadows and moves over the day
+
+        Args:
+            sun Sun to use, or None to light every Plant face touching Air
+                evenly, as when the world is created
+        """
+        self.lighting = None if sun is None else Lighting(self.width, self.depth, self.height, self.periodic, sun)
+
+    def set_climate(self, climate):
+        """
+        Let it rain on the world and the water evaporate from its surface
+
+        Args:
+            climate Climate to use, or None for no weather, as when the
+                world is created
+        """
+        self.weather = None if climate is None else Weather(self.width, self.depth, self.height, self.periodic,
+            climate)
+
+    def apply_weather(self):
+        """
+        Apply the rain and evaporation due this tick to the surface cells
+
+        See Grid.apply_weather.
+        """
+        weather = self.weather
+        if weather is None:
+            return
+        wet, rain = weather.rain(self.ticks, self.cell_type)
+        if len(wet):
+            self.water[wet] += rain
+        dry, loss = weather.drying(self.ticks, self.cell_type)
+        if len(dry):
+            self.water[dry] -= np.clip(self.water[dry], 0.0, loss)
+
+    def finish_tick(self):
+        """
+        Prepare for the next tick
+        """
+        self.apply_weather()
+        if self.recorder is not None:
+            self.record_tick(self.ticks + 1)
+        self.ticks += 1
+
+    def record_tick(self, tick):
+        """
+        Pass the state of every cell to the recorder
+
+        Args:
+            tick number of the tick being recorded
+        """
+        size = self.topology.size
+        self.recorder.record(tick, self.cell_type[:size], self.water[:size], self.energy[:size],
+            self.colours[:size])
+
+    def start_recording(self, recorder):
+        """
+        Record the world as it is now and after every tick that follows
+
+        Args:
+            recorder Recorder to write to
+        """
+        self.recorder = recorder
+        self.record_tick(self.ticks)
+
+    def preupdate(self):
+        """
+        All updates that must happen before the main Cell update
+        """
+        self.start_tick()
+        for cells in self.chunks():
+            self.neighbour_type[cells] = self.cell_type[self.chunk_neighbours(cells)]
+            self.update_water(cells)
+
+    def postupdate_phases(self):
+        """
+        The updates that must happen after the main Cell update
+
+        Returns:
+            List of (name, function) pairs in the order they're applied
+        """
+        return [
+            # Transfer the pressures
+            ("pressure", self.apply_pressure),
+
+            # Apply the flux constraints
+            ("flux", self.update_flux),
+
+            # Move the water and energy
+            ("resources", self.apply_resources),
+
+            # Reset the flux values
+            ("flux_reset", self.apply_flux_reset),
+
+            # Allow cells to try to reproduce
+            ("fight", self.apply_fights),
+
+            # Reproduce successful cells
+            ("reproduce", self.apply_reproductions),
+        ]
+
+    def postupdate(self):
+        """
+        All updates that must happen after the main Cell update
+        """
+        for name, phase in self.postupdate_phases():
+            phase()
+
+    def phases(self):
+        """
+        Every update in a tick, in order
+
+        Calling each function in turn is equivalent to calling update().
+
+        Returns:
+            List of (name, function) pairs
+        """
+        return [
+            ("message_pass", self.preupdate),
+            ("update", self.update_cells),
+        ] + self.postupdate_phases() + [
+            ("finish", self.finish_tick),
+        ]
+
+    def update(self):
+        """
+        The main update calls
+
+        Calls the pre update, then the main update, then the post update cycle.
+
+        If a profiler is attached the phases are run through it instead, so
+        that each can be timed.
+        """
+        if self.profiler is not None:
+            self.profiler.tick(self.phases(), self.topology.size)
+            return
+
+        self.preupdate()
+
+        # Perform the main Cell update cycle
+        self.update_cells()
+
+        self.postupdate()
+
+        self.finish_tick()
@@ -0,0 +1,194 @@
+#!/bin/python3
+# vim: et:ts=4:sts=4:sw=4
+
+# SPDX-License-Identifier: BSD-2-Clause
+# Copyright © 2024 The Alan Turing Institute
+
+# Batched species programs
+
+from functools import lru_cache
+import numpy as np
+
+from src.cells import (
+    State,
+)
+
+@lru_cache(maxsize=None)
+def batched(species):
+    """
+    Returns whether a species can be updated for all of its cells at once
+
+    A species is batched if the class that gives it its update() method
+    also gives it an update_batch() method. A subclass that overrides
+    update() but not update_batch() is updated a cell at a time.
+
+    Args:
+        species the Plant subclass
+
+    Returns:
+        True if update_batch() should be used rather than update()
+    """
+    for cls in species.__mro__:
+        if "update" in vars(cls):
+            return "update_batch" in vars(cls)
+    return False
+
+def face(direction):
+    """
+    Returns the value of a Direction, or the value itself if given an int
+    """
+    return getattr(direction, "value", direction)
+
+def posted(signal):
+    """
+    Returns an outgoing message carrying a signal posted by a batched program
+
+    Args:
+        signal the number posted
+
+    Returns:
+        State with the signal attribute set
+    """
+    state = State()
+    state.signal = signal
+    return state
+
+class CellBatch():
+    """
+    The cells of one species, to be updated together by its program
+
+    A species' update_batch() is passed a CellBatch rather than being called
+    once per cell. It reads the water, energy and neighbour types of every
+    cell as arrays, with one row per cell, and acts on the cells picked out
+    by a boolean mask. The actions do the same as those of Cell, applied to
+    every cell in the mask at once, and are applied in the order they're
+    called, so a program written as a series of masked actions behaves as
+    update() would for each cell.
+
+    The outputs are held in the energy, pressure_gradient, energy_outgoing,
+    reproduce, colours, permeability and signal_out arrays, which the grid
+    copies back afterwards.
+    """
+
+    def __init__(self, indices, water, energy, neighbour_type, pressure_gradient, colours,
+            permeability=None, water_pressure_external=None, signal=None):
+        """
+        Args:
+            indices flat indices of the cells
+            water, energy arrays with a value for each cell
+            neighbour_type (N, 6) array of the type of each neighbour
+            pressure_gradient (N, 6) pumping forces built up so far
+            colours (N, 4) current colours of the cells
+            permeability array of the permeability of each cell
+            water_pressure_external (N, 6) pressure of the water on each face
+            signal (N, 6) signals posted to each cell by its neighbours in the
+                last tick
+        """
+        self.indices = indices
+        self.water = water
+        self.energy = energy
+        self.neighbour_type = neighbour_type
+        self.pressure_gradient = pressure_gradient
+        self.colours = colours
+        self.permeability = permeability
+        self.water_pressure_external = water_pressure_external
+        self.signal = signal
+        self.energy_outgoing = np.zeros(pressure_gradient.shape)
+        self.reproduce = np.zeros(pressure_gradient.shape, dtype=bool)
+        # Signals are held to single precision, as the grid stores them
+        self.signal_out = np.zeros(pressure_gradient.shape, dtype=np.float32)
+        # Instructions run by a Plantlang program, see Program.run
+        self.instructions = 0
+
+    def __len__(self):
+        return len(self.indices)
+
+    def neighbour(self, direction):
+        """
+        Returns the type of each cell's neighbour in a direction
+
+        Args:
+            direction Direction or its value
+
+        Returns:
+            Array of CellType values
+        """
+        return self.neighbour_type[:, face(direction)]
+
+    def set_colour(self, mask, colour):
+        """
+        Set the colour of the cells in a mask
+
+        Args:
+            mask boolean array picking out the cells
+            colour RGBA tuple, or (N, 4) array with a row for each cell in
+                the mask; anything after the fourth channel is ignored
+        """
+        colour = np.asarray(colour, dtype=np.float64)
+        self.colours[mask] = colour[..., :4]
+
+    def action_send_energy(self, mask, energy, direction):
+        """
+        Send energy to a neighbour, as Cell.action_send_energy
+
+        Args:
+            mask boolean array picking out the cells
+            energy amount to send, a number or an array with a value for
+                each cell in the mask
+            direction Direction or its value
+        """
+        have = self.energy[mask]
+        energy = np.minimum(np.broadcast_to(energy, have.shape), have)
+        self.energy_outgoing[mask, face(direction)] += energy
+        self.energy[mask] = have - energy
+
+    def action_reproduce(self, mask, direction):
+        """
+        Try to reproduce into a neighbour, as Cell.action_reproduce
+
+        Args:
+            mask boolean array picking out the cells
+            direction Direction or its value
+        """
+        self.reproduce[mask, face(direction)] = True
+
+    def action_pump(self, mask, direction, force):
+        """
+        Pump water through a face, as Cell.action_pump
+
+        Args:
+            mask boolean array picking out the cells
+            direction Direction or its value
+            force to apply, positive or negative, or an array with a value
+                for each cell in the mask
+        """
+        sign = np.where(np.asarray(force) >= 0, 1, -1)
+        energy = self.energy[mask]
+        energy_required = np.abs(energy * 1.0)
+        force = np.where(energy_required > energy, sign * energy, force)
+        self.pressure_gradient[mask, face(direction)] += force
+        self.energy[mask] = energy - energy_required
+
+    def action_permeability(self, mask, permeability, maximum):
+        """
+        Set how easily water passes through the cells' faces
+
+        Args:
+            mask boolean array picking out the cells
+            permeability a number or an array with a value for each cell in
+                the mask
+            maximum permeability of the species; values are kept between
+                zero and this
+        """
+        self.permeability[mask] = np.clip(permeability, 0.0, maximum)
+
+    def action_signal(self, mask, direction, value):
+        """
+        Post a signal on a face, for the neighbour to read next tick
+
+        Args:
+            mask boolean array picking out the cells
+            direction Direction or its value
+            value a number or an array with a value for each cell in the mask
+        """
+        self.signal_out[mask, face(direction)] = value
@@ -4,7 +4,10 @@
 # SPDX-License-Identifier: BSD-2-Clause
 # Copyright © 2024 The Alan Turing Institute
 
+from array import array
 from enum import Enum
+from functools import lru_cache
+from types import MemberDescriptorType
 
 UNSATURATED_PRESSURE_GRADIENT = 0.5
 SATURATED_PRESSURE_GRADIENT = 1.0
@@ -24,47 +27,157 @@ class CellType(Enum):
     SOIL = 2
     PLANT = 3
 
+# Readable names for the cell types, indexed by CellType value
+CELL_TYPE_NAMES = ("air", "rock", "soil", "plant")
+
 class State():
     state = {}
 
+    def copy(self):
+        """
+        Returns a shallow copy of the state
+        """
+        state = State.__new__(State)
+        state.__dict__.update(self.__dict__)
+        return state
+
+# Shared by every cell that never sends messages or reproduces, so must not
+# be changed
+NO_STATE = State()
+NO_MESSAGES = (NO_STATE,) * len(Direction)
+NO_REPRODUCTION = (False,) * len(Direction)
+ZEROS = (0.0,) * len(Direction)
+
+# Per-face values copied, rather than shared, when a cell spawns
+FACE_VALUES = frozenset((
+    "water_pressure_external",
+    "pressure_gradient",
+    "flux",
+    "energy_outgoing",
+    "neighbour_type",
+))
+
+def face_array(value=0.0):
+    """
+    Returns a new array holding a number for each face of a cell
+
+    Args:
+        value initial value for every face
+
+    Returns:
+        array of doubles
+    """
+    return array("d", (value,) * len(Direction))
+
+@lru_cache(maxsize=None)
+def instance_slots(cls):
+    """
+    Returns the names of the slots a class stores in each instance
+
+    Slots that the class replaces with a class-level constant are left out.
+
+    Args:
+        cls the class
+
+    Returns:
+        Tuple of slot names
+    """
+    return tuple(
+        name
+        for klass in cls.__mro__
+        for name in klass.__dict__.get("__slots__", ())
+        if isinstance(getattr(cls, name, None), MemberDescriptorType)
+    )
+
 class States():
-    state = None
-    incoming = None
-    outgoing = None
-    reproduce = None
+    __slots__ = ("state", "incoming", "outgoing", "reproduce")
 
     def __init__(self):
         self.clear()
 
     def clear(self):
         self.state = State()
-        self.incoming = [State() for _ in range(len(Direction))]
+        # Replaced by the neighbours' outgoing states during the message pass
+        self.incoming = list(NO_MESSAGES)
         self.outgoing = [State() for _ in range(len(Direction))]
         self.reproduce = [False for _ in range(len(Direction))]
 
+    def copy_states(self, other):
+        """
+        Copy the states of another cell into this one
+
+        Args:
+            other cell to copy from
+        """
+        self.state = other.state.copy()
+        self.incoming = list(other.incoming)
+        self.outgoing = [state.copy() for state in other.outgoing]
+        self.reproduce = list(other.reproduce)
+
 class Cell(States):
+    __slots__ = (
+        # Resources
+        "water",
+        "energy",
+        # State
+        "colour",
+        "water_pressure_external",
+        "pressure_gradient",
+        "flux",
+        "energy_outgoing",
+        "neighbour_type",
+    )
     cell_type = CellType.NONE
-    # Resources
-    water = 0
-    energy = 0
-    # State
-    colour = None
+    # Parameters
     wsat = 128.0
     permeability = (1.0/32.0)
-    water_pressure_external = []
-    pressure_gradient = []
-    flux = []
-    energy_outgoing = []
-    neighbour_type = []
+    # Whether the cell sends and receives messages, and whether its state is
+    # fixed, see StaticCell
+    messages = True
+    static = False
+    # Whether the array backends gather the signals posted to the cell by its
+    # neighbours for its batched program, see plantlang
+    signals = False
 
     def __init__(self):
         super().__init__()
-        self.water_pressure_external = [0.0] * len(Direction)
-        self.pressure_gradient = [0.0] * len(Direction)
-        self.flux = [0] * len(Direction)
-        self.energy_outgoing = [0] * len(Direction)
+        self.water = 0
+        self.energy = 0
+        self.colour = None
+        self.water_pressure_external = face_array()
+        self.pressure_gradient = face_array()
+        self.flux = face_array()
+        self.energy_outgoing = face_array()
         self.neighbour_type = [CellType.AIR] * len(Direction)
 
+    def spawn(self):
+        """
+        Returns a new cell grown from this one
+
+        The parent acts as the prototype for the child: the child is of the
+        same class and starts with the same state, but with no water or
+        energy. Only the per-face values and the states are copied, so the
+        cost of a birth doesn't depend on what the parent holds.
+
+        Any other attributes are shared with the parent. A species that keeps
+        mutable state of its own should override spawn() to copy it.
+
+        Returns:
+            The child cell
+        """
+        cls = self.__class__
+        child = cls.__new__(cls)
+        for name in instance_slots(cls):
+            value = getattr(self, name)
+            setattr(child, name, value[:] if name in FACE_VALUES else value)
+        if hasattr(self, "__dict__"):
+            child.__dict__.update(self.__dict__)
+        if self.messages:
+            child.copy_states(self)
+        child.water = 0
+        child.energy = 0
+        return child
+
     def get_neighbour(self, direction):
         return self.neighbour_type[direction]
 
@@ -85,10 +198,10 @@ class Cell(States):
         self.pressure_gradient[direction] += force
         self.energy -= energy_required
 
-    def update_sunlight(self):
+    def update_sunlight(self, scale=1, top=8, side=1):
         pass
 
-    def update_water(self):
+    def update_water(self, scale=1):
         # Calculate the internal water pressure
         if self.water < self.wsat:
             pressure = UNSATURATED_PRESSURE_GRADIENT * self.water
@@ -102,6 +215,10 @@ class Cell(States):
         ]
         water_pressure[Direction.BELOW.value] += self.water * self.permeability
 
+        # Make up for the ticks missed when updated less often
+        if scale != 1:
+            water_pressure = [flux * scale for flux in water_pressure]
+
         for direction in range(len(Direction)):
             self.flux[direction] = (water_pressure[direction])
 
@@ -131,15 +248,42 @@ class Cell(States):
     def update(self):
         pass
 
-class Air(Cell):
+class StaticCell(Cell):
+    """
+    A cell whose state is fixed, apart from its energy
+
+    Air and Rock cells don't hold water, send messages, reproduce or take
+    any notice of their neighbours. So rather than each holding its own
+    copy, their per-face values are constants shared through the class and
+    only their energy is stored in each cell. The grid skips them when
+    passing messages and never writes to the shared values.
+    """
+    __slots__ = ()
+    messages = False
+    static = True
+    water = 0
+    state = NO_STATE
+    incoming = NO_MESSAGES
+    outgoing = NO_MESSAGES
+    reproduce = NO_REPRODUCTION
+    water_pressure_external = (10000.0,) * len(Direction)
+    pressure_gradient = ZEROS
+    flux = ZEROS
+    energy_outgoing = ZEROS
+    neighbour_type = None
+
+    def __init__(self):
+        self.energy = 0
+
+class Air(StaticCell):
+    __slots__ = ()
     cell_type = CellType.AIR
     colour = (0.0, 0.0, 0.0, 0.0)
 
     def __init__(self):
         super().__init__()
-        self.water_pressure_external = [10000.0] * len(Direction)
 
-    def update_water(self):
+    def update_water(self, scale=1):
         pass
 
     def update_flux(self):
@@ -163,12 +307,24 @@ def interpolate(col1, col2, s):
     )
 
 class Soil(Cell):
+    __slots__ = ()
     cell_type = CellType.SOIL
-    colour = (0.8, 0.3, 0.0, 0.0)
+    # Soil doesn't send messages, reproduce or pump, so shares these
+    messages = False
+    state = NO_STATE
+    incoming = NO_MESSAGES
+    outgoing = NO_MESSAGES
+    reproduce = NO_REPRODUCTION
+    pressure_gradient = ZEROS
+    energy_outgoing = ZEROS
 
     def __init__(self):
-        super().__init__()
         self.water = 0
+        self.energy = 0
+        self.colour = (0.8, 0.3, 0.0, 0.0)
+        self.water_pressure_external = face_array()
+        self.flux = face_array()
+        self.neighbour_type = [CellType.AIR] * len(Direction)
 
     def update(self):
         scale = min(self.water / 16.0, 1.0) / 1.0
@@ -177,16 +333,16 @@ class Soil(Cell):
 
         self.colour = interpolate(rock, water, scale)
 
-class Rock(Cell):
+class Rock(StaticCell):
+    __slots__ = ()
     cell_type = CellType.ROCK
     colour = (0.6, 0.6, 0.6, 1.0)
-    energy = 1000
 
     def __init__(self):
         super().__init__()
-        self.water_pressure_external = [10000.0] * len(Direction)
+        self.energy = 1000
 
-    def update_water(self):
+    def update_water(self, scale=1):
         pass
 
     def update_flux(self):
@@ -0,0 +1,162 @@
+#!/bin/python3
+# vim: et:ts=4:sts=4:sw=4
+
+# SPDX-License-Identifier: BSD-2-Clause
+# Copyright © 2024 The Alan Turing Institute
+
+# Checkpoints
+
+import importlib
+import json
+import mmap
+import os
+import pickle
+import struct
+import numpy as np
+
+from src.cells import (
+    State,
+)
+
+MAGIC = b"PWCKPT"
+VERSION = 1
+# Each array starts on a multiple of this many bytes
+ALIGNMENT = 64
+# Magic, version and length of the JSON header
+PREAMBLE = struct.Struct("<6sHQ")
+
+def write_checkpoint(filename, meta, arrays):
+    """
+    Write a checkpoint file
+
+    The file holds a short preamble, a JSON header and then the raw data of
+    each array, aligned so that the arrays can be mapped straight from the
+    file. The header records the metadata along with the dtype, shape and
+    offset of every array.
+
+    The file is written under a temporary name and then renamed, so an
+    existing checkpoint is only replaced once the new one is complete.
+
+    Args:
+        filename file to write
+        meta dictionary of JSON-serialisable values
+        arrays dictionary of NumPy arrays
+    """
+    arrays = {name: np.ascontiguousarray(array) for name, array in arrays.items()}
+    layout = {}
+    offset = 0
+    for name, array in arrays.items():
+        layout[name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+        offset += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+    header = json.dumps({"meta": meta, "arrays": layout}).encode()
+    start = -(-(PREAMBLE.size + len(header)) // ALIGNMENT) * ALIGNMENT
+
+    temporary = filename + ".tmp"
+    with open(temporary, "wb") as output:
+        output.write(PREAMBLE.pack(MAGIC, VERSION, len(header)))
+        output.write(header)
+        for name, array in arrays.items():
+            output.seek(start + layout[name]["offset"])
+            output.write(array.data)
+        output.truncate(start + offset)
+    os.replace(temporary, filename)
+
+def read_checkpoint(filename):
+    """
+    Read a checkpoint file
+
+    The arrays are mapped from the file rather than read, so only the parts
+    that are used are loaded. They're read-only and remain valid for as long
+    as they're referenced.
+
+    Args:
+        filename file to read
+
+    Returns:
+        Tuple of the metadata dictionary and a dictionary of arrays
+    """
+    with open(filename, "rb") as source:
+        data = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, version, length = PREAMBLE.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("Not a checkpoint file: {}".format(filename))
+    if version != VERSION:
+        raise ValueError("Unsupported checkpoint version {}: {}".format(version, filename))
+    header = json.loads(data[PREAMBLE.size:PREAMBLE.size + length])
+    start = -(-(PREAMBLE.size + length) // ALIGNMENT) * ALIGNMENT
+
+    arrays = {}
+    for name, layout in header["arrays"].items():
+        dtype = np.dtype(layout["dtype"])
+        shape = tuple(layout["shape"])
+        count = int(np.prod(shape))
+        arrays[name] = np.frombuffer(data, dtype=dtype, count=count,
+            offset=start + layout["offset"]).reshape(shape)
+    return header["meta"], arrays
+
+def class_name(cls):
+    """
+    Returns the import path of a class, for example "src.plants.Plant"
+    """
+    return "{}.{}".format(cls.__module__, cls.__qualname__)
+
+def find_class(name):
+    """
+    Returns the class with the given import path
+
+    Args:
+        name import path as returned by class_name()
+    """
+    module, _, cls = name.rpartition(".")
+    return getattr(importlib.import_module(module), cls)
+
+def save_plants(plants):
+    """
+    Serialise the Plant objects in a world
+
+    Only what the grid's arrays can't hold is saved: the species, its
+    colour, which carries over from one tick to the next, and any messages
+    or state a species keeps for itself. The water, energy and per-face
+    values are saved with the rest of the cells.
+
+    Args:
+        plants iterable of (index, Plant) pairs
+
+    Returns:
+        Array of bytes holding the plants
+    """
+    records = []
+    for index, plant in plants:
+        records.append((
+            int(index),
+            class_name(type(plant)),
+            plant.state.__dict__,
+            [state.__dict__ for state in plant.outgoing],
+            getattr(plant, "__dict__", {}),
+            plant.colour,
+        ))
+    return np.frombuffer(pickle.dumps(records, protocol=pickle.HIGHEST_PROTOCOL), dtype=np.uint8)
+
+def load_plants(data):
+    """
+    Recreate the Plant objects saved by save_plants
+
+    Args:
+        data array of bytes returned by save_plants
+
+    Returns:
+        Dictionary of Plant objects keyed by flat index
+    """
+    plants = {}
+    for index, name, state, outgoing, extra, colour in pickle.loads(data.tobytes()):
+        plant = find_class(name)()
+        plant.colour = colour
+        plant.state = State()
+        plant.state.__dict__.update(state)
+        for direction, values in enumerate(outgoing):
+            plant.outgoing[direction] = State()
+            plant.outgoing[direction].__dict__.update(values)
+        if extra:
+            plant.__dict__.update(extra)
+        plants[index] = plant
+    return plants
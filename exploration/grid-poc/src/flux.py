@@ -0,0 +1,65 @@
+#!/bin/python3
+# vim: et:ts=4:sts=4:sw=4
+
+# SPDX-License-Identifier: BSD-2-Clause
+# Copyright © 2024 The Alan Turing Institute
+
+# Flux limiter
+
+import numpy as np
+
+def limit_flux(flux, water, profiler=None):
+    """
+    Apply the flux constraints to many cells at once
+
+    This is the batched form of Cell.update_flux. Each cell gives its water
+    to its outgoing preliminary fluxes in order from largest to smallest until
+    the water runs out. The faces of every cell are sorted once, largest
+    first, with ties going to the lowest face as list.index() would pick.
+    The allocation then takes one step per face across all cells together.
+
+    The arithmetic is done in the same order as the scalar loop, so the
+    results are identical to calling Cell.update_flux on each cell.
+
+    Args:
+        flux (N, 6) array of preliminary fluxes
+        water (N,) array of the water in each cell
+        profiler optional Profiler to count the cells and iterations
+
+    Returns:
+        Tuple of the (N, 6) array of constrained fluxes and the (N,) array
+        of water remaining in each cell
+    """
+    flux = np.maximum(flux, 0)
+    water = np.array(water, dtype=float)
+    cells, faces = flux.shape
+    order = np.argsort(-flux, axis=1, kind="stable")
+    ordered = np.take_along_axis(flux, order, axis=1)
+
+    new_flux = np.zeros((cells, faces))
+    total = np.zeros(cells)
+    water_orig = water.copy()
+    active = np.ones(cells, dtype=bool)
+    rows = np.arange(cells)
+    if profiler is not None:
+        profiler.count("flux_cells", cells)
+    for step in range(faces):
+        largest = ordered[:, step]
+        active &= (total < water_orig) & (largest > 0) & (water > 0)
+        if not active.any():
+            break
+        if profiler is not None:
+            profiler.count("flux_iterations", int(np.count_nonzero(active)))
+
+        # Enough water for the whole flux
+        full = active & (water > largest)
+        new_flux[rows[full], order[full, step]] = largest[full]
+        total[full] += largest[full]
+        water[full] -= largest[full]
+
+        # The water runs out part way through this flux
+        partial = active & ~full
+        new_flux[rows[partial], order[partial, step]] = water[partial]
+        total[partial] += water[partial]
+        water[partial] = 0
+    return new_flux, water
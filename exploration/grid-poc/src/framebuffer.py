@@ -0,0 +1,185 @@
+#!/bin/python3
+# vim: et:ts=4:sts=4:sw=4
+
+# SPDX-License-Identifier: BSD-2-Clause
+# Copyright © 2024 The Alan Turing Institute
+
+# Frame buffer
+
+import multiprocessing
+from multiprocessing import shared_memory
+from threading import Lock
+import numpy as np
+
+class FrameBuffer():
+    """
+    Triple-buffered snapshot of the cell colours
+
+    Passes complete frames from the simulation thread to the render thread
+    without either waiting for the other. Three preallocated RGBA arrays
+    take turns as:
+
+        back: the frame the simulation is writing
+        ready: the most recent complete frame
+        front: the frame the renderer is reading
+
+    The simulation fills the back buffer and calls publish(), which swaps
+    it with the ready buffer. The renderer calls latest(), which swaps the
+    ready buffer to the front if a new frame has been published since it
+    last looked. Frames the renderer doesn't get to in time are dropped.
+
+    The lock only covers the swaps themselves, so neither thread holds it
+    for longer than it takes to exchange two references.
+    """
+
+    def __init__(self, cells, channels=4):
+        self.back = np.zeros((cells, channels))
+        self.ready = np.zeros((cells, channels))
+        self.front = np.zeros((cells, channels))
+        self.fresh = False
+        self.frames = 0
+        self.swap_lock = Lock()
+
+    def publish(self, colours=None):
+        """
+        Publish the back buffer as the latest frame
+
+        Called by the simulation thread.
+
+        Args:
+            colours optional array of colours to copy into the back buffer
+                first; otherwise the back buffer must already be filled
+        """
+        if colours is not None:
+            np.copyto(self.back, colours)
+        with self.swap_lock:
+            self.back, self.ready = self.ready, self.back
+            self.fresh = True
+            self.frames += 1
+
+    def latest(self):
+        """
+        Returns the latest complete frame
+
+        Called by the render thread. The array returned isn't touched by
+        the simulation until the next call to latest().
+
+        Returns:
+            The newest frame, or None if nothing has been published since
+            the last call
+        """
+        with self.swap_lock:
+            if not self.fresh:
+                return None
+            self.front, self.ready = self.ready, self.front
+            self.fresh = False
+        return self.front
+
+class SharedFrameBuffer():
+    """
+    Triple-buffered snapshot of the cell colours held in shared memory
+
+    Works in the same way as FrameBuffer, but the buffers live in a
+    multiprocessing.shared_memory block so that frames can be passed from a
+    simulation running in another process. Rather than swapping arrays, the
+    processes swap the indices of the three buffers, which are kept in a
+    small header at the start of the block alongside the fresh flag and the
+    count of published frames.
+
+    The process that creates the buffer owns the block and should call
+    unlink() when it's finished with it. Other processes attach to it by
+    passing the name, and the lock, of the original.
+    """
+    # Header fields, each an int64
+    BACK = 0
+    READY = 1
+    FRONT = 2
+    FRESH = 3
+    FRAMES = 4
+    HEADER = 5
+
+    def __init__(self, cells, channels=4, name=None, lock=None):
+        self.cells = cells
+        self.channels = channels
+        frame = cells * channels
+        size = (self.HEADER + 3 * frame) * 8
+        if name is None:
+            self.memory = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            self.memory = shared_memory.SharedMemory(name=name)
+        self.name = self.memory.name
+        self.lock = lock if lock is not None else multiprocessing.Lock()
+        self.header = np.ndarray((self.HEADER,), dtype=np.int64, buffer=self.memory.buf)
+        self.buffers = np.ndarray((3, cells, channels), dtype=np.float64, buffer=self.memory.buf,
+            offset=self.HEADER * 8)
+        if name is None:
+            self.header[:] = (0, 1, 2, 0, 0)
+            self.buffers[:] = 0.0
+
+    def attach_args(self):
+        """
+        Returns the arguments needed to attach to this buffer from another
+        process, as SharedFrameBuffer(*args)
+        """
+        return (self.cells, self.channels, self.name, self.lock)
+
+    @property
+    def back(self):
+        return self.buffers[self.header[self.BACK]]
+
+    @property
+    def frames(self):
+        return int(self.header[self.FRAMES])
+
+    def publish(self, colours=None):
+        """
+        Publish the back buffer as the latest frame
+
+        See FrameBuffer.publish.
+
+        Args:
+            colours optional array of colours to copy into the back buffer
+                first; otherwise the back buffer must already be filled
+        """
+        if colours is not None:
+            np.copyto(self.back, colours)
+        header = self.header
+        with self.lock:
+            header[self.BACK], header[self.READY] = header[self.READY], header[self.BACK]
+            header[self.FRESH] = 1
+            header[self.FRAMES] += 1
+
+    def latest(self):
+        """
+        Returns the latest complete frame
+
+        See FrameBuffer.latest.
+
+        Returns:
+            The newest frame, or None if nothing has been published since
+            the last call
+        """
+        header = self.header
+        with self.lock:
+            if not header[self.FRESH]:
+                return None
+            header[self.FRONT], header[self.READY] = header[self.READY], header[self.FRONT]
+            header[self.FRESH] = 0
+            front = header[self.FRONT]
+        return self.buffers[front]
+
+    def close(self):
+        """
+        Stop using the shared memory in this process
+        """
+        self.header = None
+        self.buffers = None
+        self.memory.close()
+
+    def unlink(self):
+        """
+        Close and free the shared memory; called by the owner once every
+        process has finished with it
+        """
+        self.close()
+        self.memory.unlink()
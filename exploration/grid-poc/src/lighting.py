@@ -0,0 +1,273 @@
+#!/bin/python3
+# vim: et:ts=4:sts=4:sw=4
+
+# SPDX-License-Identifier: BSD-2-Clause
+# Copyright © 2024 The Alan Turing Institute
+
+# Lighting
+
+import math
+import numpy as np
+
+from src.cells import (
+    CellType,
+)
+
+AIR = CellType.AIR.value
+
+class Sun():
+    """
+    How the sun lights the world over the course of a day
+
+    The sun rises on the +x side of the world, passes overhead at noon and
+    sets on the -x side, then it's night for the second half of the day.
+    Its strength follows its height in the sky. It moves in a fixed number
+    of steps a day, so shadows only have to be worked out afresh when it
+    moves.
+
+    Plant faces touching Air are lit. A top face in direct sunlight gets the
+    full energy; one in shadow, and every side face, gets a fraction of it.
+    """
+
+    def __init__(self, day_length=0, steps=24, full=8.0, side=0.2):
+        """
+        Args:
+            day_length ticks in a day, or 0 for the sun to stay overhead
+            steps positions of the sun over a day
+            full energy gained per tick by a top face in direct sunlight at
+                noon
+            side fraction of the full energy gained by other lit faces
+        """
+        self.day_length = day_length
+        self.steps = steps
+        self.full = full
+        self.side = side
+
+    @property
+    def settings(self):
+        """
+        Returns the arguments that recreate the sun, for saving
+        """
+        return {"day_length": self.day_length, "steps": self.steps, "full": self.full, "side": self.side}
+
+    def step(self, ticks):
+        """
+        Returns the position of the sun at a tick, counting from sunrise
+        """
+        if not self.day_length:
+            return 0
+        return (ticks % self.day_length) * self.steps // self.day_length
+
+    def position(self, step):
+        """
+        Returns where the sun is at a step of the day
+
+        Args:
+            step position of the sun, see step()
+
+        Returns:
+            Tuple of the strength of the sunlight, from 0 to 1, the slope of
+            the sun's rays, in cells up per cell along, or None when the sun
+            is overhead, and the direction along x the sun is in, 1 or -1
+        """
+        if not self.day_length:
+            return 1.0, None, 1
+        angle = 2 * math.pi * (step + 0.5) / self.steps
+        if angle >= math.pi:
+            return 0.0, None, 1
+        elevation = angle if angle <= math.pi / 2 else math.pi - angle
+        return math.sin(angle), math.tan(elevation), 1 if angle < math.pi / 2 else -1
+
+class Lighting():
+    """
+    Works out which top faces are in direct sunlight
+
+    A heightmap holds the top solid cell of each column, and is kept up to
+    date by rescanning only the columns whose cells have changed. From it
+    the shade map gives the lowest cell of each column the sun's rays reach
+    without passing through a taller column. This is worked out afresh when
+    the sun moves, and otherwise only for the rows of columns along x that
+    hold a changed column, so the cost of lighting follows the growth of the
+    plants rather than the size of the world.
+
+    The heightmap treats each column as solid up to its top, so cells under
+    an overhang are in shadow.
+    """
+
+    def __init__(self, width, depth, height, periodic, sun):
+        """
+        Args:
+            width, depth, height dimensions of the world
+            periodic whether the world wraps at its edges
+            sun Sun lighting the world
+        """
+        self.width = width
+        self.depth = depth
+        self.height = height
+        self.periodic = periodic
+        self.sun = sun
+        self.top = None
+        self.shade = None
+        self.dirty = set()
+        self.step = None
+        self.updated = None
+        self.daylight = 1.0
+        self.slope = None
+        self.toward = 1
+        # Counts the changes to the shade map, so copies can be kept in step
+        self.version = 0
+
+    def changed(self, indices):
+        """
+        Note cells whose type has changed
+
+        Args:
+            indices iterable of flat indices
+        """
+        height = self.height
+        self.dirty.update(index // height for index in np.asarray(indices).ravel().tolist())
+
+    def update(self, ticks, cell_type):
+        """
+        Bring the lighting up to date for a tick
+
+        Does nothing if it's already up to date, so the processes sharing a
+        ParallelGrid can each call it.
+
+        Args:
+            ticks number of ticks so far
+            cell_type cell type values of the world, indexed by flat index,
+                which can be read a column at a time
+        """
+        if self.updated == ticks:
+            return
+        self.updated = ticks
+        columns = self.width * self.depth
+        if self.top is None:
+            self.top = np.empty(columns, dtype=np.int16)
+            layer = self.depth * self.height
+            for x in range(self.width):
+                self.top[x * self.depth:(x + 1) * self.depth] = self.heights(
+                    np.asarray(cell_type[x * layer:(x + 1) * layer]).reshape(self.depth, self.height))
+            self.dirty = set()
+            self.step = None
+        rows = set()
+        if self.dirty:
+            dirty = sorted(self.dirty)
+            self.dirty = set()
+            height = self.height
+            for column in dirty:
+                self.top[column] = self.heights(
+                    np.asarray(cell_type[column * height:(column + 1) * height]).reshape(1, height))[0]
+            rows = {column % self.depth for column in dirty}
+
+        step = self.sun.step(ticks)
+        if step != self.step:
+            self.step = step
+            self.daylight, self.slope, self.toward = self.sun.position(step)
+            self.shade = np.empty(columns, dtype=np.int16)
+            self.shade_rows(slice(None))
+            self.version += 1
+        elif rows:
+            self.shade_rows(np.array(sorted(rows)))
+            self.version += 1
+
+    def heights(self, columns):
+        """
+        Returns the top solid cell of each of a block of columns, or -1
+
+        Args:
+            columns (N, height) array of cell type values
+        """
+        solid = columns != AIR
+        return np.where(solid.any(axis=1), self.height - 1 - np.argmax(solid[:, ::-1], axis=1), -1)
+
+    def shade_rows(self, rows):
+        """
+        Work out the shade map for some rows of columns along x
+
+        Args:
+            rows slice or array of y positions
+        """
+        top = self.top.reshape(self.width, self.depth)[:, rows]
+        shade = top.copy()
+        if self.slope is not None:
+            reach = min(self.width - 1, int(self.height / self.slope) + 1)
+            for distance in range(1, reach + 1):
+                # The column the sun's rays pass over at this distance
+                if self.periodic:
+                    blocker = np.roll(top, -self.toward * distance, axis=0)
+                else:
+                    blocker = np.full_like(top, -1)
+                    if self.toward > 0:
+                        blocker[:-distance] = top[distance:]
+                    else:
+                        blocker[distance:] = top[:-distance]
+                np.maximum(shade, np.ceil(blocker - distance * self.slope).astype(np.int16), out=shade)
+        self.shade.reshape(self.width, self.depth)[:, rows] = shade
+
+    def direct(self, indices):
+        """
+        Returns whether the top faces of some cells are in direct sunlight
+
+        Args:
+            indices array of flat indices
+
+        Returns:
+            Boolean array
+        """
+        return indices % self.height >= self.shade[indices // self.height]
+
+    def light(self, indices):
+        """
+        Returns the energy gained per tick by the top faces of some cells
+
+        Args:
+            indices array of flat indices of cells whose top faces touch Air
+
+        Returns:
+            Array of energies
+        """
+        sun = self.sun
+        return np.where(self.direct(indices), sun.full * self.daylight, sun.full * sun.side * self.daylight)
+
+    def cell_light(self, index):
+        """
+        Returns the energy gained per tick by the faces of a cell
+
+        Args:
+            index flat index of the cell
+
+        Returns:
+            Tuple of the energy gained by its top face, if it touches Air, and
+            by each other face touching Air
+        """
+        sun = self.sun
+        side = sun.full * sun.side * self.daylight
+        if index % self.height >= self.shade[index // self.height]:
+            return sun.full * self.daylight, side
+        return side, side
+
+    def side_light(self):
+        """
+        Returns the energy gained per tick by a side face touching Air
+        """
+        return self.sun.full * self.sun.side * self.daylight
+
+class CellTypes():
+    """
+    The cell type values of an object model grid, read a range at a time
+
+    Lets Lighting read the cells of a Grid as it does the arrays of an
+    ArrayGrid.
+    """
+
+    def __init__(self, cells):
+        """
+        Args:
+            cells list of Cell objects
+        """
+        self.cells = cells
+
+    def __getitem__(self, cells):
+        return np.fromiter((cell.cell_type.value for cell in self.cells[cells]), dtype=np.int8)
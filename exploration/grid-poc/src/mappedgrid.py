@@ -0,0 +1,292 @@
+#!/bin/python3
+# vim: et:ts=4:sts=4:sw=4
+
+# SPDX-License-Identifier: BSD-2-Clause
+# Copyright © 2024 The Alan Turing Institute
+
+# Memory-mapped grid
+
+import json
+import math
+import os
+import tempfile
+from itertools import chain
+import numpy as np
+
+from src.cells import (
+    CELL_TYPE_NAMES,
+)
+
+from src.topology import (
+    neighbour_table,
+)
+
+from src.scheduler import (
+    Schedule,
+)
+
+from src.checkpoint import (
+    save_plants,
+    load_plants,
+    class_name,
+)
+
+from src.arraygrid import (
+    ArrayGrid,
+)
+
+from src.lighting import (
+    Sun,
+)
+
+from src.weather import (
+    Climate,
+)
+
+# Files holding the metadata and plants of a world, alongside its arrays
+WORLD_FILE = "world.json"
+PLANTS_FILE = "plants.bin"
+
+class MappedGrid(ArrayGrid):
+    """
+    An ArrayGrid whose arrays are held in memory-mapped files
+
+    Each array is a .npy file in the grid's directory, mapped into memory
+    with numpy.memmap, so a world can be much larger than the memory of the
+    machine running it. The operating system pages the files in as they're
+    used and writes changed pages back in its own time.
+
+    To keep the working set small the phases of a tick are applied a chunk
+    at a time, where a chunk is a run of whole x slabs. As the cells are
+    stored with x varying slowest, each chunk is a contiguous range of
+    every array. The chunks are taken in index order, which gives exactly
+    the same result as an ArrayGrid: the six-neighbour stencil only reaches
+    one slab into the chunks either side, and the phases that read what
+    their neighbours have written (the plant updates and reproduction)
+    already work through the cells in index order.
+
+    Neighbour tables for the whole grid would take more space than the
+    cells themselves, so they're worked out for each chunk as it's needed.
+    The Plant objects are kept in memory.
+
+    Only the live cells are swept: the ghost cell at the end of the arrays
+    never changes.
+    """
+    # Chunks hold about this many cells unless chunk_width is given
+    chunk_cells = 1 << 20
+
+    # Neighbour tables are worked out a chunk at a time
+    tables = False
+
+    def __init__(self, width=16, depth=16, height=8, periodic=True, directory=None, chunk_width=None,
+            existing=False):
+        """
+        Create a world, or map one that already exists
+
+        Args:
+            width, depth, height: the dimensions of the grid
+            periodic whether the grid wraps at its edges
+            directory to hold the arrays, or None for a new temporary
+                directory
+            chunk_width number of x slabs in each chunk, or None to choose
+                a width giving about chunk_cells cells
+            existing map the arrays already in the directory rather than
+                creating new ones
+        """
+        if directory is None:
+            directory = tempfile.mkdtemp(prefix="plantworld-")
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.existing = existing
+        self.mapped = []
+        if chunk_width is None:
+            chunk_width = max(1, self.chunk_cells // (depth * height))
+        self.chunk_width = min(chunk_width, width)
+        # Neighbour tables relative to the start of a chunk, see chunk_neighbours()
+        self.relative_tables = {}
+        super().__init__(width, depth, height, periodic)
+
+    def allocate(self, name, shape, dtype=np.float64, value=0):
+        """
+        Create or map one of the arrays holding the state of the cells
+
+        New files are created sparse, so only the arrays that start out
+        non-zero are written to disk up front.
+
+        Args:
+            name of the attribute the array is stored in, which also names
+                the file
+            shape of the array
+            dtype of the array
+            value to fill a new array with
+
+        Returns:
+            The mapped array
+        """
+        filename = os.path.join(self.directory, name + ".npy")
+        self.mapped.append(name)
+        if self.existing:
+            return np.load(filename, mmap_mode="r+")
+        array = np.lib.format.open_memmap(filename, mode="w+", dtype=dtype, shape=tuple(np.atleast_1d(shape).tolist()))
+        if value != 0:
+            array[:] = value
+        return array
+
+    def chunks(self):
+        """
+        Returns the ranges of cells the phases of a tick are applied to
+
+        Returns:
+            List of slices, each covering chunk_width x slabs
+        """
+        plane = self.depth * self.height
+        return [
+            slice(x * plane, min(x + self.chunk_width, self.width) * plane)
+            for x in range(0, self.width, self.chunk_width)
+        ]
+
+    def chunk_neighbours(self, cells):
+        """
+        Returns the neighbours of a range of cells
+
+        The chunks between the first and last all have the same neighbours
+        relative to their first cell, so the relative table is worked out
+        once for each shape of chunk and offset.
+
+        Args:
+            cells slice of the arrays
+
+        Returns:
+            (N, 6) array of the flat indices of the neighbours of each cell
+        """
+        start, stop = cells.start, cells.stop
+        plane = self.depth * self.height
+        if start % plane or stop % plane:
+            return neighbour_table(self.width, self.depth, self.height, self.periodic, start, stop)
+
+        key = (stop - start, start == 0, stop == self.topology.size)
+        if key not in self.relative_tables:
+            table = neighbour_table(self.width, self.depth, self.height, self.periodic, start, stop)
+            ghosts = np.flatnonzero(table == self.topology.ghost) if not self.periodic else None
+            table -= start
+            self.relative_tables[key] = (table, ghosts)
+        relative, ghosts = self.relative_tables[key]
+        table = relative + start
+        if ghosts is not None:
+            table.flat[ghosts] = self.topology.ghost
+        return table
+
+    def statistics(self):
+        """
+        Summarise the current state of the world
+
+        See Grid.statistics. The totals are worked out a chunk at a time.
+
+        Returns:
+            Dictionary of cell counts and resource totals, overall and for
+            each plant species
+        """
+        counts = np.zeros(4, dtype=np.int64)
+        for cells in self.chunks():
+            counts += np.bincount(self.cell_type[cells], minlength=4)
+        species = {}
+        for index in sorted(self.plants):
+            plant = self.plants[index]
+            totals = species.setdefault(class_name(type(plant)), {"cells": 0, "water": 0.0, "energy": 0.0})
+            totals["cells"] += 1
+            totals["water"] += float(self.water[index])
+            totals["energy"] += float(self.energy[index])
+        return {
+            "cells": {name: int(counts[value]) for value, name in enumerate(CELL_TYPE_NAMES)},
+            "water": math.fsum(chain.from_iterable(self.water[cells].tolist() for cells in self.chunks())),
+            "species": species,
+        }
+
+    def flush(self):
+        """
+        Write everything needed to open the world again to its directory
+
+        The arrays are flushed to disk and the metadata and plants, which
+        are held in memory, are written alongside them.
+        """
+        for name in self.mapped:
+            getattr(self, name).flush()
+        save_plants(sorted(self.plants.items())).tofile(os.path.join(self.directory, PLANTS_FILE))
+        meta = {
+            "width": self.width,
+            "depth": self.depth,
+            "height": self.height,
+            "periodic": self.periodic,
+            "chunk_width": self.chunk_width,
+            "ticks": self.ticks,
+            "schedule": self.schedule.periods,
+            "seed_cells": [list(seed) for seed in self.seed_cells],
+            "sun": self.lighting.sun.settings if self.lighting is not None else None,
+            "climate": self.weather.climate.settings if self.weather is not None else None,
+        }
+        filename = os.path.join(self.directory, WORLD_FILE)
+        with open(filename + ".tmp", "w") as output:
+            json.dump(meta, output, indent=2)
+        os.replace(filename + ".tmp", filename)
+
+    @classmethod
+    def exists(cls, directory):
+        """
+        Returns True if the directory holds a world saved by flush()
+        """
+        return os.path.exists(os.path.join(directory, WORLD_FILE))
+
+    @classmethod
+    def open(cls, directory, chunk_width=None):
+        """
+        Map a world saved by flush()
+
+        Args:
+            directory holding the world
+            chunk_width number of x slabs in each chunk, or None to use the
+                width the world was saved with
+
+        Returns:
+            MappedGrid using the files in the directory
+        """
+        with open(os.path.join(directory, WORLD_FILE)) as source:
+            meta = json.load(source)
+        grid = cls(meta["width"], meta["depth"], meta["height"], meta["periodic"], directory,
+            chunk_width or meta["chunk_width"], existing=True)
+        grid.ticks = meta["ticks"]
+        grid.schedule = Schedule(**meta["schedule"])
+        grid.seed_cells = [tuple(seed) for seed in meta["seed_cells"]]
+        if meta.get("sun"):
+            grid.set_sun(Sun(**meta["sun"]))
+        if meta.get("climate"):
+            grid.set_climate(Climate(**meta["climate"]))
+        grid.plants = load_plants(np.fromfile(os.path.join(directory, PLANTS_FILE), dtype=np.uint8))
+        return grid
+
+    def evict(self):
+        """
+        Drop the world's files from the page cache
+
+        Changed pages are written to disk first, and the arrays are mapped
+        again afterwards, as pages that are still mapped aren't dropped.
+        Used to measure how the world runs when its files have to be read
+        from disk.
+        """
+        for name in self.mapped:
+            getattr(self, name).flush()
+            setattr(self, name, None)
+        for name in self.mapped:
+            filename = os.path.join(self.directory, name + ".npy")
+            descriptor = os.open(filename, os.O_RDONLY)
+            try:
+                os.fsync(descriptor)
+                os.posix_fadvise(descriptor, 0, 0, os.POSIX_FADV_DONTNEED)
+            finally:
+                os.close(descriptor)
+            setattr(self, name, np.load(filename, mmap_mode="r+"))
+
+    def disk_usage(self):
+        """
+        Returns the number of bytes the world's arrays take on disk
+        """
+        return sum(os.path.getsize(os.path.join(self.directory, name + ".npy")) for name in self.mapped)
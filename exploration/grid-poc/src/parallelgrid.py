@@ -0,0 +1,538 @@
+#!/bin/python3
+# vim: et:ts=4:sts=4:sw=4
+
+# SPDX-License-Identifier: BSD-2-Clause
+# Copyright © 2024 The Alan Turing Institute
+
+# Parallel grid
+
+import os
+from multiprocessing import get_context, shared_memory
+import numpy as np
+
+from src.arraygrid import (
+    ArrayGrid,
+)
+
+from src.batch import (
+    batched,
+)
+
+from src.profiling import (
+    Profiler,
+)
+
+from src.topology import (
+    neighbour_table,
+)
+
+class ParallelGrid(ArrayGrid):
+    """
+    An ArrayGrid whose ticks are shared between worker processes
+
+    The world is split into slabs of whole x layers, one for each worker.
+    Every array lives in shared memory, so a worker reads the layers either
+    side of its slab, its ghost layers, straight from the slabs of its
+    neighbours: the exchange is the barrier that follows each phase that
+    reads neighbours, after which every worker sees the values the others
+    have written. A worker only ever writes to its own slab.
+
+    Each worker holds the Plant objects of its own slab and updates them.
+    The outgoing messages of the plants in the first and last layer of each
+    slab are passed to the other workers, as plants in the next slab are the
+    neighbours of those. ArrayGrid updates the plants that aren't batched in
+    index order, so such a plant reads the messages sent this tick by the
+    neighbours before it and last tick by those after it. When any slab
+    holds these plants the workers take turns at the update, each passing on
+    the messages from its edges to the next, which gives the same messages
+    across slabs; otherwise they all update at once. Every part of the tick
+    gives exactly the same results as ArrayGrid.
+
+    Reproduction is applied in index order by ArrayGrid, so a child can be
+    copied from a cell that was itself replaced earlier in the pass. Here
+    each worker follows such chains back to the cell the copy started from,
+    which may be in another slab, and copies that cell as it was before the
+    pass, which gives the same result.
+
+    The workers are started by the first tick, or by start(), and given the
+    plants. Reading plants brings them back from the workers, and they're
+    sent out again before the next tick. Call close() to stop the workers
+    and free the shared memory.
+    """
+    # Number of worker processes, or None for one per CPU. There are never
+    # more workers than x layers.
+    processes = None
+
+    def __init__(self, width=16, depth=16, height=8, periodic=True, processes=None):
+        self.blocks = {}
+        self.workers = []
+        self.connections = []
+        # Plants held here, whether the workers hold their own copies of
+        # them and whether those are newer
+        self.local_plants = {}
+        self.scattered = False
+        self.stale = False
+        # Whether the workers take turns at updating the plants
+        self.relay = False
+        # The lighting last given to the workers and the version of its
+        # shade map
+        self.lighting_sent = (None, None)
+        if processes is not None:
+            self.processes = processes
+        super().__init__(width, depth, height, periodic)
+
+    def allocate(self, name, shape, dtype=np.float64, value=0):
+        """
+        Create one of the arrays holding the state of the cells in shared
+        memory
+
+        Args:
+            name of the attribute the array is stored in
+            shape of the array
+            dtype of the array
+            value to fill it with
+
+        Returns:
+            The new array
+        """
+        shape = tuple(np.atleast_1d(shape).tolist())
+        dtype = np.dtype(dtype)
+        memory = shared_memory.SharedMemory(create=True, size=max(int(np.prod(shape)) * dtype.itemsize, 1))
+        self.blocks[name] = (memory, shape, dtype.str)
+        array = np.ndarray(shape, dtype=dtype, buffer=memory.buf)
+        array[:] = value
+        return array
+
+    @property
+    def plants(self):
+        """
+        Plant objects keyed by flat index, brought back from the workers
+        """
+        self.gather_plants()
+        # The caller may change them
+        self.scattered = False
+        return self.local_plants
+
+    @plants.setter
+    def plants(self, plants):
+        self.local_plants = plants
+        self.scattered = False
+        self.stale = False
+
+    def gather_plants(self):
+        """
+        Bring the plants back from the workers, if they've been updated
+        since they were sent out
+        """
+        if self.stale:
+            self.local_plants = {}
+            for plants in self.dispatch("take_plants"):
+                self.local_plants.update(plants)
+            self.stale = False
+
+    def slabs(self):
+        """
+        Returns the range of x layers given to each worker
+
+        Returns:
+            List of (first, last) pairs, last being exclusive
+        """
+        count = min(self.processes or os.cpu_count() or 1, self.width)
+        edges = [(self.width * worker) // count for worker in range(count + 1)]
+        return list(zip(edges[:-1], edges[1:]))
+
+    def start(self):
+        """
+        Start the worker processes
+        """
+        if self.workers:
+            return
+        if not self.blocks:
+            raise ValueError("The grid has been closed")
+        context = get_context("spawn")
+        blocks = {name: (memory.name, shape, dtype) for name, (memory, shape, dtype) in self.blocks.items()}
+        for first, last in self.slabs():
+            connection, child = context.Pipe()
+            process = context.Process(target=serve, args=(child, self.width, self.depth, self.height,
+                self.periodic, blocks, first, last), daemon=True)
+            process.start()
+            child.close()
+            self.workers.append(process)
+            self.connections.append(connection)
+        self.lighting_sent = (None, None)
+
+    def dispatch(self, name, *args, each=None):
+        """
+        Call a method of every worker and wait for them all to finish
+
+        Args:
+            name of the SlabGrid method
+            args passed to every worker
+            each list of the arguments for each worker, used instead of args
+
+        Returns:
+            List of the results from each worker
+        """
+        for worker, connection in enumerate(self.connections):
+            connection.send((name, each[worker] if each is not None else args))
+        return [self.result(name, connection) for connection in self.connections]
+
+    def result(self, name, connection):
+        """
+        Returns the result of a method called on a worker, once it's done
+
+        Args:
+            name of the SlabGrid method
+            connection to the worker
+        """
+        ok, result, counters = connection.recv()
+        if not ok:
+            raise RuntimeError("Worker failed in {}:\n{}".format(name, result))
+        if self.profiler is not None:
+            for counter, amount in counters.items():
+                self.profiler.count(counter, amount)
+        return result
+
+    def scatter(self):
+        """
+        Give each worker the plants in its slab, if it doesn't already hold
+        them
+        """
+        if self.scattered:
+            return
+        layer = self.depth * self.height
+        plants = self.local_plants
+        each = []
+        for first, last in self.slabs():
+            start, stop = first * layer, last * layer
+            each.append(({index: plant for index, plant in plants.items() if start <= index < stop},))
+        self.dispatch("give_plants", each=each)
+        self.scattered = True
+
+    def share_lighting(self):
+        """
+        Give the workers the lighting, if it has changed since they were
+        last given it
+        """
+        lighting = self.lighting
+        sent = (lighting, lighting.version if lighting is not None else None)
+        if sent[0] is self.lighting_sent[0] and sent[1] == self.lighting_sent[1]:
+            return
+        self.dispatch("set_lighting", lighting)
+        self.lighting_sent = sent
+
+    def close(self):
+        """
+        Stop the workers and free the shared memory
+
+        The plants are brought back first, so the world can still be read.
+        """
+        if self.workers:
+            self.gather_plants()
+            for connection in self.connections:
+                connection.send(None)
+            for process in self.workers:
+                process.join()
+            for connection in self.connections:
+                connection.close()
+            self.workers = []
+            self.connections = []
+            self.scattered = False
+        # Keep the state in ordinary memory
+        for name, (memory, shape, dtype) in self.blocks.items():
+            setattr(self, name, getattr(self, name).copy())
+            memory.close()
+            memory.unlink()
+        self.blocks = {}
+
+    def preupdate(self):
+        """
+        All updates that must happen before the main Cell update
+
+        Also collects the messages of the plants on the edges of each slab,
+        and whether any slab holds plants that aren't batched.
+        """
+        self.start_tick()
+        self.start()
+        self.scatter()
+        self.share_lighting()
+        self.stale = True
+        edges, single = zip(*self.dispatch("begin_tick", self.ticks, self.schedule, self.profiler is not None))
+        self.halo = {}
+        for messages in edges:
+            self.halo.update(messages)
+        self.relay = any(single)
+
+    def update_cells(self):
+        """
+        The main Cell update cycle, with each worker updating its own plants
+
+        If plants that aren't batched read each other's messages across the
+        slabs, the workers update in turn, in index order, and the messages
+        each sends from its edges replace those from the last tick.
+        """
+        if self.relay:
+            for connection in self.connections:
+                connection.send(("update_plants", (self.halo, True)))
+                self.halo.update(self.result("update_plants", connection))
+        else:
+            self.dispatch("update_plants", self.halo)
+        self.halo = {}
+
+    def apply_pressure(self):
+        self.dispatch("apply_pressure")
+
+    def update_flux(self):
+        self.dispatch("update_flux")
+
+    def move_resources(self):
+        self.dispatch("move_resources")
+
+    def take_attempts(self):
+        """
+        Returns the reproduction attempts made by the plants of every slab
+
+        The fights are decided here, as a plant can reproduce into another
+        slab.
+        """
+        sources, directions = zip(*self.dispatch("take_attempts"))
+        return np.concatenate(sources), np.concatenate(directions)
+
+    def clear(self, name, value):
+        self.dispatch("clear", name, value)
+
+    def apply_reproduce(self):
+        """
+        Reproduce the successful cells
+
+        Each worker is given the winners in its slab and finds the cells its
+        children are copied from before any of them are changed. Plants copied from another slab are then
+        fetched from the worker holding them. The lighting and weather are
+        kept here, so they're told which cells changed.
+        """
+        layer = self.depth * self.height
+        slabs = self.slabs()
+        owners = [first * layer for first, last in slabs]
+        winners, self.winners = self.winners, np.empty(0, dtype=np.intp)
+        each = [(part,) for part in np.split(winners, np.searchsorted(winners, owners[1:]))]
+        wanted = [[] for _ in slabs]
+        for needed in self.dispatch("find_roots", each=each):
+            for index in needed:
+                wanted[np.searchsorted(owners, index, side="right") - 1].append(index)
+        fetched = {}
+        if any(wanted):
+            for plants in self.dispatch("lend_plants", each=[(indices,) for indices in wanted]):
+                fetched.update(plants)
+        targets = self.dispatch("reproduce_from_roots", fetched)
+        if self.lighting is not None:
+            for changed in targets:
+                self.lighting.changed(changed)
+        if self.weather is not None:
+            for changed in targets:
+                self.weather.changed(changed)
+
+class SlabGrid(ArrayGrid):
+    """
+    The part of a ParallelGrid held by one worker process
+
+    Maps the shared arrays of the whole world but only applies the phases
+    of the tick to the cells of its own slab. The neighbour table of the
+    slab is built once; see MappedGrid for the same approach to chunks.
+    """
+    tables = False
+
+    def __init__(self, width, depth, height, periodic, blocks, first, last):
+        self.blocks = blocks
+        self.memories = []
+        super().__init__(width, depth, height, periodic)
+        layer = depth * height
+        self.slab = slice(first * layer, last * layer)
+        self.table = neighbour_table(width, depth, height, periodic, self.slab.start, self.slab.stop)
+        self.first_layer = self.slab.start + layer
+        self.last_layer = self.slab.stop - layer
+
+    def allocate(self, name, shape, dtype=np.float64, value=0):
+        """
+        Map one of the arrays created by the ParallelGrid
+
+        Returns:
+            The shared array
+        """
+        block, shape, dtype = self.blocks[name]
+        memory = shared_memory.SharedMemory(name=block)
+        self.memories.append(memory)
+        return np.ndarray(shape, dtype=np.dtype(dtype), buffer=memory.buf)
+
+    def chunks(self):
+        return [self.slab]
+
+    def chunk_neighbours(self, cells):
+        if cells == self.slab:
+            return self.table
+        return neighbour_table(self.width, self.depth, self.height, self.periodic, cells.start, cells.stop)
+
+    def give_plants(self, plants):
+        self.plants = plants
+
+    def take_plants(self):
+        return self.plants
+
+    def set_lighting(self, lighting):
+        self.lighting = lighting
+
+    def begin_tick(self, ticks, schedule, counting):
+        """
+        Apply the updates that come before the main Cell update to the slab
+
+        Args:
+            ticks number of ticks so far
+            schedule Schedule of the world
+            counting whether to count cell-level operations
+
+        Returns:
+            Tuple of the outgoing messages of the plants in the first and
+            last layers of the slab, keyed by flat index, and whether the
+            slab holds plants that aren't batched
+        """
+        self.ticks = ticks
+        self.schedule = schedule
+        self.profiler = Profiler() if counting else None
+        self.preupdate()
+        single = any(not batched(type(plant)) for plant in self.plants.values())
+        return self.edges(), single
+
+    def edges(self):
+        """
+        Returns the outgoing messages of the plants in the first and last
+        layers of the slab, keyed by flat index
+        """
+        return {
+            index: plant.outgoing for index, plant in self.plants.items()
+            if index < self.first_layer or index >= self.last_layer
+        }
+
+    def update_plants(self, halo, relay=False):
+        """
+        Update the plants of the slab
+
+        Args:
+            halo outgoing messages of the plants in other slabs that border
+                this one
+            relay whether to pass on the messages of the edges of the slab
+
+        Returns:
+            The messages from the edges of the slab after the update, if
+            relaying them
+        """
+        self.halo = halo
+        self.update_cells()
+        self.halo = {}
+        return self.edges() if relay else None
+
+    def source(self, index):
+        """
+        Returns the cell a cell is reproduced from this tick
+        """
+        direction = self.reproduce[index]
+        if self.slab.start <= index < self.slab.stop:
+            return int(self.table[index - self.slab.start, direction])
+        return int(self.chunk_neighbours(slice(index, index + 1))[0, direction])
+
+    def find_roots(self, targets):
+        """
+        Find the cell each child in the slab is copied from
+
+        A child whose parent is replaced before it in index order is copied
+        from the replacement, so is a copy of whatever the parent was copied
+        from. The rows and plants of those cells are taken now, before any
+        worker changes them.
+
+        Args:
+            targets flat indices of the cells of the slab that won their
+                fights, in order
+
+        Returns:
+            Flat indices of the plants that are needed from other slabs
+        """
+        self.targets = targets
+        roots = []
+        for index in self.targets.tolist():
+            current, source = index, self.source(index)
+            while source < current and self.reproduce[source] >= 0:
+                current, source = source, self.source(source)
+            roots.append(source)
+        self.roots = np.array(roots, dtype=np.intp)
+        self.rows = {name: getattr(self, name)[self.roots] for name in self.REPRODUCED_ARRAYS}
+        self.parents = [self.plants.get(root) for root in roots]
+        return sorted({root for root, parent in zip(roots, self.parents) if parent is None})
+
+    def lend_plants(self, indices):
+        """
+        Returns the plants of the slab that other slabs' children are
+        copied from
+        """
+        return {index: self.plants[index] for index in indices}
+
+    def reproduce_from_roots(self, fetched):
+        """
+        Reproduce the successful cells of the slab
+
+        Args:
+            fetched plants from other slabs found by find_roots, keyed by
+                flat index
+
+        Returns:
+            Flat indices of the cells reproduced into
+        """
+        targets = self.targets
+        if len(targets):
+            if self.profiler is not None:
+                self.profiler.count("reproductions", len(targets))
+            for name in self.REPRODUCED_ARRAYS:
+                getattr(self, name)[targets] = self.rows[name]
+            self.water[targets] = 0
+            self.energy[targets] = 0
+            for index, root, parent in zip(targets.tolist(), self.roots.tolist(), self.parents):
+                self.plants[index] = (parent if parent is not None else fetched[root]).spawn()
+        self.reproduce[targets] = -1
+        self.targets = self.roots = self.rows = self.parents = None
+        return targets
+
+def serve(connection, width, depth, height, periodic, blocks, first, last):
+    """
+    Run the part of a ParallelGrid held by one worker process
+
+    Calls the SlabGrid methods it's sent until it's sent None.
+
+    Args:
+        connection end of the pipe to the ParallelGrid
+        width, depth, height: the dimensions of the grid
+        periodic whether the grid wraps at its edges
+        blocks name, shape and dtype of the shared memory holding each array
+        first, last range of x layers in the slab, last being exclusive
+    """
+    import traceback
+
+    grid = SlabGrid(width, depth, height, periodic, blocks, first, last)
+    try:
+        while True:
+            message = connection.recv()
+            if message is None:
+                break
+            name, args = message
+            try:
+                result = getattr(grid, name)(*args)
+            except Exception:
+                connection.send((False, traceback.format_exc(), {}))
+                continue
+            counters = {}
+            if grid.profiler is not None:
+                counters, grid.profiler.tick_counters = grid.profiler.tick_counters, {}
+            connection.send((True, result, counters))
+    finally:
+        # The arrays must go before the memory they're views of
+        for name in grid.blocks:
+            setattr(grid, name, None)
+        for memory in grid.memories:
+            memory.close()
+        connection.close()
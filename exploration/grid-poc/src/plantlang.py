@@ -0,0 +1,545 @@
+#!/bin/python3
+# vim: et:ts=4:sts=4:sw=4
+
+# SPDX-License-Identifier: BSD-2-Clause
+# Copyright © 2024 The Alan Turing Institute
+
+# Plantlang
+
+import re
+import numpy as np
+
+from src.cells import (
+    Direction,
+    CellType,
+)
+from src.plants import (
+    Plant,
+)
+from src.batch import (
+    CellBatch,
+    posted,
+)
+
+# Face names, with up and down as the plant-friendly names for above and below
+FACES = {
+    "left": Direction.LEFT.value,
+    "right": Direction.RIGHT.value,
+    "below": Direction.BELOW.value,
+    "down": Direction.BELOW.value,
+    "above": Direction.ABOVE.value,
+    "up": Direction.ABOVE.value,
+    "front": Direction.FRONT.value,
+    "behind": Direction.BEHIND.value,
+}
+
+# Names that stand for a fixed number
+CONSTANTS = {
+    "air": CellType.AIR.value,
+    "rock": CellType.ROCK.value,
+    "soil": CellType.SOIL.value,
+    "plant": CellType.PLANT.value,
+}
+
+# Sensors read from the cell itself, and those read from one of its faces,
+# by the CellBatch attribute holding them
+CELL_SENSORS = {
+    "energy": "energy",
+    "water": "water",
+    "permeability": "permeability",
+}
+FACE_SENSORS = {
+    "type": "neighbour_type",
+    "pressure": "water_pressure_external",
+    "signal": "signal",
+}
+
+# Operand kinds
+NUMBER, VARIABLE, SENSOR, FACE_SENSOR = range(4)
+
+# What each instruction takes: a destination variable, a face, a label or a
+# value, which is a number, constant, variable or sensor
+ARITHMETIC = {
+    "add": np.add,
+    "sub": np.subtract,
+    "mul": np.multiply,
+    "min": np.minimum,
+    "max": np.maximum,
+    "lt": np.less,
+    "le": np.less_equal,
+    "gt": np.greater,
+    "ge": np.greater_equal,
+    "eq": np.equal,
+    "ne": np.not_equal,
+}
+SIGNATURES = {
+    "set": ("variable", "value"),
+    "div": ("variable", "value", "value"),
+    "and": ("variable", "value", "value"),
+    "or": ("variable", "value", "value"),
+    "not": ("variable", "value"),
+    "goto": ("label",),
+    "if": ("value", "label"),
+    "unless": ("value", "label"),
+    "end": (),
+    "pump": ("face", "value"),
+    "permeability": ("value",),
+    "send": ("face", "value"),
+    "grow": ("face",),
+    "signal": ("face", "value"),
+    "colour": ("value", "value", "value", "value"),
+}
+SIGNATURES.update({name: ("variable", "value", "value") for name in ARITHMETIC})
+
+# How control leaves an instruction
+STEP, GOTO, IF, UNLESS, END = range(5)
+
+NAME = re.compile(r"[a-z_][a-z0-9_]*$")
+NUMBER_TEXT = re.compile(r"[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?$")
+
+class Program():
+    """
+    A compiled Plantlang program
+
+    Plantlang is a small assembly language for writing plant species without
+    writing Python. Each line holds an optional label, ending in a colon,
+    and an instruction; anything after a # is a comment. An instruction is
+    its name followed by its operands, separated by spaces:
+
+        set x a             x = a
+        add x a b           x = a + b, likewise sub, mul, div, min and max
+        lt x a b            x = 1 if a < b else 0, likewise le, gt, ge, eq
+                            and ne
+        and x a b           x = 1 if a and b are both non-zero else 0,
+                            likewise or; not x a is 1 if a is zero
+        goto label          carry on from the label
+        if a label          carry on from the label if a is non-zero
+        unless a label      carry on from the label if a is zero
+        end                 stop for this tick
+
+        pump face force     pump water through a face
+        permeability a      set how easily water passes through the cell
+        send face a         send energy to a neighbour
+        grow face           try to reproduce into a neighbour
+        signal face a       post a number for the neighbour on a face to
+                            read next tick
+        colour r g b a      set the colour of the cell
+
+    A value is a number, a variable, one of the constants air, rock, soil
+    and plant, or a sensor: energy, water and permeability read the cell
+    itself, and type.face, pressure.face and signal.face read the type of a
+    neighbour, the water pressure on the face and the signal the neighbour
+    posted to the cell last tick. The faces are left, right, front, behind,
+    up (or above) and down (or below). Variables are any other names and
+    start at zero each tick.
+
+    A program is compiled once for its species and run for all of the
+    species' cells at once, see run().
+    """
+
+    def __init__(self, source):
+        """
+        Compile a program
+
+        Args:
+            source text of the program
+
+        Raises:
+            ValueError if the program isn't valid
+        """
+        self.source = source
+        self.variables = {}
+        labels = {}
+        lines = []
+        for number, line in enumerate(source.splitlines(), 1):
+            line = line.split("#", 1)[0].strip()
+            while ":" in line:
+                label, line = (part.strip() for part in line.split(":", 1))
+                if not NAME.match(label):
+                    raise ValueError("line {}: bad label '{}'".format(number, label))
+                if label in labels:
+                    raise ValueError("line {}: label '{}' defined twice".format(number, label))
+                labels[label] = len(lines)
+            if line:
+                lines.append((number, line.split()))
+
+        # The bytecode: the name of each instruction and its decoded operands
+        self.code = []
+        for number, words in lines:
+            name, operands = words[0], words[1:]
+            if name not in SIGNATURES:
+                raise ValueError("line {}: unknown instruction '{}'".format(number, name))
+            signature = SIGNATURES[name]
+            if len(operands) != len(signature):
+                raise ValueError("line {}: {} takes {} operands".format(number, name, len(signature)))
+            self.code.append((name, tuple(
+                self.decode(number, kind, operand, labels)
+                for kind, operand in zip(signature, operands)
+            )))
+        self.compiled = [self.thread(name, operands) for name, operands in self.code]
+        # A program that never jumps backwards runs each instruction at most
+        # once, so cells can't run out of a budget as long as the program
+        self.acyclic = all(
+            target is None or target > pc
+            for pc, (control, function, target) in enumerate(self.compiled)
+        )
+
+    def decode(self, number, kind, operand, labels):
+        """
+        Returns the bytecode for an operand
+
+        Args:
+            number line number, for errors
+            kind of operand expected, see SIGNATURES
+            operand text of the operand
+            labels dictionary of instruction numbers keyed by label
+
+        Returns:
+            Face value, instruction number, or a tuple of the operand kind
+            and its number, variable number, attribute or attribute and face
+        """
+        if kind == "face":
+            if operand not in FACES:
+                raise ValueError("line {}: unknown face '{}'".format(number, operand))
+            return FACES[operand]
+        if kind == "label":
+            if operand not in labels:
+                raise ValueError("line {}: unknown label '{}'".format(number, operand))
+            return labels[operand]
+        if kind == "variable":
+            if not NAME.match(operand) or operand in CONSTANTS or operand in CELL_SENSORS:
+                raise ValueError("line {}: can't assign to '{}'".format(number, operand))
+            return (VARIABLE, self.variables.setdefault(operand, len(self.variables)))
+        if operand in CONSTANTS:
+            return (NUMBER, float(CONSTANTS[operand]))
+        if operand in CELL_SENSORS:
+            return (SENSOR, CELL_SENSORS[operand])
+        if NUMBER_TEXT.match(operand):
+            return (NUMBER, float(operand))
+        if "." in operand:
+            sensor, face = operand.split(".", 1)
+            if sensor not in FACE_SENSORS or face not in FACES:
+                raise ValueError("line {}: unknown sensor '{}'".format(number, operand))
+            return (FACE_SENSOR, (FACE_SENSORS[sensor], FACES[face]))
+        if NAME.match(operand):
+            return (VARIABLE, self.variables.setdefault(operand, len(self.variables)))
+        raise ValueError("line {}: bad value '{}'".format(number, operand))
+
+    def thread(self, name, operands):
+        """
+        Returns the function that runs an instruction
+
+        Each instruction is turned into a function of the machine state and
+        the cells to run it for, so running a program doesn't decode it.
+
+        Args:
+            name of the instruction
+            operands decoded operands
+
+        Returns:
+            Tuple of how control leaves the instruction, its function, which
+            returns the condition for a branch, and the branch target
+        """
+        if name == "goto":
+            return (GOTO, None, operands[0])
+        if name == "end":
+            return (END, None, None)
+        if name in ("if", "unless"):
+            value = fetch(operands[0])
+            return (IF if name == "if" else UNLESS, value, operands[1])
+
+        if name in SIGNATURES and SIGNATURES[name][0] == "variable":
+            target = operands[0][1]
+            values = [fetch(operand) for operand in operands[1:]]
+            if name == "set":
+                (a,) = values
+                compute = a
+            elif name == "not":
+                (a,) = values
+                compute = lambda machine, lanes: a(machine, lanes) == 0
+            elif name == "and":
+                a, b = values
+                compute = lambda machine, lanes: (a(machine, lanes) != 0) & (b(machine, lanes) != 0)
+            elif name == "or":
+                a, b = values
+                compute = lambda machine, lanes: (a(machine, lanes) != 0) | (b(machine, lanes) != 0)
+            elif name == "div":
+                a, b = values
+                compute = lambda machine, lanes: divide(a(machine, lanes), b(machine, lanes))
+            else:
+                a, b = values
+                function = ARITHMETIC[name]
+                compute = lambda machine, lanes: function(a(machine, lanes), b(machine, lanes))
+
+            def assign(machine, lanes):
+                machine.registers[target, lanes] = compute(machine, lanes)
+            return (STEP, assign, None)
+
+        if name == "pump":
+            direction, force = operands[0], fetch(operands[1])
+            def action(machine, lanes):
+                limit = machine.species.max_force
+                force_lanes = np.clip(np.broadcast_to(force(machine, lanes), lanes.shape), -limit, limit)
+                machine.cells.action_pump(lanes, direction, force_lanes)
+        elif name == "permeability":
+            value = fetch(operands[0])
+            def action(machine, lanes):
+                machine.cells.action_permeability(lanes, value(machine, lanes), machine.species.max_permeability)
+        elif name == "send":
+            direction, value = operands[0], fetch(operands[1])
+            def action(machine, lanes):
+                machine.cells.action_send_energy(lanes, np.maximum(value(machine, lanes), 0.0), direction)
+        elif name == "grow":
+            direction = operands[0]
+            def action(machine, lanes):
+                machine.cells.action_reproduce(lanes, direction)
+        elif name == "signal":
+            direction, value = operands[0], fetch(operands[1])
+            def action(machine, lanes):
+                machine.cells.action_signal(lanes, direction, value(machine, lanes))
+        elif name == "colour":
+            channels = [fetch(operand) for operand in operands]
+            def action(machine, lanes):
+                machine.cells.set_colour(lanes, np.stack([
+                    np.broadcast_to(channel(machine, lanes), lanes.shape) for channel in channels
+                ], axis=1))
+        return (STEP, action, None)
+
+    def run(self, cells, species):
+        """
+        Run the program for a batch of cells
+
+        The cells run in lock step, each following its own path through the
+        program. At each step the earliest instruction any cell is waiting at
+        is run for all of the cells waiting there, so cells that take
+        different branches soon come back together. Each cell may run at
+        most species.budget instructions; one that runs out, or reaches end
+        or the end of the program, stops for the tick with the actions it has
+        taken so far.
+
+        Args:
+            cells CellBatch holding the cells
+            species the Plant subclass running the program
+
+        Returns:
+            The number of instructions run, summed over the cells
+        """
+        machine = Machine(cells, species, len(self.variables))
+        length = len(self.compiled)
+        budget = None
+        if not self.acyclic or species.budget < length:
+            budget = np.full(len(cells), species.budget, dtype=np.int64)
+        # Cells waiting at each instruction, keyed by instruction number
+        waiting = {0: np.arange(len(cells))} if len(cells) and species.budget > 0 and length else {}
+        executed = 0
+
+        def wait(pc, lanes):
+            if budget is not None:
+                lanes = lanes[budget[lanes] > 0]
+            if pc >= length or not len(lanes):
+                return
+            if pc in waiting:
+                waiting[pc] = np.concatenate((waiting[pc], lanes))
+            else:
+                waiting[pc] = lanes
+
+        while waiting:
+            pc = min(waiting)
+            lanes = waiting.pop(pc)
+            control, function, target = self.compiled[pc]
+            executed += len(lanes)
+            if budget is not None:
+                budget[lanes] -= 1
+            if control == STEP:
+                function(machine, lanes)
+                wait(pc + 1, lanes)
+            elif control == GOTO:
+                wait(target, lanes)
+            elif control != END:
+                taken = np.broadcast_to(function(machine, lanes) != 0, lanes.shape)
+                if control == UNLESS:
+                    taken = ~taken
+                wait(target, lanes[taken])
+                wait(pc + 1, lanes[~taken])
+        return executed
+
+class Machine():
+    """
+    The state of a program while it runs for a batch of cells
+    """
+
+    def __init__(self, cells, species, variables):
+        """
+        Args:
+            cells CellBatch holding the cells
+            species the Plant subclass running the program
+            variables number of variables the program uses
+        """
+        self.cells = cells
+        self.species = species
+        self.registers = np.zeros((variables, len(cells)))
+
+def fetch(operand):
+    """
+    Returns a function reading the value of an operand
+
+    Args:
+        operand tuple of the operand kind and its details, see Program.decode
+
+    Returns:
+        Function of the machine and the cells to read it for, returning a
+        number or an array with a value for each cell
+    """
+    kind, value = operand
+    if kind == NUMBER:
+        return lambda machine, lanes: value
+    if kind == VARIABLE:
+        return lambda machine, lanes: machine.registers[value, lanes]
+    if kind == SENSOR:
+        return lambda machine, lanes: getattr(machine.cells, value)[lanes]
+    attribute, direction = value
+    return lambda machine, lanes: getattr(machine.cells, attribute)[lanes, direction]
+
+def divide(a, b):
+    """
+    Returns a / b, or zero where b is zero
+    """
+    b = np.asarray(b, dtype=np.float64)
+    zero = b == 0
+    return np.where(zero, 0.0, np.divide(a, np.where(zero, 1.0, b)))
+
+class ProgramPlant(Plant):
+    """
+    A plant species whose behaviour is given by a Plantlang program
+
+    Use species() to create one. The program is run for all of the
+    species' cells at once by the array backends, and for one cell at a time
+    by the object model Grid, with the same results.
+    """
+    __slots__ = ("permeability",)
+    program = None
+    # Instructions each cell may run per tick
+    budget = 64
+    # Largest pumping force and permeability the program may set
+    max_force = 8.0
+    max_permeability = Plant.permeability
+    # The grid gathers the signals posted to the cells before updating them
+    signals = True
+
+    def __init__(self):
+        super().__init__()
+        self.permeability = self.max_permeability
+
+    @classmethod
+    def update_batch(cls, cells):
+        cells.instructions = cls.program.run(cells, cls)
+
+    def update(self):
+        cells = CellBatch(
+            np.zeros(1, dtype=np.intp),
+            np.array([self.water], dtype=np.float64),
+            np.array([self.energy], dtype=np.float64),
+            np.array([[cell_type.value for cell_type in self.neighbour_type]], dtype=np.int8),
+            np.array([self.pressure_gradient], dtype=np.float64),
+            np.array([self.colour[:4]], dtype=np.float64),
+            np.array([self.permeability], dtype=np.float64),
+            np.array([self.water_pressure_external], dtype=np.float64),
+            np.array([[getattr(state, "signal", 0.0) for state in self.incoming]], dtype=np.float64),
+        )
+        self.update_batch(cells)
+        self.energy = float(cells.energy[0])
+        self.permeability = float(cells.permeability[0])
+        self.colour = tuple(cells.colours[0].tolist())
+        for direction in range(len(Direction)):
+            self.pressure_gradient[direction] = float(cells.pressure_gradient[0, direction])
+            self.energy_outgoing[direction] += float(cells.energy_outgoing[0, direction])
+            if cells.reproduce[0, direction]:
+                self.reproduce[direction] = True
+        self.outgoing = [posted(float(value)) for value in cells.signal_out[0].tolist()]
+
+def species(name, source, module=__name__, **parameters):
+    """
+    Create a plant species from a Plantlang program
+
+    The species must be bound to the given name in the given module, so it
+    can be found again by import path when a world is saved, loaded or
+    shared between processes, for example:
+
+        Creeper = species("Creeper", CREEPER, __name__, budget=32)
+
+    Args:
+        name of the species
+        source text of its program, see Program
+        module name of the module the species is defined in
+        parameters class attributes to set, such as budget, max_force or
+            max_permeability
+
+    Returns:
+        ProgramPlant subclass
+
+    Raises:
+        ValueError if the program isn't valid
+    """
+    namespace = {
+        "__slots__": (),
+        "__module__": module,
+        "__qualname__": name,
+        "program": Program(source),
+    }
+    namespace.update(parameters)
+    return type(name, (ProgramPlant,), namespace)
+
+# A plant in the style of Plant: leaves gather energy and call for water,
+# shoots pass both along and roots grow down into the soil
+SHRUB = """
+        eq      t type.up air               # where are we?
+        if      t leaf
+        eq      t type.down soil
+        if      t root
+        eq      t type.up soil
+        if      t root
+
+        colour  0.2 0.8 0 1                 # a shoot
+        signal  down signal.up              # pass the leaves' call for water down
+        gt      t energy 10
+        unless  t done
+        gt      t signal.up 0
+        unless  t share
+        pump    up 8
+        end
+share:  mul     e energy 0.5
+        send    down e
+        end
+
+leaf:   colour  0.7 0.4 0 1
+        lt      thirsty water 7
+        signal  down thirsty
+        eq      t type.down plant
+        unless  t grow
+        gt      t energy 20
+        unless  t grow
+        sub     e energy 20
+        min     e e 5
+        send    down e
+grow:   gt      t energy 30
+        gt      w water 7
+        and     t t w
+        unless  t done
+        grow    up
+        end
+
+root:   colour  0.4 0.8 0 1
+        permeability 1
+        gt      t energy 30
+        gt      w water 5
+        and     t t w
+        eq      s type.down soil
+        and     t t s
+        unless  t pump
+        grow    down
+pump:   gt      t energy 10
+        unless  t done
+        pump    up 8
+done:
+"""
+Shrub = species("Shrub", SHRUB)
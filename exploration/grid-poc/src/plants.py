@@ -7,6 +7,7 @@
 # Plants
 
 import copy
+import numpy as np
 
 from src.cells import (
     Direction,
@@ -20,36 +21,49 @@ PRESSURE_SATURATED = -32
 
 
 class Plant(Cell):
+    __slots__ = ()
     cell_type = CellType.PLANT
-    colour = (0.0, 1.0, 0.0, 1.0)
     wsat = 16
     permeability = (1.0/1.8)
+    # Largest force a cell may add to a face by pumping in a tick
+    max_force = 8.0
 
     def __init__(self):
         super().__init__()
+        self.colour = (0.0, 1.0, 0.0, 1.0)
 
-    def update_sunlight(self):
+    def update_sunlight(self, scale=1, top=8, side=1):
         for direction in range(len(Direction)):
             if self.get_neighbour(direction) == CellType.AIR:
                 if direction == Direction.ABOVE.value:
-                    self.energy += 8
+                    self.energy += top * scale
                 else:
-                    self.energy += 1
+                    self.energy += side * scale
 
-    def update_water(self):
+    def update_water(self, scale=1):
         # Calculate the internal water pressure
         if self.water < self.wsat:
             pressure = PRESSURE_UNSATURATED
         else:
             pressure = PRESSURE_SATURATED + ((self.water - self.wsat) * SATURATED_PRESSURE_GRADIENT)
 
+        # Pumping forces build up over the ticks missed when updated less
+        # often, so use their average
+        pressure_gradient = self.pressure_gradient
+        if scale != 1:
+            pressure_gradient = [force / scale for force in pressure_gradient]
+
         # Calculate the pressure gradient on each face
         water_pressure = [
-            (pressure + self.pressure_gradient[direction] - self.water_pressure_external[direction]) * self.permeability
+            (pressure + pressure_gradient[direction] - self.water_pressure_external[direction]) * self.permeability
             for direction in range(len(Direction))
         ]
         water_pressure[Direction.BELOW.value] += self.water * self.permeability
 
+        # Make up for the ticks missed when updated less often
+        if scale != 1:
+            water_pressure = [flux * scale for flux in water_pressure]
+
         for direction in range(len(Direction)):
             self.flux[direction] = (water_pressure[direction])
             self.pressure_gradient[direction] = 0.0
@@ -94,4 +108,51 @@ class Plant(Cell):
             if self.energy > 10:
                 self.action_pump(Direction.ABOVE.value, 8)
 
-
+    @classmethod
+    def update_batch(cls, cells):
+        """
+        Update every cell of the species at once
+
+        Does the same as update() for each cell of a CellBatch, with the
+        leaf, shoot and root branches turned into masks.
+
+        Args:
+            cells CellBatch holding the cells
+        """
+        above = cells.neighbour(Direction.ABOVE)
+        below = cells.neighbour(Direction.BELOW)
+        air = CellType.AIR.value
+        soil = CellType.SOIL.value
+        plant = CellType.PLANT.value
+        earth_contact = True
+
+        # We're a leaf!
+        leaf = above == air
+        colour = np.zeros((np.count_nonzero(leaf), 4))
+        colour[:, 0] = 0.7
+        colour[:, 1] = np.maximum(0.4 - 0.4 * (cells.water[leaf] / 7), 0.0)
+        colour[:, 3] = 4
+        cells.set_colour(leaf, colour)
+        send = leaf & (cells.energy > 5) & (below == plant)
+        cells.action_send_energy(send, np.minimum(cells.energy[send] - 5, 5), Direction.BELOW)
+        cells.action_reproduce(leaf & (below == soil) & (cells.energy > 30) & (cells.water > 5),
+            Direction.BELOW)
+        cells.action_reproduce(leaf & earth_contact & (cells.energy > 30) & (cells.water > 7),
+            Direction.ABOVE)
+        cells.action_pump(leaf & (cells.energy > 40), Direction.BELOW.value, -8)
+
+        # We're a shoot!
+        shoot = (above == plant) & (below == plant)
+        cells.set_colour(shoot, (0.2, 0.8, 0, 4, 1.0))
+        pumping = shoot & (cells.energy > 10)
+        cells.action_pump(pumping, Direction.ABOVE.value, 8)
+        cells.action_pump(pumping, Direction.BELOW.value, -8)
+
+        # We're a root!
+        root = (above == plant) & (below != plant)
+        cells.set_colour(root, (0.4, 0.8, 0, 4, 1.0))
+        cells.action_reproduce(root & (below == soil) & (cells.energy > 30) & (cells.water > 5),
+            Direction.BELOW)
+        cells.action_reproduce(root & (above != plant) & (cells.energy > 30) & (cells.water > 7),
+            Direction.ABOVE)
+        cells.action_pump(root & (cells.energy > 10), Direction.ABOVE.value, 8)
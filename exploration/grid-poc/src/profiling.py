@@ -0,0 +1,146 @@
+#!/bin/python3
+# vim: et:ts=4:sts=4:sw=4
+
+# SPDX-License-Identifier: BSD-2-Clause
+# Copyright © 2024 The Alan Turing Institute
+
+# Profiling
+
+import json
+from time import perf_counter
+
+class Profiler():
+    """
+    Collects per-phase timings and operation counts for each tick
+
+    Attach a Profiler to a grid by setting grid.profiler. The grid then
+    passes each tick to tick(), which times every phase and records how
+    many cells it covered. Cell-level operations, such as reproductions and
+    iterations of the flux limiter, are counted using count().
+
+    At the end of each tick the record for that tick is passed to every
+    exporter. An exporter is any callable that accepts the record, a
+    dictionary of the form:
+
+        {
+            "tick": 12,
+            "phases": {"pressure": {"seconds": 0.01, "cells": 2048}, ...},
+            "counters": {"reproductions": 3, ...},
+        }
+
+    When grid.profiler is None none of this happens, and the only cost is
+    a single check per tick.
+    """
+
+    def __init__(self, exporters=None):
+        self.ticks = 0
+        self.seconds = {}
+        self.cells = {}
+        self.counters = {}
+        self.exporters = list(exporters or [])
+        self.tick_phases = {}
+        self.tick_counters = {}
+
+    def add_exporter(self, exporter):
+        """
+        Add a callable to be passed the record for each tick
+
+        Args:
+            exporter callable accepting a single dictionary
+        """
+        self.exporters.append(exporter)
+
+    def count(self, name, amount=1):
+        """
+        Count a cell-level operation
+
+        Args:
+            name of the counter
+            amount to add to the counter
+        """
+        self.tick_counters[name] = self.tick_counters.get(name, 0) + amount
+
+    def phase(self, name, seconds, cells):
+        """
+        Record the time taken by a phase
+
+        Args:
+            name of the phase
+            seconds taken by the phase
+            cells number of cells the phase covered
+        """
+        self.tick_phases[name] = {"seconds": seconds, "cells": cells}
+
+    def tick(self, phases, cells):
+        """
+        Perform and time one tick
+
+        Args:
+            phases list of (name, function) pairs as returned by grid.phases()
+            cells number of cells each phase covers, or a function that
+                returns it, called after the phase has run
+        """
+        for name, phase in phases:
+            start = perf_counter()
+            phase()
+            seconds = perf_counter() - start
+            self.phase(name, seconds, cells() if callable(cells) else cells)
+        self.end_tick()
+
+    def end_tick(self):
+        """
+        Finish the current tick
+
+        Adds the tick's figures to the totals and passes its record to the
+        exporters.
+        """
+        record = {
+            "tick": self.ticks,
+            "phases": self.tick_phases,
+            "counters": self.tick_counters,
+        }
+        for name, phase in self.tick_phases.items():
+            self.seconds[name] = self.seconds.get(name, 0.0) + phase["seconds"]
+            self.cells[name] = self.cells.get(name, 0) + phase["cells"]
+        for name, amount in self.tick_counters.items():
+            self.counters[name] = self.counters.get(name, 0) + amount
+        self.ticks += 1
+        self.tick_phases = {}
+        self.tick_counters = {}
+        for exporter in self.exporters:
+            exporter(record)
+
+    def report(self):
+        """
+        Summarise everything recorded so far
+
+        Returns:
+            Dictionary holding the number of ticks, the mean time and cell
+            count of each phase per tick, and the counter totals
+        """
+        ticks = max(self.ticks, 1)
+        return {
+            "ticks": self.ticks,
+            "phases": {
+                name: {
+                    "seconds": self.seconds[name] / ticks,
+                    "cells": self.cells[name] / ticks,
+                }
+                for name in self.seconds
+            },
+            "counters": dict(self.counters),
+        }
+
+class JsonLinesExporter():
+    """
+    Writes the record for each tick to a file as a line of JSON
+    """
+
+    def __init__(self, filename):
+        self.output = open(filename, "w")
+
+    def __call__(self, record):
+        self.output.write(json.dumps(record) + "\n")
+
+    def close(self):
+        self.output.close()
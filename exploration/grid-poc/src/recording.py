@@ -0,0 +1,305 @@
+#!/bin/python3
+# vim: et:ts=4:sts=4:sw=4
+
+# SPDX-License-Identifier: BSD-2-Clause
+# Copyright © 2024 The Alan Turing Institute
+
+# Recording
+
+import json
+import os
+import struct
+import zlib
+import numpy as np
+
+MAGIC = b"PWREC1"
+# Magic and length of the JSON header
+PREAMBLE = struct.Struct("<6sI")
+# Kind, tick, number of cells and compressed length of each frame
+FRAME = struct.Struct("<cIII")
+KEYFRAME = b"K"
+DELTA = b"D"
+
+def quantise(values):
+    """
+    Reduce water or energy values to the precision stored in a recording
+
+    Values too large to be stored become infinite.
+
+    Args:
+        values array of values
+
+    Returns:
+        float16 array
+    """
+    with np.errstate(over="ignore"):
+        return np.asarray(values, dtype=np.float64).astype(np.float16)
+
+def quantise_colours(colours):
+    """
+    Reduce RGBA colours between 0 and 1 to bytes
+
+    Args:
+        colours (N, 4) array of colours
+
+    Returns:
+        (N, 4) uint8 array
+    """
+    colours = np.multiply(colours, 255, dtype=np.float32)
+    return np.clip(colours, 0, 255, out=colours).astype(np.uint8)
+
+class Recorder():
+    """
+    Streams the state of a world to a file, one tick at a time
+
+    For each tick only the cells whose type, quantised water or energy, or
+    colour changed are written, compressed. Every so often a keyframe
+    holding every cell is written instead, so that a Replay can jump to any
+    tick without reading the whole file.
+
+    The recorder keeps its own copy of the recorded state, so only the
+    cells that might have changed need to be passed to record(); the rest
+    are taken to be as they were.
+    """
+
+    def __init__(self, filename, width, depth, height, keyframe_every=100, level=1):
+        self.size = width * depth * height
+        self.keyframe_every = keyframe_every
+        self.level = level
+        self.output = open(filename, "wb")
+        header = json.dumps({
+            "width": width,
+            "depth": depth,
+            "height": height,
+            "keyframe_every": keyframe_every,
+        }).encode()
+        self.output.write(PREAMBLE.pack(MAGIC, len(header)))
+        self.output.write(header)
+
+        self.started = False
+        self.last_keyframe = 0
+        # State as recorded
+        self.cell_type = np.zeros(self.size, dtype=np.int8)
+        self.water = np.zeros(self.size, dtype=np.float16)
+        self.energy = np.zeros(self.size, dtype=np.float16)
+        self.colours = np.zeros((self.size, 4), dtype=np.uint8)
+        # State as passed in, so that only cells whose values have moved
+        # need to be quantised
+        self.raw_water = np.zeros(self.size)
+        self.raw_energy = np.zeros(self.size)
+        self.raw_colours = np.zeros((self.size, 4))
+
+    def write_frame(self, kind, tick, indices):
+        """
+        Write a frame holding the recorded state of some cells
+
+        Args:
+            kind KEYFRAME or DELTA
+            tick number of the tick
+            indices array of the cells to write, or None for all of them
+        """
+        parts = []
+        if indices is None:
+            count = self.size
+            parts.append(self.cell_type)
+            parts.extend((self.water, self.energy, self.colours))
+        else:
+            count = len(indices)
+            parts.append(indices.astype(np.uint32))
+            parts.extend((self.cell_type[indices], self.water[indices], self.energy[indices],
+                self.colours[indices]))
+        payload = zlib.compress(b"".join(part.tobytes() for part in parts), self.level)
+        self.output.write(FRAME.pack(kind, tick, count, len(payload)))
+        self.output.write(payload)
+
+    def record(self, tick, cell_type, water, energy, colours, indices=None):
+        """
+        Record the state of the world after a tick
+
+        The first call must cover every cell.
+
+        Args:
+            tick number of the tick
+            cell_type, water, energy, colours state of the cells given by
+                indices, as arrays
+            indices array of the cells that might have changed, or None for
+                every cell
+        """
+        if indices is None:
+            indices = slice(None)
+        elif not self.started:
+            raise ValueError("The first tick recorded must include every cell")
+        else:
+            indices = np.asarray(indices, dtype=np.intp)
+        cell_type = np.asarray(cell_type, dtype=np.int8)
+        water = np.asarray(water, dtype=np.float64)
+        energy = np.asarray(energy, dtype=np.float64)
+        colours = np.asarray(colours, dtype=np.float64)
+
+        if not self.started or tick - self.last_keyframe >= self.keyframe_every:
+            self.raw_water[indices] = water
+            self.raw_energy[indices] = energy
+            self.raw_colours[indices] = colours
+            self.cell_type[indices] = cell_type
+            self.water[indices] = quantise(water)
+            self.energy[indices] = quantise(energy)
+            self.colours[indices] = quantise_colours(colours)
+            self.write_frame(KEYFRAME, tick, None)
+            self.started = True
+            self.last_keyframe = tick
+            return
+
+        # Cells whose values have moved at all since they were last passed
+        moved = self.cell_type[indices] != cell_type
+        moved |= self.raw_water[indices] != water
+        moved |= self.raw_energy[indices] != energy
+        # One word per cell, non-zero if any channel differs
+        moved |= (self.raw_colours[indices] != colours).view(np.uint32).reshape(-1) != 0
+        moved = np.flatnonzero(moved)
+        if isinstance(indices, slice):
+            cells = moved
+        else:
+            cells = indices[moved]
+        self.raw_water[cells] = water = water[moved]
+        self.raw_energy[cells] = energy = energy[moved]
+        self.raw_colours[cells] = colours = colours[moved]
+        cell_type = cell_type[moved]
+        water = quantise(water)
+        energy = quantise(energy)
+        colours = quantise_colours(colours)
+
+        # Of those, the cells whose recorded values have changed
+        changed = self.cell_type[cells] != cell_type
+        changed |= self.water[cells].view(np.uint16) != water.view(np.uint16)
+        changed |= self.energy[cells].view(np.uint16) != energy.view(np.uint16)
+        changed |= self.colours[cells].view(np.uint32).reshape(-1) != colours.view(np.uint32).reshape(-1)
+        changed = np.flatnonzero(changed)
+        cells = cells[changed]
+        self.cell_type[cells] = cell_type[changed]
+        self.water[cells] = water[changed]
+        self.energy[cells] = energy[changed]
+        self.colours[cells] = colours[changed]
+        self.write_frame(DELTA, tick, cells)
+
+    def close(self):
+        self.output.close()
+
+class Replay():
+    """
+    Plays back a recording made by a Recorder
+
+    The frame headers are read when the recording is opened, to find the
+    ticks it covers and where each keyframe is, but the cell data is only
+    read as it's needed. Seeking goes to the nearest keyframe at or before
+    the tick and then applies the deltas that follow it.
+
+    The state of the world at the current tick is held in the cell_type,
+    water, energy and colours arrays, in grid order.
+    """
+
+    def __init__(self, filename):
+        self.source = open(filename, "rb")
+        magic, length = PREAMBLE.unpack(self.source.read(PREAMBLE.size))
+        if magic != MAGIC:
+            raise ValueError("Not a recording: {}".format(filename))
+        header = json.loads(self.source.read(length))
+        self.width = header["width"]
+        self.depth = header["depth"]
+        self.height = header["height"]
+        self.size = self.width * self.depth * self.height
+
+        # Tick, kind, cell count and file position of each frame. A frame
+        # cut short by a recording that didn't finish is ignored.
+        end = os.fstat(self.source.fileno()).st_size
+        self.frames = []
+        while True:
+            position = self.source.tell()
+            data = self.source.read(FRAME.size)
+            if len(data) < FRAME.size:
+                break
+            kind, tick, count, length = FRAME.unpack(data)
+            if position + FRAME.size + length > end:
+                break
+            self.frames.append((tick, kind, count, position))
+            self.source.seek(length, 1)
+        if not self.frames or self.frames[0][1] != KEYFRAME:
+            raise ValueError("Recording has no frames: {}".format(filename))
+        self.ticks = [frame[0] for frame in self.frames]
+
+        self.position = -1
+        self.cell_type = np.zeros(self.size, dtype=np.int8)
+        self.water = np.zeros(self.size, dtype=np.float16)
+        self.energy = np.zeros(self.size, dtype=np.float16)
+        self.colours = np.zeros((self.size, 4), dtype=np.uint8)
+        self.seek(self.ticks[0])
+
+    @property
+    def tick(self):
+        """
+        The tick the current state belongs to
+        """
+        return self.frames[self.position][0]
+
+    def read_frame(self, position):
+        """
+        Apply a frame to the current state
+
+        Args:
+            position index of the frame in self.frames
+        """
+        tick, kind, count, offset = self.frames[position]
+        self.source.seek(offset)
+        _, _, _, length = FRAME.unpack(self.source.read(FRAME.size))
+        payload = zlib.decompress(self.source.read(length))
+        if kind == KEYFRAME:
+            indices = slice(None)
+            start = 0
+        else:
+            indices = np.frombuffer(payload, dtype=np.uint32, count=count)
+            start = 4 * count
+        cell_type = np.frombuffer(payload, dtype=np.int8, count=count, offset=start)
+        start += count
+        water = np.frombuffer(payload, dtype=np.float16, count=count, offset=start)
+        start += 2 * count
+        energy = np.frombuffer(payload, dtype=np.float16, count=count, offset=start)
+        start += 2 * count
+        colours = np.frombuffer(payload, dtype=np.uint8, count=4 * count, offset=start).reshape(count, 4)
+        self.cell_type[indices] = cell_type
+        self.water[indices] = water
+        self.energy[indices] = energy
+        self.colours[indices] = colours
+        self.position = position
+
+    def step(self):
+        """
+        Move on to the next tick
+
+        Returns:
+            False if the end of the recording has been reached
+        """
+        if self.position + 1 >= len(self.frames):
+            return False
+        self.read_frame(self.position + 1)
+        return True
+
+    def seek(self, tick):
+        """
+        Move to a tick
+
+        Args:
+            tick to move to; ticks that weren't recorded go to the last
+                recorded tick before them
+        """
+        target = max(np.searchsorted(self.ticks, tick, side="right") - 1, 0)
+        if not (0 <= self.position <= target):
+            self.position = -1
+        start = self.position + 1
+        for position in range(target, start - 1, -1):
+            if self.frames[position][1] == KEYFRAME:
+                start = position
+                break
+        for position in range(start, target + 1):
+            self.read_frame(position)
+
+    def close(self):
+        self.source.close()
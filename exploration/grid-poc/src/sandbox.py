@@ -0,0 +1,457 @@
+#!/bin/python3
+# vim: et:ts=4:sts=4:sw=4
+
+# SPDX-License-Identifier: BSD-2-Clause
+# Copyright © 2024 The Alan Turing Institute
+
+# Sandboxed species
+
+import importlib
+import os
+import pickle
+import select
+import struct
+import subprocess
+import sys
+from multiprocessing.connection import Connection
+from time import monotonic
+import numpy as np
+
+from src.cells import (
+    Direction,
+    CellType,
+)
+from src.batch import (
+    batched,
+    CellBatch,
+    posted,
+)
+
+FACES = len(Direction)
+TYPES = {cell_type.value: cell_type for cell_type in CellType}
+
+# Sensors sent to a bot each tick, by CellBatch argument
+INPUTS = (
+    "indices",
+    "water",
+    "energy",
+    "neighbour_type",
+    "pressure_gradient",
+    "colours",
+    "permeability",
+    "water_pressure_external",
+    "signal",
+)
+
+# Actions sent back by a bot, by CellBatch attribute, with their type and
+# the shape of each cell's value
+OUTPUTS = (
+    ("energy", np.float64, ()),
+    ("pressure_gradient", np.float64, (FACES,)),
+    ("energy_outgoing", np.float64, (FACES,)),
+    ("reproduce", np.bool_, (FACES,)),
+    ("colours", np.float64, (4,)),
+    ("permeability", np.float64, ()),
+    ("signal_out", np.float32, (FACES,)),
+)
+
+# First byte of each reply
+OK, ERROR = b"\0", b"\1"
+
+def species_path(species):
+    """
+    Returns the import path of a species class, e.g. "src.plants.Plant"
+    """
+    return "{}.{}".format(species.__module__, species.__qualname__)
+
+def reply_size(count):
+    """
+    Returns the length of the actions sent back for a number of cells
+    """
+    return sum(np.dtype(dtype).itemsize * int(np.prod(shape, dtype=np.int64)) for _, dtype, shape in OUTPUTS) * count
+
+def update_each(species, cells):
+    """
+    Update a batch of cells of a species without a batched program
+
+    Each cell is loaded into a new Plant object, updated and its actions
+    copied back, much as ArrayGrid does. Unlike ArrayGrid, the objects are
+    thrown away afterwards, so state a species keeps in its cells doesn't
+    last from tick to tick. A cell's incoming messages only carry the
+    signals posted by batched programs, and the messages it sends are lost.
+
+    Args:
+        species the Plant subclass
+        cells CellBatch holding the cells
+    """
+    for row in range(len(cells)):
+        plant = species()
+        plant.water = float(cells.water[row])
+        plant.energy = float(cells.energy[row])
+        plant.neighbour_type = [TYPES[value] for value in cells.neighbour_type[row].tolist()]
+        plant.incoming = [posted(signal) for signal in cells.signal[row].tolist()]
+        plant.pressure_gradient = cells.pressure_gradient[row].tolist()
+        plant.water_pressure_external = cells.water_pressure_external[row].tolist()
+        plant.energy_outgoing = [0] * FACES
+        plant.reproduce = [False] * FACES
+        plant.colour = tuple(cells.colours[row].tolist())
+
+        plant.update()
+
+        cells.energy[row] = plant.energy
+        cells.pressure_gradient[row] = plant.pressure_gradient
+        cells.energy_outgoing[row] = plant.energy_outgoing
+        cells.reproduce[row] = [bool(flag) for flag in plant.reproduce]
+        cells.colours[row] = plant.colour[:4]
+
+class Bot():
+    """
+    A worker process running the program of one species
+
+    The species is loaded by import path in a Python process of its own. It
+    is sent the sensors of all of its cells in one message each tick and
+    replies with all of their actions, so the cost of passing messages is
+    paid once per species rather than once per cell.
+
+    The reply is raw arrays rather than a pickle, since the species can't be
+    trusted, and is checked before it's used. A bot that takes longer than
+    its time limit, crashes or sends back something invalid is stopped for
+    good, and its cells take no more actions. Cells may only pump as hard
+    as the species' max_force, and only by paying the energy the pump
+    takes, see Cell.action_pump.
+    """
+
+    def __init__(self, species, time_limit=1.0, memory_limit=None, start_limit=60.0):
+        """
+        Start the worker process and wait for it to load the species
+
+        Args:
+            species the Plant subclass
+            time_limit seconds the bot has to reply each tick
+            memory_limit bytes of memory the worker process may use, or None
+                for no limit
+            start_limit seconds the bot has to load the species
+        """
+        self.species = species
+        self.name = species_path(species)
+        self.time_limit = time_limit
+        self.failure = None
+
+        # The worker sees the same modules as this process
+        directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        environment = dict(os.environ)
+        environment["PYTHONPATH"] = os.pathsep.join(path for path in [directory] + sys.path if path)
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "src.sandbox", self.name, str(memory_limit or 0)],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, cwd=directory, env=environment)
+        self.requests = Connection(os.dup(self.process.stdin.fileno()), readable=False)
+        self.replies = Connection(os.dup(self.process.stdout.fileno()), writable=False)
+        self.process.stdin.close()
+        self.process.stdout.close()
+        # Requests are written as the pipe takes them, see write()
+        os.set_blocking(self.requests.fileno(), False)
+        self.receive(1, start_limit, "loading")
+
+    def write(self, data, deadline):
+        """
+        Send bytes to the worker
+
+        Args:
+            data bytes to send
+            deadline monotonic() time by which they must all have been
+                taken by the pipe
+
+        Raises:
+            TimeoutError if they haven't, or OSError if the worker exited
+        """
+        fd = self.requests.fileno()
+        data = memoryview(data)
+        while len(data):
+            remaining = deadline - monotonic()
+            if remaining <= 0 or not select.select([], [fd], [], remaining)[1]:
+                raise TimeoutError
+            try:
+                data = data[os.write(fd, data):]
+            except BlockingIOError:
+                pass
+
+    def send(self, request, deadline):
+        """
+        Send a request to the worker, framed as by Connection.send()
+
+        A bot that stops reading would otherwise hold up the match once the
+        request is larger than the pipe can buffer.
+
+        Args:
+            request object to pickle and send
+            deadline monotonic() time by which it must have been sent
+
+        Raises:
+            TimeoutError if it hasn't, or OSError if the worker exited
+        """
+        data = pickle.dumps(request, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(data) > 0x7fffffff:
+            header = struct.pack("!iQ", -1, len(data))
+        else:
+            header = struct.pack("!i", len(data))
+        self.write(header + data, deadline)
+
+    def read(self, count, deadline):
+        """
+        Returns the next bytes sent by the worker
+
+        Args:
+            count number of bytes to read
+            deadline monotonic() time by which they must all have arrived
+
+        Raises:
+            TimeoutError if they haven't, or EOFError if the worker exited
+        """
+        fd = self.replies.fileno()
+        data = bytearray()
+        while len(data) < count:
+            remaining = deadline - monotonic()
+            if remaining <= 0 or not select.select([fd], [], [], remaining)[0]:
+                raise TimeoutError
+            chunk = os.read(fd, count - len(data))
+            if not chunk:
+                raise EOFError
+            data += chunk
+        return bytes(data)
+
+    def receive(self, length, limit, doing, deadline=None):
+        """
+        Returns the next reply from the worker, or None if it failed
+
+        The reply, framed as by Connection.send_bytes(), is read as it
+        arrives rather than with recv_bytes(), which would wait for the rest
+        of it however long it took once the first byte had arrived.
+
+        Args:
+            length number of bytes expected, including the status byte
+            limit seconds to wait for it
+            doing what the worker is doing, for the failure message
+            deadline monotonic() time by which it must have arrived, if
+                the time limit started earlier
+        """
+        if deadline is None:
+            deadline = monotonic() + limit
+        try:
+            size, = struct.unpack("!i", self.read(4, deadline))
+            if size == -1:
+                size, = struct.unpack("!Q", self.read(8, deadline))
+            if not 0 <= size <= max(length, 4096):
+                return self.fail("sent an invalid reply while {}".format(doing))
+            reply = self.read(size, deadline)
+        except TimeoutError:
+            return self.fail("took longer than {}s {}".format(limit, doing))
+        except (EOFError, OSError):
+            return self.fail("exited while {}".format(doing))
+        if reply[:1] == ERROR:
+            return self.fail(reply[1:].decode("utf-8", "replace"))
+        if reply[:1] != OK or len(reply) != length:
+            return self.fail("sent an invalid reply while {}".format(doing))
+        return reply
+
+    def update(self, cells):
+        """
+        Update a batch of cells of the species
+
+        Args:
+            cells CellBatch holding the cells, to which the actions are
+                applied
+
+        Returns:
+            True if the bot replied in time, otherwise the cells are left
+            unchanged and False is returned
+        """
+        if self.failure is not None:
+            return False
+        # The time limit covers sending the cells as well as the reply
+        deadline = monotonic() + self.time_limit
+        try:
+            self.send({name: getattr(cells, name) for name in INPUTS}, deadline)
+        except TimeoutError:
+            return self.fail("took longer than {}s reading its cells".format(self.time_limit))
+        except OSError:
+            return self.fail("exited")
+        reply = self.receive(1 + reply_size(len(cells)), self.time_limit, "updating", deadline)
+        if reply is None:
+            return False
+
+        actions = {}
+        offset = 1
+        for name, dtype, shape in OUTPUTS:
+            shape = (len(cells),) + shape
+            count = int(np.prod(shape, dtype=np.int64))
+            actions[name] = np.frombuffer(reply, dtype=dtype, count=count, offset=offset).reshape(shape)
+            offset += count * np.dtype(dtype).itemsize
+
+        # Cells can spend energy but not make it, and a pump takes all of
+        # the energy a cell has left, so a cell that pumped has none
+        energy, outgoing = actions["energy"], actions["energy_outgoing"]
+        spent = cells.energy - energy - outgoing.sum(axis=1)
+        tolerance = 1e-9 * np.maximum(np.abs(cells.energy), 1.0)
+        pumped = (actions["pressure_gradient"] != cells.pressure_gradient).any(axis=1)
+        valid = (
+            all(np.isfinite(values).all() for values in actions.values() if values.dtype != np.bool_)
+            and (actions["reproduce"].view(np.uint8) <= 1).all()
+            and (outgoing >= 0).all()
+            and (spent >= -tolerance).all()
+            and (np.abs(energy[pumped]) <= tolerance[pumped]).all()
+        )
+        if not valid:
+            return self.fail("sent invalid actions")
+
+        limit = self.species.max_force
+        maximum = getattr(self.species, "max_permeability", self.species.permeability)
+        cells.energy[:] = energy
+        before = cells.pressure_gradient
+        cells.pressure_gradient[:] = np.clip(actions["pressure_gradient"], before - limit, before + limit)
+        cells.energy_outgoing[:] = outgoing
+        cells.reproduce[:] = actions["reproduce"]
+        cells.colours[:] = actions["colours"]
+        cells.permeability[:] = np.clip(actions["permeability"], 0.0, maximum)
+        cells.signal_out[:] = actions["signal_out"]
+        return True
+
+    def fail(self, reason):
+        """
+        Stop the bot for good
+
+        Args:
+            reason why, kept in the failure attribute
+        """
+        self.failure = reason
+        self.close()
+
+    def close(self):
+        """
+        Stop the worker process
+        """
+        if self.process.poll() is None:
+            self.process.kill()
+        self.process.wait()
+        self.requests.close()
+        self.replies.close()
+
+class Sandbox():
+    """
+    Runs the program of each plant species in a worker process of its own
+
+    Set as the sandbox of an ArrayGrid, every species is updated by its bot,
+    see Bot, rather than in the grid's own process. So a species that's
+    slow, hangs or crashes only stops its own cells. The species must be
+    importable by path, and is still imported by the grid's process to place
+    its seeds.
+
+    Matches that run within their time limits give the same results as
+    without a sandbox for species with a batched program. A species without
+    one is updated by update_each(), so it only gives the same results if
+    it keeps no state on its plants and sends no messages.
+    """
+
+    def __init__(self, time_limit=1.0, memory_limit=None):
+        """
+        Args:
+            time_limit seconds each bot has to reply each tick
+            memory_limit bytes of memory each bot may use, or None for no
+                limit
+        """
+        self.time_limit = time_limit
+        self.memory_limit = memory_limit
+        self.bots = {}
+
+    def start(self, species):
+        """
+        Start the bots for some species ahead of the first tick
+
+        Args:
+            species iterable of Plant subclasses
+        """
+        for cls in species:
+            self.bot(cls)
+
+    def bot(self, species):
+        """
+        Returns the bot for a species, starting it if need be
+        """
+        if species not in self.bots:
+            self.bots[species] = Bot(species, self.time_limit, self.memory_limit)
+        return self.bots[species]
+
+    def update(self, species, cells):
+        """
+        Update a batch of cells of a species using its bot
+
+        Args:
+            species the Plant subclass
+            cells CellBatch holding the cells
+
+        Returns:
+            True if the bot replied in time
+        """
+        return self.bot(species).update(cells)
+
+    def failure(self, species):
+        """
+        Returns why a species' bot was stopped, or None if it wasn't
+        """
+        bot = self.bots.get(species)
+        return bot.failure if bot is not None else None
+
+    def close(self):
+        """
+        Stop every bot, keeping the reasons any were stopped before
+        """
+        for bot in self.bots.values():
+            if bot.failure is None:
+                bot.close()
+
+def serve(name, memory_limit=0):
+    """
+    Run a bot, reading requests on stdin and writing replies to stdout
+
+    Output written by the species goes to stderr instead.
+
+    Args:
+        name import path of the species
+        memory_limit bytes of memory the process may use, or 0 for no limit
+    """
+    requests = Connection(0, writable=False)
+    replies = Connection(os.dup(1), readable=False)
+    os.dup2(2, 1)
+    if memory_limit:
+        import resource
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+
+    try:
+        module, _, cls = name.rpartition(".")
+        species = getattr(importlib.import_module(module), cls)
+    except Exception as error:
+        replies.send_bytes(ERROR + "couldn't load {}: {!r}".format(name, error).encode("utf-8"))
+        return
+    replies.send_bytes(OK)
+
+    while True:
+        try:
+            request = requests.recv()
+        except EOFError:
+            return
+        try:
+            cells = CellBatch(**request)
+            if batched(species):
+                species.update_batch(cells)
+            else:
+                update_each(species, cells)
+            reply = b"".join(
+                np.ascontiguousarray(getattr(cells, name), dtype=dtype).tobytes()
+                for name, dtype, _ in OUTPUTS
+            )
+        except Exception as error:
+            replies.send_bytes(ERROR + "raised {!r}".format(error).encode("utf-8"))
+            continue
+        replies.send_bytes(OK + reply)
+
+if __name__ == "__main__":
+    serve(sys.argv[1], int(sys.argv[2]))
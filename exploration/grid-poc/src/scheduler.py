@@ -0,0 +1,73 @@
+#!/bin/python3
+# vim: et:ts=4:sts=4:sw=4
+
+# SPDX-License-Identifier: BSD-2-Clause
+# Copyright © 2024 The Alan Turing Institute
+
+# Scheduler
+
+class Schedule():
+    """
+    How often each subsystem of the world is updated
+
+    Each subsystem runs on its own period, given in world ticks, and runs on
+    the ticks that are a multiple of its period. A period of 1 means every
+    tick. The subsystems are:
+
+        water: the flow of water out of Soil cells
+        pumping: the flow of water out of Plant cells, including pumping
+        sunlight: the energy Plant cells gain from the sun
+        reproduction: Plant cells growing into their neighbours
+
+    When a subsystem runs less often it makes up for the ticks it missed.
+    Water flows are multiplied by the period, pumping forces applied on
+    the missed ticks are averaged over the period, and sunlight is
+    multiplied by the period. Reproduction intentions are only acted on
+    when they're made on a reproduction tick.
+
+    This trades hydrology fidelity for throughput, for example during long
+    tournament runs.
+    """
+    SUBSYSTEMS = ("water", "pumping", "sunlight", "reproduction")
+
+    def __init__(self, water=1, pumping=1, sunlight=1, reproduction=1):
+        self.periods = {
+            "water": water,
+            "pumping": pumping,
+            "sunlight": sunlight,
+            "reproduction": reproduction,
+        }
+        for subsystem, period in self.periods.items():
+            if period < 1:
+                raise ValueError("Period for {} must be at least 1: {}".format(subsystem, period))
+
+    def period(self, subsystem):
+        """
+        Returns the period of a subsystem in ticks
+
+        Args:
+            subsystem name of the subsystem
+
+        Returns:
+            Number of ticks between updates of the subsystem
+        """
+        return self.periods[subsystem]
+
+    def due(self, subsystem, tick):
+        """
+        Returns whether a subsystem runs on a given tick
+
+        Args:
+            subsystem name of the subsystem
+            tick number of the world tick, starting from zero
+
+        Returns:
+            True if the subsystem should be updated on this tick
+        """
+        return tick % self.periods[subsystem] == 0
+
+    def every_tick(self):
+        """
+        Returns whether every subsystem runs on every tick
+        """
+        return all(period == 1 for period in self.periods.values())
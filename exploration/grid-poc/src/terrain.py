@@ -0,0 +1,58 @@
+#!/bin/python3
+# vim: et:ts=4:sts=4:sw=4
+
+# SPDX-License-Identifier: BSD-2-Clause
+# Copyright © 2024 The Alan Turing Institute
+
+# Terrain
+
+import numpy as np
+
+def terrain(first, last, depth, height, peak_x, peak_y, spread):
+    """
+    Lay out the rock and soil of some x slabs of the world
+
+    The land is a Gaussian hill with two layers of soil over rock, and a
+    floor of rock along the bottom of the world. The whole range of slabs
+    is laid out at once, so a large world can be built a chunk at a time
+    without a Python call for each cell.
+
+    Args:
+        first, last range of x slabs, last being exclusive
+        depth, height dimensions of the world
+        peak_x, peak_y position of the top of the hill
+        spread width of the hill
+
+    Returns:
+        Tuple of boolean (last - first, depth, height) arrays picking out
+        the Rock and the Soil cells; the rest are Air
+    """
+    amplitude = (2.5 * height) / 4
+    z = np.arange(height)
+    # Heights are measured as z - (height / 2) / (height / 2), which is
+    # one below z
+    znorm = z - (height / 2.0) / (height / 2.0)
+    x, y = np.meshgrid(np.arange(first, last, dtype=np.float64), np.arange(depth, dtype=np.float64),
+        indexing="ij")
+    # The surface is indexed [x][y] but generated from a meshgrid with x
+    # along its rows, so its axes are the other way round
+    surface = amplitude * np.exp(-((y - peak_x) ** 2 / (2 * spread ** 2)
+        + (x - peak_y) ** 2 / (2 * spread ** 2)))
+    level = (surface - 1)[:, :, None]
+    rock = (z == 0) | (znorm < level)
+    soil = ~rock & (znorm < level + 2)
+    return rock, soil
+
+def topsoil(soil):
+    """
+    Returns the height of the top Soil cell of each column
+
+    Args:
+        soil boolean (..., height) array of the Soil cells
+
+    Returns:
+        Array of the height of the top Soil cell of each column, or -1 for
+        a column without soil
+    """
+    height = soil.shape[-1]
+    return np.where(soil.any(axis=-1), height - 1 - np.argmax(soil[..., ::-1], axis=-1), -1)
@@ -0,0 +1,201 @@
+#!/bin/python3
+# vim: et:ts=4:sts=4:sw=4
+
+# SPDX-License-Identifier: BSD-2-Clause
+# Copyright © 2024 The Alan Turing Institute
+
+# Topology
+
+from functools import cached_property, lru_cache
+import numpy as np
+
+from src.cells import (
+    Direction,
+)
+
+from src.utils import (
+    OPPOSITE,
+)
+
+# Co-ordinate step for each direction, indexed by Direction value
+STEPS = (
+    (-1, 0, 0),
+    (1, 0, 0),
+    (0, 0, -1),
+    (0, 0, 1),
+    (0, -1, 0),
+    (0, 1, 0),
+)
+
+class Topology():
+    """
+    Neighbour tables for a grid of a given size
+
+    Cells are stored in a flat list or array, with cell (x, y, z) at index
+    (x * depth + y) * height + z. This is the same order in which the grid
+    is traversed, so the flat order matches the nested x, y, z loops.
+
+    Storage holds one more entry than there are cells. The extra entry at
+    index 'ghost' is a ghost cell that pads the edges of the world. When the
+    grid is periodic the neighbour tables wrap in all directions and nothing
+    refers to the ghost. When it isn't, faces on the edge of the world refer
+    to the ghost cell instead, so lookups never need bounds checks or
+    modulo arithmetic. The ghost's own neighbours are all the ghost.
+
+    Instances are shared between grids of the same size, so should be
+    obtained using topology() rather than constructed directly.
+    """
+    opposite = OPPOSITE
+
+    def __init__(self, width, depth, height, periodic=True, tables=True):
+        self.width = width
+        self.depth = depth
+        self.height = height
+        self.periodic = periodic
+        self.size = width * depth * height
+        self.ghost = self.size
+        self.storage = self.size + 1
+
+        # Worlds too large to hold in memory work out their neighbours a
+        # chunk at a time, see neighbour_table()
+        self.neighbours = None
+        if not tables:
+            return
+
+        neighbours = np.full((self.storage, len(Direction)), self.ghost, dtype=np.intp)
+        neighbours[:self.size] = neighbour_table(width, depth, height, periodic, 0, self.size)
+
+        # (storage, 6) array of neighbour indices for vectorised code
+        self.neighbours = neighbours
+        neighbours.setflags(write=False)
+
+    @cached_property
+    def rows(self):
+        """
+        The neighbour table as a tuple of tuples for per-cell code, or None
+        without tables
+
+        Only Grid uses it, so it's built the first time it's needed rather
+        than slowing down the creation of array grids. The rows share one
+        int object per index to keep them small.
+        """
+        if self.neighbours is None:
+            return None
+        indices = list(range(self.storage))
+        return tuple(tuple(indices[neighbour] for neighbour in row) for row in self.neighbours.tolist())
+
+    def index(self, x, y, z):
+        """
+        Returns the flat index of a cell
+
+        For a periodic grid the co-ordinates wrap in all directions. Otherwise
+        co-ordinates outside the grid return the index of the ghost cell.
+
+        Args:
+            x, y, z: the co-ordinate of the cell
+
+        Returns:
+            Flat index of the cell
+        """
+        if self.periodic:
+            x = x % self.width
+            y = y % self.depth
+            z = z % self.height
+        elif not (0 <= x < self.width and 0 <= y < self.depth and 0 <= z < self.height):
+            return self.ghost
+        return (x * self.depth + y) * self.height + z
+
+    def coordinates(self, index):
+        """
+        Returns the co-ordinates of a cell
+
+        Args:
+            index: flat index of the cell
+
+        Returns:
+            Tuple (x, y, z) of the cell's co-ordinates
+        """
+        index, z = divmod(index, self.height)
+        x, y = divmod(index, self.depth)
+        return (x, y, z)
+
+def flat_index(width, depth, height, periodic, x, y, z):
+    """
+    Returns the flat indices of cells from their co-ordinates
+
+    Args:
+        width, depth, height: the dimensions of the grid
+        periodic whether the grid wraps at its edges
+        x, y, z: arrays of the co-ordinates of the cells, which may be
+            outside the grid
+
+    Returns:
+        Array of flat indices, wrapping around the edges of a periodic grid
+        and using the index of the ghost cell for co-ordinates outside a
+        grid that doesn't wrap
+    """
+    if periodic:
+        return ((x % width) * depth + (y % depth)) * height + (z % height)
+    inside = (
+        (x >= 0) & (x < width)
+        & (y >= 0) & (y < depth)
+        & (z >= 0) & (z < height)
+    )
+    return np.where(inside, (x * depth + y) * height + z, width * depth * height)
+
+def neighbour_table(width, depth, height, periodic, start, stop):
+    """
+    Returns the neighbour indices of a range of cells
+
+    Args:
+        width, depth, height: the dimensions of the grid
+        periodic whether the grid wraps at its edges
+        start, stop: the range of flat indices of the cells
+
+    Returns:
+        (stop - start, 6) array of neighbour indices, using the index of the
+        ghost cell for faces on the edge of a world that doesn't wrap
+    """
+    index = np.arange(start, stop)
+    index, z = np.divmod(index, height)
+    x, y = np.divmod(index, depth)
+    table = np.empty((stop - start, len(Direction)), dtype=np.intp)
+    for direction, (dx, dy, dz) in enumerate(STEPS):
+        table[:, direction] = flat_index(width, depth, height, periodic, x + dx, y + dy, z + dz)
+    return table
+
+def neighbours_of(width, depth, height, periodic, indices, directions):
+    """
+    Returns the neighbour of each of some cells across one of its faces
+
+    Args:
+        width, depth, height: the dimensions of the grid
+        periodic whether the grid wraps at its edges
+        indices array of flat indices of the cells
+        directions array of the Direction value of the face of each cell
+
+    Returns:
+        Array of neighbour indices, using the index of the ghost cell for
+        faces on the edge of a world that doesn't wrap
+    """
+    index, z = np.divmod(np.asarray(indices, dtype=np.intp), height)
+    x, y = np.divmod(index, depth)
+    dx, dy, dz = np.array(STEPS, dtype=np.intp)[directions].T
+    return flat_index(width, depth, height, periodic, x + dx, y + dy, z + dz)
+
+@lru_cache(maxsize=None)
+def topology(width, depth, height, periodic=True, tables=True):
+    """
+    Returns the Topology for a grid of the given size
+
+    The tables are built the first time a size is requested and then shared.
+
+    Args:
+        width, depth, height: the dimensions of the grid
+        periodic whether the grid wraps at its edges
+        tables whether to build the neighbour tables
+
+    Returns:
+        Topology for the grid
+    """
+    return Topology(width, depth, height, periodic, tables)
@@ -10,14 +10,18 @@ from src.cells import (
     Direction,
 )
 
-def opposite(direction):
-    return [
-        Direction.RIGHT,
-        Direction.LEFT,
-        Direction.ABOVE,
-        Direction.BELOW,
-        Direction.BEHIND,
-        Direction.FRONT
-    ][direction]
+# The value of the opposite direction, indexed by Direction value
+OPPOSITE = (
+    Direction.RIGHT.value,
+    Direction.LEFT.value,
+    Direction.ABOVE.value,
+    Direction.BELOW.value,
+    Direction.BEHIND.value,
+    Direction.FRONT.value,
+)
 
+OPPOSITE_DIRECTION = tuple(Direction(value) for value in OPPOSITE)
+
+def opposite(direction):
+    return OPPOSITE_DIRECTION[direction]
 
@@ -9,27 +9,76 @@ import numpy as np
 import pyvista
 import pyvistaqt as pvqt
 
-# Adapted from Voxelmap
+# Originally adapted from Voxelmap
 # See https://github.com/andrewrgarcia/voxelmap
 # See https://github.com/andrewrgarcia/voxelmap/blob/main/voxelmap/main.py
 # MIT license (Copyright (c) 2022 Andrew R. Garcia)
 
-def draw(width, depth, height):
-    array = np.empty([width, depth, height], dtype=int)
+# Renamed from UniformGrid in pyvista 0.43
+ImageData = getattr(pyvista, "ImageData", None) or pyvista.UniformGrid
+
+class Voxels():
+    """
+    The grid rendered as a single mesh
+
+    Each cell of the grid is a cell of one image mesh, coloured using a
+    per-cell RGBA array. Updating the colours of every voxel is a single
+    array assignment, so the cost doesn't depend on the number of actors
+    in the scene.
+
+    The grid holds its cells in x, y, z order with z varying fastest, while
+    the mesh holds them with x varying fastest. The colours are reordered
+    as they're copied.
+    """
+
+    def __init__(self, width, depth, height):
+        self.width = width
+        self.depth = depth
+        self.height = height
+        self.size = width * depth * height
+
+        # Cell centres sit on the integer co-ordinates
+        self.mesh = ImageData(
+            dimensions=(width + 1, depth + 1, height + 1),
+            spacing=(1.0, 1.0, 1.0),
+            origin=(-0.5, -0.5, -0.5),
+        )
+        self.mesh.cell_data["colours"] = np.zeros((self.size, 4), dtype=np.uint8)
+        self.rgba = self.mesh.cell_data["colours"]
+
+        # Position in the grid of each cell of the mesh
+        self.order = np.arange(self.size).reshape(width, depth, height).transpose(2, 1, 0).ravel()
 
-    for x in range(width):
-        for y in range(depth):
-            for z in range(height):
-                array[x, y, z] = 1
+    def set_colours(self, colours):
+        """
+        Set the colour of every voxel
 
-    Z  = np.max(array)
-    xx, yy, zz, voxid = np.array([ [*i,1*array[tuple(i)]] for i in np.argwhere(array)]).T
-    centres = np.vstack((xx.ravel(), yy.ravel(), zz.ravel())).T
+        Args:
+            colours (N, 4) array of RGBA values between 0 and 1, or bytes,
+                one row for each cell of the grid in grid order
+        """
+        colours = np.asarray(colours)[:self.size]
+        if colours.dtype == np.uint8:
+            self.rgba[:] = colours[self.order]
+        else:
+            self.rgba[:] = np.clip(colours[self.order], 0.0, 1.0) * 255
 
+def draw(width, depth, height):
+    """
+    Create the window and the mesh used to render the grid
+
+    Args:
+        width, depth, height: the dimensions of the grid
+
+    Returns:
+        Tuple of the plotter and the Voxels
+    """
     pl = pvqt.BackgroundPlotter(title="Plantworld")
     pl.background_color = "#cccccc"
     pl.view_isometric()
     pl.enable_eye_dome_lighting()
+    # Needed for the transparent voxels to be drawn in the right order
+    pl.enable_depth_peeling()
 
 #    pl.camera_position = [
 #        (30.0, 45.0, 35.0),
@@ -37,19 +86,7 @@ def draw(width, depth, height):
 #        (0.0, 0.0, 1.0)
 #    ]
 
-    voxels = []
-    for pos in range(len(centres)):
-        x_len, y_len, z_len = tuple(3*[1.0])
-
-        # Voxel Geometry
-        voxel = pyvista.Cube(center=centres[pos], x_length=x_len, y_length=y_len, z_length=z_len)
-        smooth= None
-
-        # Mesh creation and coloring
-        voxel_color = "#000000"
-        voxel_alpha = 0.0
-        actor = pl.add_mesh(voxel, color=voxel_color, smooth_shading=smooth, opacity=voxel_alpha,show_edges=True, edge_color="#000000", render=False)
-        voxels.append(actor)
+    voxels = Voxels(width, depth, height)
+    pl.add_mesh(voxels.mesh, scalars="colours", rgba=True, show_scalar_bar=False, render=False)
 
     return pl, voxels
-
@@ -0,0 +1,238 @@
+#!/bin/python3
+# vim: et:ts=4:sts=4:sw=4
+
+# SPDX-License-Identifier: BSD-2-Clause
+# Copyright © 2024 The Alan Turing Institute
+
+# Weather
+
+import numpy as np
+
+from src.cells import (
+    CellType,
+)
+
+AIR = CellType.AIR.value
+SOIL = CellType.SOIL.value
+PLANT = CellType.PLANT.value
+
+class Climate():
+    """
+    When and where it rains, and how quickly the surface dries out
+
+    Rain falls in showers, each on a disc of columns. There's one shower in
+    every period of rain_period ticks, at a time and place drawn from a
+    random number generator seeded by the climate's seed and the number of
+    the period. So the weather doesn't depend on how the world is run, and
+    carries on from a checkpoint without any state being saved.
+
+    Water evaporates from every Soil cell at the surface. It's taken every
+    evaporation_period ticks, making up for the ticks in between.
+    """
+
+    def __init__(self, rain_period=0, rain=8.0, radius=6, evaporation=0.0, evaporation_period=8, seed=0):
+        """
+        Args:
+            rain_period ticks between showers, on average, or 0 for no rain
+            rain water added to the surface cell of each column a shower
+                falls on
+            radius of each shower, in columns
+            evaporation water lost per tick by each Soil cell at the surface
+            evaporation_period ticks between the times water is taken
+            seed for the times and places of the showers
+        """
+        self.rain_period = rain_period
+        self.rain = rain
+        self.radius = radius
+        self.evaporation = evaporation
+        self.evaporation_period = evaporation_period
+        self.seed = seed
+        # The shower planned for the last period asked about
+        self.planned = (None, None, None)
+
+    @property
+    def settings(self):
+        """
+        Returns the arguments that recreate the climate, for saving
+        """
+        return {
+            "rain_period": self.rain_period,
+            "rain": self.rain,
+            "radius": self.radius,
+            "evaporation": self.evaporation,
+            "evaporation_period": self.evaporation_period,
+            "seed": self.seed,
+        }
+
+    def shower(self, ticks):
+        """
+        Returns where a shower falls on a tick, if one does
+
+        Args:
+            ticks number of the tick
+
+        Returns:
+            Tuple of the position of the centre of the shower, as fractions
+            of the width and depth of the world, or None if it's dry
+        """
+        if not self.rain_period:
+            return None
+        period, offset = divmod(ticks, self.rain_period)
+        if self.planned[0] != period:
+            random = np.random.default_rng([self.seed, period])
+            self.planned = (period, int(random.integers(self.rain_period)), (random.random(), random.random()))
+        _, tick, centre = self.planned
+        return centre if tick == offset else None
+
+    def drying(self, ticks):
+        """
+        Returns the water lost by each Soil cell at the surface on a tick
+        """
+        if self.evaporation <= 0 or ticks % self.evaporation_period:
+            return 0.0
+        return self.evaporation * self.evaporation_period
+
+class Weather():
+    """
+    Applies the rain and evaporation of a climate to the surface of a world
+
+    The surface index holds the top solid cell of each column and its type,
+    and is kept up to date by rescanning only the columns whose cells have
+    changed, as Lighting does with its heightmap. Each shower, and each
+    round of evaporation, then picks the cells it reaches out of the index
+    so that their water can be changed in one operation, rather than by
+    scanning the world. The index is only brought up to date when it's
+    needed, so a tick without weather costs next to nothing.
+
+    A shower falls on the top cell of each column under it if that's a Soil
+    or Plant cell, and runs off Rock. Only Soil cells lose water to
+    evaporation; plants lose theirs to the sun.
+    """
+
+    def __init__(self, width, depth, height, periodic, climate):
+        """
+        Args:
+            width, depth, height dimensions of the world
+            periodic whether the world wraps at its edges
+            climate Climate of the world
+        """
+        self.width = width
+        self.depth = depth
+        self.height = height
+        self.periodic = periodic
+        self.climate = climate
+        self.top = None
+        self.kind = None
+        self.dirty = set()
+        # Flat indices of the Soil cells at the surface, or None if they
+        # need working out again
+        self.soil = None
+
+        radius = climate.radius
+        dx, dy = np.mgrid[-radius:radius + 1, -radius:radius + 1]
+        inside = dx * dx + dy * dy <= radius * radius
+        # Column offsets of the cells under a shower
+        self.offsets = (dx[inside], dy[inside])
+
+    def changed(self, indices):
+        """
+        Note cells whose type has changed
+
+        Args:
+            indices iterable of flat indices
+        """
+        height = self.height
+        self.dirty.update(index // height for index in np.asarray(indices).ravel().tolist())
+
+    def refresh(self, cell_type):
+        """
+        Bring the surface index up to date
+
+        Args:
+            cell_type cell type values of the world, indexed by flat index,
+                which can be read a column at a time
+        """
+        height = self.height
+        if self.top is None:
+            columns = self.width * self.depth
+            self.top = np.empty(columns, dtype=np.int16)
+            self.kind = np.empty(columns, dtype=np.int8)
+            layer = self.depth * height
+            for x in range(self.width):
+                rows = slice(x * self.depth, (x + 1) * self.depth)
+                self.top[rows], self.kind[rows] = self.scan(
+                    np.asarray(cell_type[x * layer:(x + 1) * layer]).reshape(self.depth, height))
+            self.dirty = set()
+            self.soil = None
+        if self.dirty:
+            dirty = sorted(self.dirty)
+            self.dirty = set()
+            for column in dirty:
+                top, kind = self.scan(np.asarray(cell_type[column * height:(column + 1) * height]).reshape(1, height))
+                self.top[column] = top[0]
+                self.kind[column] = kind[0]
+            self.soil = None
+        if self.soil is None:
+            columns = np.flatnonzero(self.kind == SOIL)
+            self.soil = columns * height + self.top[columns]
+
+    def scan(self, columns):
+        """
+        Returns the height and type of the top solid cell of each of a block
+        of columns, or -1 and Air for a column without one
+
+        Args:
+            columns (N, height) array of cell type values
+        """
+        solid = columns != AIR
+        top = np.where(solid.any(axis=1), self.height - 1 - np.argmax(solid[:, ::-1], axis=1), -1)
+        return top, np.where(top >= 0, columns[np.arange(len(columns)), top], AIR)
+
+    def rain(self, ticks, cell_type):
+        """
+        Returns the cells rained on during a tick
+
+        Args:
+            ticks number of the tick
+            cell_type cell type values of the world, see refresh()
+
+        Returns:
+            Tuple of a sorted array of the flat indices of the cells and the
+            water added to each
+        """
+        centre = self.climate.shower(ticks)
+        if centre is None:
+            return np.empty(0, dtype=np.intp), 0.0
+        self.refresh(cell_type)
+        dx, dy = self.offsets
+        x = int(centre[0] * self.width) + dx
+        y = int(centre[1] * self.depth) + dy
+        if self.periodic:
+            x %= self.width
+            y %= self.depth
+        else:
+            inside = (x >= 0) & (x < self.width) & (y >= 0) & (y < self.depth)
+            x, y = x[inside], y[inside]
+        # A shower wider than the world wraps onto some columns twice
+        columns = np.unique(x * self.depth + y)
+        kind = self.kind[columns]
+        columns = columns[(kind == SOIL) | (kind == PLANT)]
+        return columns * self.height + self.top[columns], self.climate.rain
+
+    def drying(self, ticks, cell_type):
+        """
+        Returns the cells that lose water to evaporation during a tick
+
+        Args:
+            ticks number of the tick
+            cell_type cell type values of the world, see refresh()
+
+        Returns:
+            Tuple of a sorted array of the flat indices of the cells and the
+            most water each can lose
+        """
+        loss = self.climate.drying(ticks)
+        if not loss:
+            return np.empty(0, dtype=np.intp), 0.0
+        self.refresh(cell_type)
+        return self.soil, loss
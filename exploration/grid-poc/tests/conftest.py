@@ -0,0 +1,14 @@
+#!/bin/python3
+# vim: et:ts=4:sts=4:sw=4
+
+# SPDX-License-Identifier: BSD-2-Clause
+# Copyright © 2024 The Alan Turing Institute
+
+# Test configuration
+
+import os
+import sys
+
+# The tests import world and src as the scripts do, from the directory
+# above
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
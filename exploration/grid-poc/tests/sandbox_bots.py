@@ -0,0 +1,48 @@
+#!/bin/python3
+# vim: et:ts=4:sts=4:sw=4
+
+# SPDX-License-Identifier: BSD-2-Clause
+# Copyright © 2024 The Alan Turing Institute
+
+# Misbehaving species for the sandbox tests
+
+import sys
+import time
+import numpy as np
+from multiprocessing.connection import Connection
+
+from src.plants import (
+    Plant,
+)
+
+class Single(Plant):
+    """
+    Updated a cell at a time, keeping no state on its plants
+    """
+    def update(self):
+        super().update()
+
+class Deaf(Plant):
+    """
+    Stops reading its requests once it has loaded
+    """
+
+class Sleeper(Plant):
+    """
+    Takes far longer than any time limit to update its cells
+    """
+    @classmethod
+    def update_batch(cls, cells):
+        time.sleep(30)
+
+class Oversized(Plant):
+    """
+    Replies with more energies than it has cells
+    """
+    @classmethod
+    def update_batch(cls, cells):
+        cells.energy = np.zeros(len(cells) + 1)
+
+# Only in the worker process running Deaf, which is passed its name
+if sys.argv[1:2] == ["{}.Deaf".format(__name__)]:
+    Connection.recv = lambda self: time.sleep(3600)
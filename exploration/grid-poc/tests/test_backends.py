@@ -0,0 +1,201 @@
+#!/bin/python3
+# vim: et:ts=4:sts=4:sw=4
+
+# SPDX-License-Identifier: BSD-2-Clause
+# Copyright © 2024 The Alan Turing Institute
+
+# Backend tests
+
+import json
+import random
+import numpy as np
+import pytest
+
+from world import (
+    Grid,
+    parse_args,
+    headless,
+)
+
+from src.arraygrid import (
+    ArrayGrid,
+)
+
+from src.cells import (
+    CellType,
+)
+
+from src.mappedgrid import (
+    MappedGrid,
+)
+
+from src.parallelgrid import (
+    ParallelGrid,
+)
+
+from src.plantlang import (
+    Shrub,
+)
+
+from src.plants import (
+    Plant,
+)
+
+from src.scheduler import (
+    Schedule,
+)
+
+WIDTH, DEPTH, HEIGHT = 12, 10, 8
+TICKS = 12
+
+# Arrays that Grid and ArrayGrid both hold, once Grid's cells are loaded
+# into arrays
+CELL_STATE = (
+    "cell_type",
+    "water",
+    "energy",
+    "water_pressure_external",
+    "pressure_gradient",
+    "flux",
+    "permeability",
+    "colours",
+)
+
+def objects(periodic=True, schedule=None, seed=3, species=(Plant,)):
+    """
+    Returns a small world populated by the object model Grid
+    """
+    random.seed(seed)
+    grid = Grid()
+    grid.width, grid.depth, grid.height = WIDTH, DEPTH, HEIGHT
+    grid.periodic = periodic
+    grid.species = species
+    grid.schedule = schedule or Schedule()
+    grid.populate()
+    return grid
+
+def assert_same(first, second, names=ArrayGrid.CHECKPOINT_ARRAYS):
+    """
+    Check that two array backends hold the same state
+    """
+    for name in names:
+        assert np.array_equal(getattr(first, name), getattr(second, name)), name
+    assert sorted(first.plants) == sorted(second.plants)
+    assert first.statistics() == second.statistics()
+
+def messages(grid):
+    """
+    Returns the outgoing messages of every plant in a world
+    """
+    if isinstance(grid, Grid):
+        plants = [(index, cell) for index, cell in enumerate(grid.cells) if cell.cell_type == CellType.PLANT]
+    else:
+        plants = grid.plants.items()
+    return {index: [vars(state).copy() for state in plant.outgoing] for index, plant in plants}
+
+@pytest.mark.parametrize("periodic", [True, False])
+@pytest.mark.parametrize("periods", [(1, 1, 1, 1), (2, 3, 1, 2), (4, 1, 2, 3)])
+def test_arrays_match_objects(periodic, periods):
+    grid = objects(periodic, Schedule(*periods))
+    arrays = ArrayGrid.from_grid(grid)
+    for tick in range(TICKS):
+        grid.update()
+        arrays.update()
+        loaded = ArrayGrid.from_grid(grid)
+        for name in CELL_STATE:
+            assert np.array_equal(getattr(arrays, name), getattr(loaded, name)), (tick, name)
+    assert arrays.statistics() == grid.statistics()
+
+@pytest.mark.parametrize("periodic", [True, False])
+def test_mapped_matches_arrays(periodic, tmp_path):
+    arrays = ArrayGrid.from_grid(objects(periodic))
+    random.seed(3)
+    mapped = MappedGrid(WIDTH, DEPTH, HEIGHT, periodic, directory=str(tmp_path), chunk_width=3)
+    mapped.species = (Plant,)
+    mapped.populate()
+    assert_same(arrays, mapped)
+    for tick in range(TICKS):
+        arrays.update()
+        mapped.update()
+    assert_same(arrays, mapped)
+
+    # Carries on from its files
+    mapped.flush()
+    mapped = MappedGrid.open(str(tmp_path))
+    arrays.update()
+    mapped.update()
+    assert_same(arrays, mapped)
+
+@pytest.mark.parametrize("periodic", [True, False])
+def test_parallel_matches_arrays(periodic):
+    grid = objects(periodic, Schedule(2, 1, 1, 2))
+    arrays = ArrayGrid.from_grid(grid)
+    parallel = ParallelGrid.from_grid(grid)
+    parallel.processes = 3
+    try:
+        for tick in range(TICKS):
+            arrays.update()
+            parallel.update()
+        assert_same(arrays, parallel)
+    finally:
+        parallel.close()
+
+@pytest.mark.parametrize("backend", [Grid, ArrayGrid])
+def test_resume_matches_uninterrupted(backend, tmp_path):
+    checkpoint = str(tmp_path / "world.ckpt")
+    straight, stopped = [objects(schedule=Schedule(2, 1, 3, 1), species=(Plant, Shrub)) for _ in range(2)]
+    if backend is ArrayGrid:
+        straight, stopped = ArrayGrid.from_grid(straight), ArrayGrid.from_grid(stopped)
+    # Saving doesn't change a world that carries on running
+    straight.run(TICKS)
+    sent = messages(straight)
+    straight.save_checkpoint(str(tmp_path / "middle.ckpt"))
+    assert messages(straight) == sent
+    straight.run(TICKS)
+    stopped.run(TICKS)
+    stopped.save_checkpoint(checkpoint)
+
+    if backend is Grid:
+        resumed = Grid()
+        resumed.load_checkpoint(checkpoint)
+    else:
+        resumed = ArrayGrid.load_checkpoint(checkpoint)
+    resumed.run(TICKS)
+    assert resumed.ticks == straight.ticks
+    if backend is Grid:
+        straight, resumed = ArrayGrid.from_grid(straight), ArrayGrid.from_grid(resumed)
+        assert_same(straight, resumed, CELL_STATE)
+    else:
+        assert_same(straight, resumed)
+
+def run_headless(tmp_path, name, *options):
+    """
+    Returns the statistics written by a headless run of world.py
+    """
+    stats = tmp_path / "{}.json".format(name)
+    args = parse_args([
+        "--headless", "--width", str(WIDTH), "--depth", str(DEPTH), "--height", str(HEIGHT),
+        "--seed", "5", "--stats", str(stats), *options,
+    ])
+    headless(args)
+    with open(stats) as input:
+        results = json.load(input)
+    return {name: results[name] for name in ("periodic", "cells", "water", "species")}
+
+def test_command_line_backends_agree(tmp_path):
+    options = ("--no-wrap", "--ticks", str(TICKS), "--water-period", "2")
+    results = [
+        run_headless(tmp_path, backend, "--backend", backend, *options)
+        for backend in ("objects", "arrays", "mapped")
+    ]
+    results.append(run_headless(tmp_path, "parallel", "--backend", "parallel", "--processes", "2", *options))
+    assert results[0]["periodic"] is False
+    assert all(result == results[0] for result in results[1:])
+
+@pytest.mark.parametrize("backend", ["objects", "arrays"])
+def test_command_line_resume(backend, tmp_path):
+    checkpoint = str(tmp_path / "half.ckpt")
+    straight = run_headless(tmp_path, "straight", "--backend", backend, "--ticks", str(2 * TICKS))
+    run_headless(tmp_path, "first", "--backend", backend, "--ticks", str(TICKS), "--save", checkpoint)
+    resumed = run_headless(tmp_path, "second", "--backend", backend, "--ticks", str(TICKS), "--resume", checkpoint)
+    assert resumed == straight
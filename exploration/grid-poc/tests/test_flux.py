@@ -0,0 +1,77 @@
+#!/bin/python3
+# vim: et:ts=4:sts=4:sw=4
+
+# SPDX-License-Identifier: BSD-2-Clause
+# Copyright © 2024 The Alan Turing Institute
+
+# Flux limiter tests
+
+import numpy as np
+
+from src.cells import (
+    Soil,
+)
+
+from src.flux import (
+    limit_flux,
+)
+
+def scalar(flux, water):
+    """
+    Returns the fluxes and water left by Cell.update_flux for each cell
+    """
+    fluxes, remaining = [], []
+    for row, amount in zip(flux.tolist(), water.tolist()):
+        cell = Soil()
+        cell.flux = row
+        cell.water = amount
+        cell.update_flux()
+        fluxes.append(cell.flux)
+        remaining.append(cell.water)
+    return np.array(fluxes, dtype=float), np.array(remaining)
+
+def assert_matches(flux, water):
+    """
+    Check that limit_flux gives exactly what the scalar loop gives
+    """
+    expected_flux, expected_water = scalar(flux, water)
+    new_flux, new_water = limit_flux(flux, water)
+    assert np.array_equal(new_flux, expected_flux)
+    assert np.array_equal(new_water, expected_water)
+
+def test_cases():
+    flux = np.array([
+        # Enough water for every flux
+        [1.0, 2.0, 0.0, 0.5, 0.0, 0.0],
+        # Runs out part way through the second largest
+        [3.0, 0.0, 4.0, 0.0, 1.0, 0.0],
+        # Runs out part way through the largest
+        [0.0, 0.0, 0.0, 9.0, 2.0, 0.0],
+        # Ties go to the lowest face first
+        [2.0, 0.0, 2.0, 0.0, 2.0, 2.0],
+        [0.0, 1.5, 0.0, 1.5, 0.0, 1.5],
+        # Exactly enough water for the largest, which counts as running out
+        [0.0, 3.0, 0.0, 0.0, 1.0, 0.0],
+        # Negative fluxes are inflows and ignored
+        [-2.0, 1.0, -1.0, 0.0, 0.0, 0.5],
+        # Nothing to give, or nothing to give it to
+        [1.0, 1.0, 0.0, 0.0, 0.0, 0.0],
+        [0.0, 0.0, -1.0, 0.0, 0.0, 0.0],
+    ])
+    water = np.array([10.0, 5.0, 4.0, 5.0, 2.0, 3.0, 1.2, 0.0, 4.0])
+    assert_matches(flux, water)
+
+    new_flux, new_water = limit_flux(flux, water)
+    assert new_flux[1].tolist() == [1.0, 0.0, 4.0, 0.0, 0.0, 0.0]
+    assert new_flux[3].tolist() == [2.0, 0.0, 2.0, 0.0, 1.0, 0.0]
+    assert new_flux[5].tolist() == [0.0, 3.0, 0.0, 0.0, 0.0, 0.0]
+    assert new_water.tolist() == [6.5, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 4.0]
+
+def test_random_cells():
+    generator = np.random.default_rng(7)
+    flux = generator.normal(size=(2000, 6))
+    # Round some of them so that ties and exact amounts come up
+    flux[:1000] = np.round(flux[:1000] * 2) / 2
+    water = np.abs(generator.normal(size=2000)) * 3
+    water[:500] = np.round(water[:500])
+    assert_matches(flux, water)
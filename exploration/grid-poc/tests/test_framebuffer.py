@@ -0,0 +1,101 @@
+#!/bin/python3
+# vim: et:ts=4:sts=4:sw=4
+
+# SPDX-License-Identifier: BSD-2-Clause
+# Copyright © 2024 The Alan Turing Institute
+
+# Frame buffer tests
+
+import multiprocessing
+import threading
+import numpy as np
+import pytest
+
+from src.framebuffer import (
+    FrameBuffer,
+    SharedFrameBuffer,
+)
+
+CELLS = 1000
+FRAMES = 500
+
+def frame(number):
+    """
+    Returns a frame with every colour set to its number
+    """
+    return np.full((CELLS, 4), float(number))
+
+@pytest.fixture(params=[FrameBuffer, SharedFrameBuffer])
+def frames(request):
+    frames = request.param(CELLS)
+    yield frames
+    if isinstance(frames, SharedFrameBuffer):
+        frames.unlink()
+
+def test_handoff(frames):
+    assert frames.latest() is None
+    frames.publish(frame(1))
+    assert np.array_equal(frames.latest(), frame(1))
+    # Nothing new
+    assert frames.latest() is None
+
+    # Frames the renderer doesn't get to are dropped
+    frames.publish(frame(2))
+    frames.back[:] = 3.0
+    frames.publish()
+    front = frames.latest()
+    assert np.array_equal(front, frame(3))
+    assert frames.frames == 3
+
+    # The frame being read is left alone however many more are published
+    for number in range(4, 8):
+        frames.publish(frame(number))
+    assert np.array_equal(front, frame(3))
+    assert np.array_equal(frames.latest(), frame(7))
+
+def publish_frames(args):
+    """
+    Publish numbered frames to a buffer, attaching to it if it's shared
+    """
+    frames = SharedFrameBuffer(*args) if isinstance(args, tuple) else args
+    for number in range(1, FRAMES + 1):
+        frames.back[:] = number
+        frames.publish()
+    if isinstance(args, tuple):
+        frames.close()
+
+def read_frames(frames, running):
+    """
+    Returns the numbers of the frames read while the simulation runs,
+    checking that none was read while it was being written
+    """
+    seen = []
+    while True:
+        # Checked before reading, so the last frame is read after it stops
+        finished = not running()
+        latest = frames.latest()
+        if latest is not None:
+            assert np.all(latest == latest[0, 0])
+            seen.append(int(latest[0, 0]))
+        if finished:
+            return seen
+
+@pytest.mark.parametrize("concurrent", ["thread", "process"])
+def test_concurrent_handoff(concurrent):
+    if concurrent == "thread":
+        frames = FrameBuffer(CELLS)
+        simulation = threading.Thread(target=publish_frames, args=(frames,))
+    else:
+        frames = SharedFrameBuffer(CELLS)
+        simulation = multiprocessing.Process(target=publish_frames, args=(frames.attach_args(),))
+    try:
+        simulation.start()
+        seen = read_frames(frames, simulation.is_alive)
+        simulation.join()
+        assert frames.frames == FRAMES
+        # Frames arrive in order and the last one is never dropped
+        assert seen == sorted(set(seen))
+        assert seen[-1] == FRAMES
+    finally:
+        if isinstance(frames, SharedFrameBuffer):
+            frames.unlink()
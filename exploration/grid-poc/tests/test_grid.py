@@ -0,0 +1,39 @@
+#!/bin/python3
+# vim: et:ts=4:sts=4:sw=4
+
+# SPDX-License-Identifier: BSD-2-Clause
+# Copyright © 2024 The Alan Turing Institute
+
+# Object model tests
+
+import random
+import numpy as np
+import pytest
+
+from world import (
+    Grid,
+)
+
+from src.framebuffer import (
+    FrameBuffer,
+)
+
+from src.weather import (
+    Climate,
+)
+
+@pytest.mark.parametrize("seed", [0, 1, 2, 3])
+def test_published_colours_match_cells(seed):
+    random.seed(seed)
+    grid = Grid()
+    grid.width, grid.depth, grid.height = 16, 16, 8
+    grid.populate()
+    grid.set_climate(Climate(rain_period=5, evaporation=0.1, seed=seed))
+    grid.frames = FrameBuffer(grid.topology.size)
+    grid.publish_frame()
+    for tick in range(30):
+        grid.update()
+        grid.publish_frame()
+        colours = np.array([cell.colour[:4] for cell in grid.cells[:grid.topology.size]], dtype=float)
+        assert np.array_equal(grid.colours, colours), tick
+        assert np.array_equal(grid.frames.latest(), colours), tick
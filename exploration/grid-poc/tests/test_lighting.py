@@ -0,0 +1,90 @@
+#!/bin/python3
+# vim: et:ts=4:sts=4:sw=4
+
+# SPDX-License-Identifier: BSD-2-Clause
+# Copyright © 2024 The Alan Turing Institute
+
+# Lighting tests
+
+import math
+import numpy as np
+import pytest
+
+from src.cells import (
+    CellType,
+)
+
+from src.lighting import (
+    Lighting,
+    Sun,
+)
+
+WIDTH, DEPTH, HEIGHT = 6, 2, 8
+
+def world(tower=5):
+    """
+    Returns the cell types of a world with a floor and a tower
+
+    The floor fills the bottom layer, and the tower at x = 3 in the first
+    row along x reaches up to the given height.
+    """
+    cell_type = np.full((WIDTH, DEPTH, HEIGHT), CellType.AIR.value, dtype=np.int8)
+    cell_type[:, :, 0] = CellType.SOIL.value
+    cell_type[3, 0, 1:tower + 1] = CellType.PLANT.value
+    return cell_type.reshape(-1)
+
+def lighting(periodic, sun, cell_type, ticks=0):
+    """
+    Returns the lighting of a world, brought up to date
+    """
+    lighting = Lighting(WIDTH, DEPTH, HEIGHT, periodic, sun)
+    lighting.update(ticks, cell_type)
+    return lighting
+
+# With six steps a day the sun starts 30 degrees up on the +x side, so the
+# tower's shadow falls towards -x, dropping tan(30) cells for each cell
+# along. The row without the tower is lit right down to the floor.
+@pytest.mark.parametrize("periodic, shaded", [
+    (False, [4, 4, 5, 5, 0, 0]),
+    (True, [4, 4, 5, 5, 3, 3]),
+])
+def test_shade_map(periodic, shaded):
+    lit = lighting(periodic, Sun(day_length=6, steps=6), world())
+    assert lit.daylight == pytest.approx(0.5)
+    assert lit.slope == pytest.approx(math.tan(math.pi / 6))
+    assert lit.toward == 1
+    assert lit.top.reshape(WIDTH, DEPTH).tolist() == [[0, 0]] * 3 + [[5, 0]] + [[0, 0]] * 2
+    assert lit.shade.reshape(WIDTH, DEPTH)[:, 0].tolist() == shaded
+    assert lit.shade.reshape(WIDTH, DEPTH)[:, 1].tolist() == [0] * WIDTH
+
+    # The top of the tower is lit, and the floor beside it isn't
+    tower, floor = (3 * DEPTH) * HEIGHT + 5, (2 * DEPTH) * HEIGHT
+    assert lit.direct(np.array([tower, floor])).tolist() == [True, False]
+    assert lit.light(np.array([tower, floor])).tolist() == pytest.approx([4.0, 0.8])
+
+def test_sun_overhead_and_at_night():
+    sun = Sun(day_length=6, steps=6)
+    cell_type = world()
+    # Straight overhead every column lights its own top
+    for ticks in (0, 1):
+        lit = lighting(False, Sun(), cell_type, ticks)
+        assert np.array_equal(lit.shade, lit.top)
+    # After sunset there's no light, and no shadows
+    lit = lighting(False, sun, cell_type, 4)
+    assert lit.daylight == 0.0
+    assert lit.slope is None
+    assert np.array_equal(lit.shade, lit.top)
+    assert lit.light(np.array([0])).tolist() == [0.0]
+
+@pytest.mark.parametrize("periodic", [False, True])
+def test_changed_columns_match_fresh_lighting(periodic):
+    sun = Sun(day_length=60, steps=6)
+    lit = lighting(periodic, sun, world())
+    version = lit.version
+    taller = world(tower=7)
+    lit.changed(np.flatnonzero(taller != world()))
+    lit.update(1, taller)
+    assert lit.version == version + 1
+    fresh = lighting(periodic, sun, taller, 1)
+    assert np.array_equal(lit.top, fresh.top)
+    assert np.array_equal(lit.shade, fresh.shade)
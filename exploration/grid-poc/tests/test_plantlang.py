@@ -0,0 +1,121 @@
+#!/bin/python3
+# vim: et:ts=4:sts=4:sw=4
+
+# SPDX-License-Identifier: BSD-2-Clause
+# Copyright © 2024 The Alan Turing Institute
+
+# Plantlang tests
+
+import random
+import numpy as np
+import pytest
+
+from world import (
+    Grid,
+)
+
+from src.arraygrid import (
+    ArrayGrid,
+)
+
+from src.batch import (
+    CellBatch,
+)
+
+from src.cells import (
+    Direction,
+)
+
+from src.plantlang import (
+    Program,
+    Shrub,
+    species,
+)
+
+from src.plants import (
+    Plant,
+)
+
+UP = Direction.ABOVE.value
+
+# Counts to the budget, unless the cell is short of energy
+COUNTER = """
+        lt      t energy 5
+        if      t low
+loop:   add     n n 1
+        signal  up n
+        goto    loop
+low:    signal  up -1
+"""
+Counter = species("Counter", COUNTER, __name__, budget=20)
+
+def cells(energy):
+    """
+    Returns a batch of plant cells with the given energies
+    """
+    count = len(energy)
+    return CellBatch(
+        np.arange(count),
+        np.full(count, 4.0),
+        np.array(energy, dtype=float),
+        np.full((count, 6), 3, dtype=np.int8),
+        np.zeros((count, 6)),
+        np.zeros((count, 4)),
+        np.full(count, 0.5),
+        np.zeros((count, 6)),
+        np.zeros((count, 6)),
+    )
+
+@pytest.mark.parametrize("source, error", [
+    ("grow up\nfly up", "line 2: unknown instruction 'fly'"),
+    ("add x 1", "line 1: add takes 3 operands"),
+    ("grow sideways", "line 1: unknown face 'sideways'"),
+    ("goto nowhere", "line 1: unknown label 'nowhere'"),
+    ("a: end\na: end", "line 2: label 'a' defined twice"),
+    ("2a: end", "line 1: bad label '2a'"),
+    ("set energy 1", "line 1: can't assign to 'energy'"),
+    ("set soil 1", "line 1: can't assign to 'soil'"),
+    ("set x colour.up", "line 1: unknown sensor 'colour.up'"),
+    ("set x type.middle", "line 1: unknown sensor 'type.middle'"),
+    ("\n# comment\nset x 1e", "line 3: bad value '1e'"),
+])
+def test_compile_errors(source, error):
+    with pytest.raises(ValueError) as raised:
+        Program(source)
+    assert str(raised.value) == error
+
+def test_budget_exhaustion():
+    batch = cells([10.0, 1.0, 6.0])
+    executed = Counter.program.run(batch, Counter)
+    # Three instructions to each pass of the loop, after the two at the
+    # start: the budget of 20 runs out after the sixth signal
+    assert batch.signal_out[:, UP].tolist() == [6.0, -1.0, 6.0]
+    assert executed == 20 + 3 + 20
+
+    # A smaller budget stops the counting sooner
+    Small = species("Small", COUNTER, __name__, budget=9)
+    batch = cells([10.0, 1.0])
+    assert Small.program.run(batch, Small) == 9 + 3
+    assert batch.signal_out[:, UP].tolist() == [2.0, -1.0]
+
+@pytest.mark.parametrize("seed", [1, 2])
+def test_programs_match_across_backends(seed):
+    random.seed(seed)
+    grid = Grid()
+    grid.width, grid.depth, grid.height = 12, 10, 8
+    grid.species = (Shrub, Plant)
+    grid.populate()
+    arrays = ArrayGrid.from_grid(grid)
+    signalled = False
+    for tick in range(20):
+        grid.update()
+        arrays.update()
+        loaded = ArrayGrid.from_grid(grid)
+        for name in ("cell_type", "water", "energy", "pressure_gradient", "permeability", "colours"):
+            assert np.array_equal(getattr(arrays, name), getattr(loaded, name)), (tick, name)
+        # Only the signals posted last tick are held by Grid
+        previous = (arrays.ticks + 1) % 2
+        assert np.array_equal(arrays.signal[:, previous], loaded.signal[:, previous]), tick
+        signalled |= bool(loaded.signal.any())
+    assert arrays.statistics() == grid.statistics()
+    assert signalled
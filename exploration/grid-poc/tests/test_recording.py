@@ -0,0 +1,118 @@
+#!/bin/python3
+# vim: et:ts=4:sts=4:sw=4
+
+# SPDX-License-Identifier: BSD-2-Clause
+# Copyright © 2024 The Alan Turing Institute
+
+# Recording tests
+
+import random
+import numpy as np
+import pytest
+
+from world import (
+    Grid,
+)
+
+from src.arraygrid import (
+    ArrayGrid,
+)
+
+from src.recording import (
+    KEYFRAME,
+    Recorder,
+    Replay,
+    quantise,
+    quantise_colours,
+)
+
+from src.weather import (
+    Climate,
+)
+
+TICKS = 15
+KEYFRAME_EVERY = 4
+
+def recorded(grid):
+    """
+    Returns the state of a world at the precision it's recorded at
+    """
+    if isinstance(grid, Grid):
+        grid = ArrayGrid.from_grid(grid)
+    size = grid.topology.size
+    return (
+        grid.cell_type[:size].astype(np.int8),
+        quantise(grid.water[:size]),
+        quantise(grid.energy[:size]),
+        quantise_colours(grid.colours[:size]),
+    )
+
+def assert_replayed(replay, state):
+    """
+    Check that a replay holds the recorded state
+    """
+    cell_type, water, energy, colours = state
+    assert np.array_equal(replay.cell_type, cell_type)
+    assert np.array_equal(replay.water.view(np.uint16), water.view(np.uint16))
+    assert np.array_equal(replay.energy.view(np.uint16), energy.view(np.uint16))
+    assert np.array_equal(replay.colours, colours)
+
+@pytest.mark.parametrize("backend", [Grid, ArrayGrid])
+def test_replay_matches_recorded_world(backend, tmp_path):
+    filename = str(tmp_path / "world.rec")
+    random.seed(4)
+    if backend is Grid:
+        grid = Grid()
+        grid.width, grid.depth, grid.height = 12, 10, 8
+        grid.populate()
+    else:
+        grid = ArrayGrid(12, 10, 8)
+        grid.populate()
+    grid.set_climate(Climate(rain_period=3, evaporation=0.1, seed=4))
+    recorder = Recorder(filename, grid.width, grid.depth, grid.height, KEYFRAME_EVERY)
+    grid.start_recording(recorder)
+    states = [recorded(grid)]
+    for tick in range(TICKS):
+        grid.update()
+        states.append(recorded(grid))
+    recorder.close()
+
+    replay = Replay(filename)
+    try:
+        assert replay.ticks == list(range(TICKS + 1))
+        keyframes = [tick for tick, kind, _, _ in replay.frames if kind == KEYFRAME]
+        assert keyframes == list(range(0, TICKS + 1, KEYFRAME_EVERY))
+        assert all(count for _, kind, count, _ in replay.frames if kind != KEYFRAME)
+
+        # Playing through applies each delta in turn
+        assert_replayed(replay, states[0])
+        for tick in range(1, TICKS + 1):
+            assert replay.step()
+            assert replay.tick == tick
+            assert_replayed(replay, states[tick])
+        assert not replay.step()
+
+        # Seeking backwards and forwards across keyframes
+        for tick in (2, 9, 8, 0, 13, 5, 15, 4, 12):
+            replay.seek(tick)
+            assert replay.tick == tick
+            assert_replayed(replay, states[tick])
+    finally:
+        replay.close()
+
+def test_unfinished_frame_is_ignored(tmp_path):
+    filename = str(tmp_path / "world.rec")
+    colours = np.zeros((8, 4))
+    recorder = Recorder(filename, 2, 2, 2)
+    recorder.record(0, np.zeros(8), np.zeros(8), np.zeros(8), colours)
+    recorder.record(1, np.ones(8), np.arange(8.0), np.zeros(8), colours)
+    recorder.close()
+    with open(filename, "r+b") as output:
+        output.truncate(output.seek(0, 2) - 1)
+
+    replay = Replay(filename)
+    try:
+        assert replay.ticks == [0]
+        assert not replay.step()
+    finally:
+        replay.close()
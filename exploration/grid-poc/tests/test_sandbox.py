@@ -0,0 +1,104 @@
+#!/bin/python3
+# vim: et:ts=4:sts=4:sw=4
+
+# SPDX-License-Identifier: BSD-2-Clause
+# Copyright © 2024 The Alan Turing Institute
+
+# Sandbox tests
+
+import random
+from time import monotonic
+import numpy as np
+import pytest
+
+from src.arraygrid import (
+    ArrayGrid,
+)
+
+from src.batch import (
+    CellBatch,
+)
+
+from src.plantlang import (
+    Shrub,
+)
+
+from src.plants import (
+    Plant,
+)
+
+from src.sandbox import (
+    Bot,
+    Sandbox,
+)
+
+from sandbox_bots import (
+    Single,
+    Deaf,
+    Sleeper,
+    Oversized,
+)
+
+TIME_LIMIT = 0.5
+
+def cells(count):
+    """
+    Returns a batch of plant cells with some energy to spend
+    """
+    return CellBatch(
+        np.arange(count),
+        np.full(count, 4.0),
+        np.full(count, 20.0),
+        np.full((count, 6), 3, dtype=np.int8),
+        np.zeros((count, 6)),
+        np.zeros((count, 4)),
+        np.full(count, 0.5),
+        np.zeros((count, 6)),
+        np.zeros((count, 6)),
+    )
+
+@pytest.mark.parametrize("species, count, failure", [
+    # The request is far larger than the pipe can buffer
+    (Deaf, 20000, "took longer than 0.5s reading its cells"),
+    (Sleeper, 10, "took longer than 0.5s updating"),
+    (Oversized, 10, "sent an invalid reply while updating"),
+])
+def test_misbehaving_bot_is_stopped(species, count, failure):
+    bot = Bot(species, TIME_LIMIT)
+    try:
+        batch = cells(count)
+        energy = batch.energy.copy()
+        start = monotonic()
+        assert not bot.update(batch)
+        assert monotonic() - start < TIME_LIMIT + 2.0
+        assert bot.failure == failure
+        assert bot.process.poll() is not None
+        # The cells are left as they were, and take no more actions
+        assert np.array_equal(batch.energy, energy)
+        assert not bot.update(batch)
+    finally:
+        if bot.failure is None:
+            bot.close()
+
+def test_sandboxed_match_matches_unsandboxed():
+    species = (Plant, Shrub, Single)
+    grids = []
+    for sandboxed in (False, True):
+        random.seed(2)
+        grid = ArrayGrid(16, 16, 8)
+        grid.species = species
+        grid.populate()
+        if sandboxed:
+            grid.sandbox = Sandbox(time_limit=10.0)
+        try:
+            grid.run(40)
+        finally:
+            if grid.sandbox is not None:
+                assert all(grid.sandbox.failure(cls) is None for cls in species)
+                grid.sandbox.close()
+        grids.append(grid)
+    unsandboxed, sandboxed = grids
+    for name in ArrayGrid.CHECKPOINT_ARRAYS:
+        assert np.array_equal(getattr(unsandboxed, name), getattr(sandboxed, name)), name
+    assert unsandboxed.statistics() == sandboxed.statistics()
+    assert len(sandboxed.statistics()["species"]) == len(species)
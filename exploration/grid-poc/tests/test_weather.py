@@ -0,0 +1,120 @@
+#!/bin/python3
+# vim: et:ts=4:sts=4:sw=4
+
+# SPDX-License-Identifier: BSD-2-Clause
+# Copyright © 2024 The Alan Turing Institute
+
+# Weather tests
+
+import random
+import numpy as np
+import pytest
+
+from src.arraygrid import (
+    ArrayGrid,
+)
+
+from src.cells import (
+    CellType,
+)
+
+from src.weather import (
+    Climate,
+    Weather,
+)
+
+WIDTH, DEPTH, HEIGHT = 20, 16, 6
+PERIODS = 30
+
+def world():
+    """
+    Returns the cell types of a world with two layers of Soil, and Rock
+    along the first row
+    """
+    cell_type = np.full((WIDTH, DEPTH, HEIGHT), CellType.AIR.value, dtype=np.int8)
+    cell_type[:, :, :2] = CellType.SOIL.value
+    cell_type[:, 0, :2] = CellType.ROCK.value
+    return cell_type.reshape(-1)
+
+def showers(climate, ticks):
+    """
+    Returns the tick and centre of every shower over some ticks
+    """
+    return [(tick, climate.shower(tick)) for tick in ticks if climate.shower(tick) is not None]
+
+def test_showers_are_deterministic():
+    ticks = range(PERIODS * 7)
+    planned = showers(Climate(rain_period=7, seed=5), ticks)
+    # One shower in each period
+    assert [tick // 7 for tick, _ in planned] == list(range(PERIODS))
+    # The same whichever order the ticks are asked about in
+    assert showers(Climate(rain_period=7, seed=5), reversed(ticks)) == planned[::-1]
+    assert showers(Climate(rain_period=7, seed=6), ticks) != planned
+    assert showers(Climate(), ticks) == []
+
+@pytest.mark.parametrize("periodic", [False, True])
+def test_rainfall_totals(periodic):
+    climate = Climate(rain_period=5, rain=2.0, radius=3, seed=9)
+    weather = Weather(WIDTH, DEPTH, HEIGHT, periodic, climate)
+    cell_type = world()
+    water = np.zeros(len(cell_type))
+    expected = 0.0
+    for tick in range(PERIODS * 5):
+        wet, rain = weather.rain(tick, cell_type)
+        water[wet] += rain
+        centre = climate.shower(tick)
+        if centre is None:
+            assert len(wet) == 0
+            continue
+        # Count the Soil columns under the shower by hand
+        cx, cy = int(centre[0] * WIDTH), int(centre[1] * DEPTH)
+        columns = 0
+        for x in range(WIDTH):
+            for y in range(1, DEPTH):
+                dx, dy = x - cx, y - cy
+                if periodic:
+                    dx = min(dx % WIDTH, -dx % WIDTH)
+                    dy = min(dy % DEPTH, -dy % DEPTH)
+                columns += dx * dx + dy * dy <= 9
+        expected += columns * 2.0
+    assert water.sum() == expected
+    # Only the surface Soil is rained on, and not the Rock
+    layers = water.reshape(WIDTH, DEPTH, HEIGHT)
+    assert not layers[:, :, 0].any() and not layers[:, 0].any()
+    assert layers[:, 1:, 1].any()
+
+def test_evaporation():
+    climate = Climate(evaporation=0.25, evaporation_period=4)
+    weather = Weather(WIDTH, DEPTH, HEIGHT, False, climate)
+    cell_type = world()
+    for tick in range(12):
+        dry, loss = weather.drying(tick, cell_type)
+        if tick % 4:
+            assert len(dry) == 0
+        else:
+            # The surface Soil loses the water of every tick since it last did
+            assert loss == 1.0
+            assert dry.tolist() == [
+                (x * DEPTH + y) * HEIGHT + 1 for x in range(WIDTH) for y in range(1, DEPTH)
+            ]
+
+    # A column whose surface changes is scanned again
+    cell_type = cell_type.copy()
+    grown = (2 * DEPTH + 3) * HEIGHT + 2
+    cell_type[grown] = CellType.PLANT.value
+    weather.changed([grown])
+    dry, loss = weather.drying(0, cell_type)
+    assert grown - 1 not in dry.tolist()
+    assert len(dry) == WIDTH * (DEPTH - 1) - 1
+
+def test_worlds_with_the_same_climate_match():
+    waters = []
+    for seed in (3, 3, 4):
+        random.seed(1)
+        grid = ArrayGrid(16, 16, 8)
+        grid.populate()
+        grid.set_climate(Climate(rain_period=4, evaporation=0.1, seed=seed))
+        grid.run(24)
+        waters.append(grid.water.copy())
+    assert np.array_equal(waters[0], waters[1])
+    assert not np.array_equal(waters[0], waters[2])
@@ -0,0 +1,410 @@
+#!/bin/python3
+# vim: et:ts=4:sts=4:sw=4
+
+# SPDX-License-Identifier: BSD-2-Clause
+# Copyright © 2024 The Alan Turing Institute
+
+# Tournament
+
+import argparse
+import importlib
+import json
+import math
+import os
+import random
+import sys
+from functools import lru_cache
+from multiprocessing import Pool
+from time import perf_counter
+
+from world import (
+    Grid,
+    ArrayGrid,
+)
+
+from src.scheduler import (
+    Schedule,
+)
+
+from src.sandbox import (
+    Sandbox,
+)
+
+from src.lighting import (
+    Sun,
+)
+
+from src.weather import (
+    Climate,
+)
+
+from src.checkpoint import (
+    class_name,
+)
+
+@lru_cache(maxsize=None)
+def load_species(name):
+    """
+    Returns the Plant subclass for a species
+
+    Species are named by their import path, for example "src.plants.Plant".
+    Each worker process loads a species once and then reuses it.
+
+    Args:
+        name dotted path of the species class
+
+    Returns:
+        The species class
+    """
+    module, _, cls = name.rpartition(".")
+    return getattr(importlib.import_module(module), cls)
+
+def create_matches(count, first_seed, species, ticks, width, depth, height, terrain, backend="objects", periodic=True,
+        schedule=None, checkpoint_dir=None, checkpoint_every=None, sandbox=None, sun=None,
+        climate=None):
+    """
+    Create the list of matches to play
+
+    Every match uses the same species, world size and terrain, but a
+    different seed.
+
+    Args:
+        count number of matches
+        first_seed seed for the first match; the rest follow on
+        species list of species names to compete in each match
+        ticks number of ticks each match lasts
+        width, depth, height dimensions of the world
+        terrain dictionary of Grid terrain attributes to override
+        backend "objects" or "arrays"
+        periodic whether the world wraps at its edges
+        schedule dictionary of Schedule periods to override
+        checkpoint_dir directory to save a checkpoint of each match in, or
+            None for no checkpoints
+        checkpoint_every ticks between checkpoints, or None to only save
+            one at the end of the match
+        sandbox dictionary of Sandbox arguments to run each species in a
+            process of its own, or None to run them in the match's process;
+            needs the arrays backend
+        sun dictionary of Sun arguments to light the world with, or None to
+            light plants evenly
+        climate dictionary of Climate arguments for the weather, or None
+            for no weather; the showers are placed using the match's seed
+
+    Returns:
+        List of matches, each a dictionary
+    """
+    return [
+        {
+            "match": number,
+            "seed": first_seed + number,
+            "species": list(species),
+            "ticks": ticks,
+            "width": width,
+            "depth": depth,
+            "height": height,
+            "terrain": dict(terrain),
+            "backend": backend,
+            "periodic": periodic,
+            "schedule": dict(schedule or {}),
+            "checkpoint": (os.path.join(checkpoint_dir, "match-{:04d}.ckpt".format(number))
+                if checkpoint_dir else None),
+            "checkpoint_every": checkpoint_every,
+            "sandbox": dict(sandbox) if sandbox else None,
+            "sun": dict(sun) if sun else None,
+            "climate": dict(climate, seed=first_seed + number) if climate else None,
+        }
+        for number in range(count)
+    ]
+
+def play(match):
+    """
+    Play a single match
+
+    If the match has a checkpoint file it's saved as the match goes along,
+    and if the file already exists the match carries on from it. So an
+    interrupted tournament can be run again and will pick up where it left
+    off, with the same results.
+
+    In a sandboxed match a species whose bot is stopped, see Sandbox, takes
+    no more actions, and the reason is given in its results.
+
+    Args:
+        match dictionary describing the match
+
+    Returns:
+        Dictionary of the match outcome, with statistics for each species
+    """
+    start = perf_counter()
+    if match["backend"] == "arrays":
+        grid = ArrayGrid(match["width"], match["depth"], match["height"], match["periodic"])
+    else:
+        grid = Grid()
+        grid.width = match["width"]
+        grid.depth = match["depth"]
+        grid.height = match["height"]
+        grid.periodic = match["periodic"]
+    for name, value in match["terrain"].items():
+        setattr(grid, name, value)
+    grid.species = tuple(load_species(name) for name in match["species"])
+    grid.schedule = Schedule(**match["schedule"])
+
+    checkpoint = match.get("checkpoint")
+    if checkpoint and os.path.exists(checkpoint):
+        if match["backend"] == "arrays":
+            grid = ArrayGrid.load_checkpoint(checkpoint)
+        else:
+            grid.load_checkpoint(checkpoint)
+    else:
+        random.seed(match["seed"])
+        grid.populate()
+        if match.get("sun"):
+            grid.set_sun(Sun(**match["sun"]))
+        if match.get("climate"):
+            grid.set_climate(Climate(**match["climate"]))
+
+    sandbox = None
+    if match.get("sandbox"):
+        sandbox = Sandbox(**match["sandbox"])
+        sandbox.start(load_species(name) for name in match["species"])
+        grid.sandbox = sandbox
+
+    every = match.get("checkpoint_every") or match["ticks"]
+    try:
+        while grid.ticks < match["ticks"]:
+            grid.run(min(every, match["ticks"] - grid.ticks))
+            if checkpoint:
+                grid.save_checkpoint(checkpoint)
+    finally:
+        if sandbox:
+            sandbox.close()
+
+    stats = grid.statistics()
+    species = {}
+    for name in match["species"]:
+        cls = load_species(name)
+        # Keyed by import path, so species whose classes share a name are kept apart
+        path = class_name(cls)
+        totals = stats["species"].get(path, {"cells": 0, "water": 0.0, "energy": 0.0})
+        seeds = [index for index, seed_species in grid.seed_cells if seed_species == path]
+        species[name] = {
+            "biomass": totals["cells"],
+            "water": totals["water"],
+            "energy": totals["energy"],
+            "seeds": len(seeds),
+            "surviving": sum(1 for index in seeds if grid.species_at(index) == path),
+        }
+        if sandbox:
+            species[name]["failure"] = sandbox.failure(cls)
+
+    ranked = sorted(species, key=lambda name: (species[name]["biomass"], species[name]["energy"]), reverse=True)
+    return {
+        "match": match["match"],
+        "seed": match["seed"],
+        "winner": ranked[0] if species[ranked[0]]["biomass"] > 0 else None,
+        "species": species,
+        "seconds": perf_counter() - start,
+    }
+
+def play_batch(batch):
+    """
+    Play a batch of matches in the same worker
+
+    Args:
+        batch list of matches
+
+    Returns:
+        List of match outcomes
+    """
+    return [play(match) for match in batch]
+
+def create_batches(matches, batch_size):
+    """
+    Split the matches into batches for dispatch to the workers
+
+    Args:
+        matches list of matches
+        batch_size maximum number of matches in a batch
+
+    Returns:
+        List of batches
+    """
+    return [matches[pos:pos + batch_size] for pos in range(0, len(matches), batch_size)]
+
+def run_tournament(matches, workers=None, batch_size=None):
+    """
+    Play every match across a pool of worker processes
+
+    The matches are sent to the workers in batches. Each worker process
+    imports the world and loads the species once, then plays every match it
+    is given, so start-up costs are paid once per worker rather than once
+    per match.
+
+    Args:
+        matches list of matches
+        workers number of worker processes, or None for one per CPU
+        batch_size matches per batch, or None to give each worker a few
+            batches so the load stays balanced
+
+    Yields:
+        Match outcomes, in the order they finish
+    """
+    workers = workers or os.cpu_count() or 1
+    if batch_size is None:
+        batch_size = max(1, math.ceil(len(matches) / (workers * 4)))
+    batches = create_batches(matches, batch_size)
+    if workers == 1:
+        for batch in batches:
+            yield from play_batch(batch)
+        return
+    with Pool(processes=workers) as pool:
+        for results in pool.imap_unordered(play_batch, batches):
+            yield from results
+
+def summarise(results):
+    """
+    Combine the outcomes of all the matches
+
+    Args:
+        results list of match outcomes
+
+    Returns:
+        Dictionary of totals for each species
+    """
+    summary = {}
+    for result in results:
+        for name, stats in result["species"].items():
+            totals = summary.setdefault(name, {
+                "matches": 0, "wins": 0, "biomass": 0, "energy": 0.0, "water": 0.0, "seeds": 0, "surviving": 0,
+                "failures": 0,
+            })
+            totals["matches"] += 1
+            totals["wins"] += 1 if result["winner"] == name else 0
+            totals["failures"] += 1 if stats.get("failure") else 0
+            for key in ("biomass", "energy", "water", "seeds", "surviving"):
+                totals[key] += stats[key]
+    return summary
+
+def parse_args(argv=None):
+    """
+    Parse the command line arguments
+
+    Args:
+        argv list of arguments, or None to use sys.argv
+
+    Returns:
+        Parsed arguments
+    """
+    parser = argparse.ArgumentParser(description="Run a Plantworld tournament")
+    parser.add_argument("--species", nargs="+", default=["src.plants.Plant"],
+        help="import paths of the competing species, e.g. src.plants.Plant")
+    parser.add_argument("--matches", type=int, default=16, help="number of matches to play")
+    parser.add_argument("--first-seed", type=int, default=0, help="seed of the first match")
+    parser.add_argument("--ticks", type=int, default=200, help="ticks per match")
+    parser.add_argument("--width", type=int, default=Grid.width, help="grid size in x")
+    parser.add_argument("--depth", type=int, default=Grid.depth, help="grid size in y")
+    parser.add_argument("--height", type=int, default=Grid.height, help="grid size in z")
+    parser.add_argument("--peak-x", type=float, default=Grid.peak_x, help="x position of the terrain peak")
+    parser.add_argument("--peak-y", type=float, default=Grid.peak_y, help="y position of the terrain peak")
+    parser.add_argument("--spread", type=float, default=Grid.spread, help="width of the terrain peak")
+    parser.add_argument("--seeds", type=int, default=Grid.seeds, help="seeds planted per match")
+    parser.add_argument("--spring", type=float, default=Grid.spring, help="water placed at the highest point")
+    parser.add_argument("--backend", choices=["objects", "arrays"], default="objects", help="cell storage to use")
+    parser.add_argument("--no-wrap", dest="periodic", action="store_false",
+        help="don't wrap the world at its edges")
+    parser.add_argument("--water-period", type=int, default=1, metavar="TICKS",
+        help="update the flow of water through the soil every TICKS ticks")
+    parser.add_argument("--pump-period", type=int, default=1, metavar="TICKS",
+        help="update the flow of water through plants every TICKS ticks")
+    parser.add_argument("--sun-period", type=int, default=1, metavar="TICKS",
+        help="give plants sunlight every TICKS ticks")
+    parser.add_argument("--reproduce-period", type=int, default=1, metavar="TICKS",
+        help="let plants reproduce every TICKS ticks")
+    parser.add_argument("--lighting", action="store_true",
+        help="let plants and terrain shade the plants below them from the sun")
+    parser.add_argument("--day-length", type=int, default=0, metavar="TICKS",
+        help="move the sun across the sky over a day of TICKS ticks, half of it night; implies --lighting")
+    parser.add_argument("--rain-period", type=int, default=0, metavar="TICKS",
+        help="let a shower fall on part of the world once every TICKS ticks")
+    parser.add_argument("--rain", type=float, default=8.0, metavar="WATER",
+        help="water added to each surface cell a shower falls on")
+    parser.add_argument("--rain-radius", type=int, default=6, metavar="CELLS",
+        help="radius of each shower")
+    parser.add_argument("--evaporation", type=float, default=0.0, metavar="WATER",
+        help="water evaporating from each surface Soil cell per tick")
+    parser.add_argument("--checkpoint-dir", metavar="DIR",
+        help="save a checkpoint of each match in DIR, and resume matches from them")
+    parser.add_argument("--checkpoint-every", type=int, default=None, metavar="TICKS",
+        help="ticks between checkpoints (default only at the end of each match)")
+    parser.add_argument("--sandbox", action="store_true",
+        help="run each species in a process of its own, stopping any that are too slow or crash "
+        "(needs --backend arrays)")
+    parser.add_argument("--time-limit", type=float, default=1.0, metavar="SECONDS",
+        help="time each sandboxed species has to update its cells each tick")
+    parser.add_argument("--memory-limit", type=int, default=None, metavar="MB",
+        help="memory each sandboxed species may use")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default one per CPU)")
+    parser.add_argument("--batch", type=int, default=None, help="matches sent to a worker at a time")
+    parser.add_argument("--output", metavar="FILE", help="write each match outcome to FILE as JSON lines")
+    args = parser.parse_args(argv)
+    if args.sandbox and args.backend != "arrays":
+        parser.error("--sandbox needs --backend arrays")
+    return args
+
+if __name__ == "__main__":
+    """
+    Tournament entry point
+    """
+    args = parse_args()
+    terrain = {
+        "peak_x": args.peak_x,
+        "peak_y": args.peak_y,
+        "spread": args.spread,
+        "seeds": args.seeds,
+        "spring": args.spring,
+    }
+    schedule = {
+        "water": args.water_period,
+        "pumping": args.pump_period,
+        "sunlight": args.sun_period,
+        "reproduction": args.reproduce_period,
+    }
+    sandbox = None
+    if args.sandbox:
+        sandbox = {
+            "time_limit": args.time_limit,
+            "memory_limit": args.memory_limit * 1024 * 1024 if args.memory_limit else None,
+        }
+    sun = None
+    if args.lighting or args.day_length:
+        sun = {"day_length": args.day_length}
+    climate = None
+    if args.rain_period or args.evaporation:
+        climate = {
+            "rain_period": args.rain_period,
+            "rain": args.rain,
+            "radius": args.rain_radius,
+            "evaporation": args.evaporation,
+        }
+    matches = create_matches(args.matches, args.first_seed, args.species, args.ticks,
+        args.width, args.depth, args.height, terrain, args.backend, args.periodic, schedule,
+        args.checkpoint_dir, args.checkpoint_every, sandbox, sun, climate)
+    if args.checkpoint_dir:
+        os.makedirs(args.checkpoint_dir, exist_ok=True)
+
+    start = perf_counter()
+    results = []
+    output = open(args.output, "w") if args.output else None
+    for result in run_tournament(matches, args.workers, args.batch):
+        results.append(result)
+        if output:
+            output.write(json.dumps(result) + "\n")
+    if output:
+        output.close()
+    elapsed = perf_counter() - start
+
+    json.dump({
+        "matches": len(results),
+        "seconds": elapsed,
+        "species": summarise(results),
+    }, sys.stdout, indent=2)
+    print()
@@ -6,18 +6,23 @@
 
 # World
 
-from time import sleep
+from time import sleep, perf_counter
+import argparse
+import importlib
+import json
+import sys
 import numpy as np
 import math
-import copy
 import random
+import shutil
+from array import array
+from itertools import chain
 from math import floor
-from threading import Thread, Lock
-from typing import Tuple
-
-import src.voxels as vxm
+from multiprocessing import get_context
+from threading import Thread
 
 from src.cells import (
+    face_array,
     Direction,
     State,
     States,
@@ -26,109 +31,240 @@ from src.cells import (
     Soil,
     Rock,
     CellType,
+    CELL_TYPE_NAMES,
 )
 
 from src.plants import (
     Plant,
 )
 
+from src.flux import (
+    limit_flux,
+)
+
 from src.utils import (
-    opposite,
+    OPPOSITE,
+)
+
+from src.topology import (
+    topology,
+)
+
+from src.arraygrid import (
+    ArrayGrid,
+)
+
+from src.mappedgrid import (
+    MappedGrid,
+)
+
+from src.parallelgrid import (
+    ParallelGrid,
+)
+
+from src.profiling import (
+    Profiler,
+    JsonLinesExporter,
+)
+
+from src.scheduler import (
+    Schedule,
+)
+
+from src.checkpoint import (
+    write_checkpoint,
+    read_checkpoint,
+    class_name,
+)
+
+from src.recording import (
+    Recorder,
+)
+
+from src.lighting import (
+    Sun,
+    Lighting,
+    CellTypes,
+)
+
+from src.terrain import (
+    terrain,
+    topsoil,
+)
+
+from src.weather import (
+    Climate,
+    Weather,
+)
+
+from src.framebuffer import (
+    FrameBuffer,
+    SharedFrameBuffer,
 )
 
 class Grid():
     width = 16
     depth = 16
     height = 8
+    periodic = True
+
+    # Terrain
+    peak_x = 5
+    peak_y = 5
+    spread = 2.5
+    spring = 8192
+
+    # The plant species to seed the world with, in turn
+    species = (Plant,)
+    seeds = 16
 
     """ Holds the data for the cells in the world"""
-    grid = []
+    topology = None
+    cells = []
+    seed_cells = []
     energies = []
     reproduce = []
 
-    # Threading
-    render_lock = None
+    # Plant cells that tried to reproduce during the update, and the cells
+    # they won, in index order, see fight()
+    attempts = []
+    winners = []
+
+    # Set to a Profiler to instrument each tick
+    profiler = None
+
+    # Set by start_recording to stream each tick to disk
+    recorder = None
+
+    # How often each subsystem is updated, and the number of ticks so far
+    schedule = Schedule()
+    ticks = 0
+    # Whether Air, Rock, Soil and Plant cells calculate their water flow this
+    # tick, and the scale applied to it, indexed by CellType value
+    flowing = [False, False, True, True]
+    flow_scale = [1, 1, 1, 1]
+    sunlight_due = True
+    sunlight_scale = 1
+    reproduction_due = True
+
+    # Shading and the time of day, see set_sun(), or None for the sun to
+    # light every Plant face touching Air evenly
+    lighting = None
+
+    # Rain and evaporation, see set_climate(), or None for no weather
+    weather = None
+
+    # Active set scheduling, see update_active()
+    active_set = True
+    active = None
+    changed = set()
+    # The cells that can have changed during the last tick, or None for
+    # every cell
+    updated = None
+
+    # Threading, see FrameBuffer
+    frames = None
     colours = []
 
-    def fill(self, where, what):
+    def fill(self, what):
         """
-        Create a three dimensional array of 'what's and store them in 'where'
+        Create a flat list of 'what's, one for each cell in the grid
+
+        The items are in the same order as the cells, see Topology.
 
         Args:
-            where a variable to store the resulting three dimensional list
             what a function to call that returns the item to store in each cell
+
+        Returns:
+            List of items, one for each cell
         """
-        for x in range(self.width):
-            row = []
-            for y in range(self.depth):
-                column = []
-                for z in range(self.height):
-                    item = what(x, y, z)
-                    column.append(item)
-                row.append(column)
-            where.append(row)
+        return [
+            what(x, y, z)
+            for x in range(self.width)
+            for y in range(self.depth)
+            for z in range(self.height)
+        ]
 
     def apply(self, what):
         """
-        Apply a function to every cell in the three dimensional grid
+        Apply a function to every active cell in the grid
 
-        The function must accept four parameters: cell, x, y, z.
+        The function must accept two parameters: cell, index. The cells are
+        visited in index order. Until the active set has been built this is
+        every cell in the grid.
 
         Args:
             what function to apply to every cell in the grid
         """
-        for x in range(self.width):
-            for y in range(self.depth):
-                for z in range(self.height):
-                    cell = self.cell(x, y, z)
-                    what(cell, x, y, z)
+        cells = self.cells
+        for index in self.active_cells():
+            what(cells[index], index)
 
-    def fill_land(self, fertile, gauss_z, x, y, z):
+    def active_cells(self):
         """
-        The function used to fill the land
-
-        Returns an object to store in each cell of the grid.
+        Returns the indices of the cells to update this tick, in order
 
-        Args:
-            fertile array to store locations of fertile soil
-            gauss_z height of the guassian curve at this point
-            x, y, z position in the grid
+        Returns:
+            Sorted sequence of cell indices
         """
-        if z == 0:
-            item = Rock()
-        else:
-            # xnorm = (x - (self.width / 2.0) / (self.width / 2.0))
-            # ynorm = (y - (self.depth / 2.0) / (self.depth / 2.0))
-            znorm = (z - (self.height / 2.0) / (self.height / 2.0))
-            height = gauss_z[x][y] - 1
-            # height = 0.0 + (2.0 * math.sin(0.13 * math.pi * xnorm) + math.cos(0.1 * math.pi * ynorm))
-            if znorm < height:
-                item = Rock()
-            elif znorm < height + 2:
-                item = Soil()
-                fertile.append((x, y, z))
-            else:
-                item = Air()
-        return item
+        if self.active is None:
+            return range(self.topology.size)
+        return self.active
 
-    def init_pressure(self, cell, x, y, z):
+    def update_active(self):
         """
-        Initialise the pressur values in teh grid
-
-        Args:
-            cell to apply the pressure values to
-            x, y, z position in the grid
+        Work out which cells can change during the next tick
+
+        Rock and Air cells, and dry Soil that has settled, do nothing during a
+        tick unless one of their neighbours is doing something. So rather than
+        update every cell, only the active set is updated: the cells that
+        might change, plus their neighbours.
+
+        A cell might change if it is a Plant, if it is Soil holding water or
+        with a non-zero pressure from a neighbouring Soil or Plant cell, or
+        if its water changed during this tick. Cells outside the active set
+        would be left exactly as they are by the update, so skipping them
+        doesn't change the result.
+
+        The set is rebuilt after every tick from the cells that were updated,
+        so the cost scales with the amount of activity rather than the size
+        of the world.
         """
-        if cell.cell_type == CellType.ROCK:
-            for direction in range(len(Direction)):
-                reverse = opposite(direction).value
-                neighbour = self.neighbour(x, y, z, direction)
-                neighbour.water_pressure_external[reverse] = 10000.0
+        if not self.active_set:
+            self.active = None
+            return
+
+        cells = self.cells
+        rows = self.topology.rows
+        seeds = self.changed
+        for index in self.active_cells():
+            cell = cells[index]
+            if cell.cell_type == CellType.PLANT:
+                seeds.add(index)
+            elif cell.cell_type == CellType.SOIL:
+                if cell.water != 0:
+                    seeds.add(index)
+                    continue
+                for direction, neighbour_type in enumerate(cell.neighbour_type):
+                    if neighbour_type == CellType.SOIL or neighbour_type == CellType.PLANT:
+                        if cell.water_pressure_external[direction] != 0:
+                            seeds.add(index)
+                            break
+
+        active = set(seeds)
+        for index in seeds:
+            active.update(rows[index])
+        active.discard(self.topology.ghost)
+        self.active = sorted(active)
+        self.changed = set()
 
     def populate(self):
         """
         Populate the world grid with suitable content.
 
+        The terrain, the spring and the seeds are worked out as arrays over
+        the whole world, see terrain(), and only then turned into cells.
+
         Args:
             None
 
@@ -136,91 +272,150 @@ class Grid():
             None
         """
 
-        self.grid = []
-
-        def gaussian_surface_3d(grid_size: int = self.width, A: float = self.height, x0: float = 0, y0: float = 0, 
-                        sigma_x: float = 2.5, sigma_y: float = 2.5) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
-            """
-            Generates a 3D Gaussian surface.
-
-            Args:
-                grid_size (int): The size of the grid (default is 24).
-                A (float): Amplitude of the Gaussian (default is 1).
-                x0 (float): X-coordinate of the Gaussian center (default is 12).
-                y0 (float): Y-coordinate of the Gaussian center (default is 12).
-                sigma_x (float): Standard deviation along the X-axis (default is 5).
-                sigma_y (float): Standard deviation along the Y-axis (default is 5).
-
-            Returns:
-                Tuple[np.ndarray, np.ndarray, np.ndarray]: X, Y, and Z coordinates of the Gaussian surface.
-            """
-            x = np.linspace(0, grid_size - 1, grid_size)
-            y = np.linspace(0, grid_size - 1, grid_size)
-            x, y = np.meshgrid(x, y)
-
-            z = A * np.exp(-((x - x0) ** 2 / (2 * sigma_x ** 2) + (y - y0) ** 2 / (2 * sigma_y ** 2)))
-
-            return (x, y, z)
-
-        gauss_x, gauss_y, gauss_z = gaussian_surface_3d(grid_size=int(self.width * 2), A=(2.5 * self.height) / 4, x0=5, y0=5)
-        fertile = []
-        self.fill(self.grid, lambda x, y, z: self.fill_land(fertile, gauss_z, x, y, z))
-
-        def find_highest_point(fertile):
-            """
-            Find the highest point in the list of fertile locations
-            """
-            (highest_x, highest_y, highest_z) = (0,0,0)
-            for cell in fertile:
-                (cell_x, cell_y, cell_z) = cell
-                if cell_z > highest_z:
-                    (highest_x, highest_y, highest_z) = cell
-            return (highest_x, highest_y, highest_z)
-
-        # cloud_seed = random.randint(0,len(fertile))
-        # (cloud_x, cloud_y, cloud_z) = fertile[cloud_seed]
-
-        (highest_x,highest_y,highest_z) = find_highest_point(fertile)
-        self.grid[highest_x][highest_y][highest_z].water = 8192
-
-        def find_topsoil(fertile, x, y):
-            """
-            Find the highest point on the map that's also soil
-            """
-            (highest_x, highest_y, highest_z) = (0, 0, 0)
-            for cell in fertile:
-                (cell_x, cell_y, cell_z) = cell
-                if (cell_x == x) and (cell_y == y):
-                    if cell_z > highest_z:
-                        (highest_x, highest_y, highest_z) = cell
-            return (highest_x, highest_y, highest_z)
-
-        # Place seeds on the map
-        for _ in range(16):
+        self.topology = topology(self.width, self.depth, self.height, self.periodic)
+        self.active = None
+        self.changed = set()
+        self.updated = None
+        self.ticks = 0
+        height = self.height
+
+        rock, soil = terrain(0, self.width, self.depth, height, self.peak_x, self.peak_y, self.spread)
+        types = np.where(rock, CellType.ROCK.value, np.where(soil, CellType.SOIL.value, CellType.AIR.value))
+        makers = {CellType.AIR.value: Air, CellType.ROCK.value: Rock, CellType.SOIL.value: Soil}
+        self.cells = [makers[value]() for value in types.ravel().tolist()]
+
+        # The ghost cell that pads the edges of a non-periodic world
+        self.cells.append(Air())
+
+        # Soil cells in index order, and the top soil cell of each column
+        fertile = np.flatnonzero(soil)
+        tops = topsoil(soil).ravel()
+
+        # The first of the highest soil cells gets the spring
+        if len(fertile):
+            self.cells[int(fertile[np.argmax(fertile % height)])].water = self.spring
+
+        # Place seeds on the map, taking each species in turn
+        self.seed_cells = []
+        for seed in range(self.seeds):
+            species = self.species[seed % len(self.species)]
             plant_seed = random.randint(0, len(fertile))
-            (seed_x, seed_y, seed_z) = fertile[plant_seed]
-            (topsoil_x, topsoil_y, topsoil_z) = find_topsoil(fertile, seed_x, seed_y)
-            self.grid[topsoil_x][topsoil_y][topsoil_z] = Plant()
-
-
-        # Set rock to have "infinite" water pressure
-        self.apply(lambda cell, x, y, z: self.init_pressure(cell, x, y, z))
+            # randint() includes the upper bound, so wrap it back onto the list
+            column = int(fertile[plant_seed % len(fertile)]) // height
+            index = column * height + int(tops[column])
+            self.cells[index] = species()
+            self.seed_cells.append((index, class_name(species)))
+
+        # Set rock to have "infinite" water pressure on the faces of the
+        # cells next to it. Rock and Air cells already have it on every face.
+        types = np.append(types.ravel(), CellType.AIR.value)
+        wet = np.flatnonzero(soil)
+        faces = types[self.topology.neighbours[wet]] == CellType.ROCK.value
+        for row, direction in zip(*np.nonzero(faces)):
+            self.cells[int(wet[row])].water_pressure_external[direction] = 10000.0
 
         # Create a grid to store energy values
-        self.fill(self.energies, lambda x, y, z: 0)
+        self.energies = [0] * self.topology.size
 
         # Create a grid to store reproduction intention
-        self.fill(self.reproduce, lambda x, y, z: None)
+        self.reproduce = [None] * self.topology.size
+
+        # Create a grid to store cell colours, as RGBA rows for the renderer
+        self.colours = np.array([cell.colour[:4] for cell in self.cells[:self.topology.size]], dtype=float)
+
+    def save_checkpoint(self, filename):
+        """
+        Save the state of the world to a file
 
-        # Create a grid to store cell colours
-        self.fill(self.colours, lambda x, y, z: (0.0, 0.0, 0.0, 0.0))
+        The cells are gathered into columns and saved in the same format as
+        ArrayGrid.save_checkpoint, along with the active set. Loading the
+        file and carrying on gives exactly the same results as if the world
+        had never stopped.
+
+        Args:
+            filename file to write
+        """
+        meta, arrays = ArrayGrid.from_grid(self).checkpoint()
+        meta["backend"] = "objects"
+        meta["active"] = self.active is not None
+        if self.active is not None:
+            arrays["active"] = np.array(self.active, dtype=np.int64)
+        arrays["changed"] = np.array(sorted(self.changed), dtype=np.int64)
+        write_checkpoint(filename, meta, arrays)
+
+    def load_checkpoint(self, filename):
+        """
+        Restore the state of the world from a file
+
+        This is used in place of populate(). Checkpoints saved by either
+        backend can be loaded.
+
+        Args:
+            filename file to read
+        """
+        meta, saved = read_checkpoint(filename)
+        self.width = meta["width"]
+        self.depth = meta["depth"]
+        self.height = meta["height"]
+        self.periodic = meta["periodic"]
+        self.topology = topology(self.width, self.depth, self.height, self.periodic)
+        self.ticks = meta["ticks"]
+        self.schedule = Schedule(**meta["schedule"])
+        self.seed_cells = [tuple(seed) for seed in meta["seed_cells"]]
+        self.set_sun(Sun(**meta["sun"]) if meta.get("sun") else None)
+        self.set_climate(Climate(**meta["climate"]) if meta.get("climate") else None)
+
+        # Expand the saved state into full columns, convert each column to
+        # a list in one go, then build the cells
+        arrays = ArrayGrid.from_checkpoint(meta, saved)
+        plants = arrays.plants
+        rows = self.topology.rows
+        types = [CellType(value) for value in range(len(CELL_TYPE_NAMES))]
+        cell_types = arrays.cell_type.tolist()
+        water = arrays.water.tolist()
+        energy = arrays.energy.tolist()
+        water_pressure_external = arrays.water_pressure_external.tolist()
+        pressure_gradient = arrays.pressure_gradient.tolist()
+        flux = arrays.flux.tolist()
+        energy_outgoing = arrays.energy_outgoing.tolist()
+        colours = arrays.colours.tolist()
+        self.cells = []
+        for index, cell_type in enumerate(cell_types):
+            if cell_type == CellType.PLANT.value:
+                cell = plants[index]
+            elif cell_type == CellType.SOIL.value:
+                cell = Soil()
+            elif cell_type == CellType.ROCK.value:
+                cell = Rock()
+            else:
+                cell = Air()
+            cell.energy = energy[index]
+            if not cell.static:
+                cell.water = water[index]
+                cell.colour = tuple(colours[index])
+                cell.water_pressure_external = array("d", water_pressure_external[index])
+                cell.flux = array("d", flux[index])
+                cell.neighbour_type = [types[cell_types[neighbour]] for neighbour in rows[index]]
+            if cell.messages:
+                cell.pressure_gradient = array("d", pressure_gradient[index])
+                cell.energy_outgoing = array("d", energy_outgoing[index])
+            self.cells.append(cell)
+
+        size = self.topology.size
+        self.reproduce = [None if direction < 0 else direction for direction in arrays.reproduce[:size].tolist()]
+        self.energies = self.fill(lambda x, y, z: 0)
+        self.colours = arrays.colours[:size].copy()
+        self.active = saved["active"].tolist() if meta.get("active") else None
+        self.changed = set(saved["changed"].tolist()) if "changed" in saved else set()
+        self.updated = None
 
     def cell(self, x, y, z):
         """
         Returns the data structure for a cell
 
         Returns a reference to the Cell object for the given grid location. The
-        co-ordinates wrap in all directions.
+        co-ordinates wrap in all directions, unless the grid isn't periodic, in
+        which case co-ordinates outside the grid return the ghost cell.
 
         Args:
             x, y, z: the co-ordinate of the cell
@@ -228,7 +423,7 @@ class Grid():
         Returns:
             Cell data structure
         """
-        return self.grid[x % self.width][y % self.depth][z % self.height]
+        return self.cells[self.topology.index(x, y, z)]
 
     def energy(self, x, y, z):
         """
@@ -243,7 +438,7 @@ class Grid():
         Returns:
             The energy stored in the cell
         """
-        return self.energies[x % self.width][y % self.depth][z % self.height]
+        return self.energies[self.topology.index(x, y, z)]
 
     def neighbour(self, x, y, z, direction):
         """
@@ -254,72 +449,58 @@ class Grid():
 
         Args:
             x, y, z: the co-ordinate of the cell
-            direction: an instance of the Direction enum
+            direction: the value of a Direction enum
 
         Returns:
             Neighbouring Cell data structure
         """
-        if direction == Direction.LEFT.value:
-            x = x - 1
-        elif direction == Direction.RIGHT.value:
-            x = x + 1
-        elif direction == Direction.BELOW.value:
-            z = z - 1
-        elif direction == Direction.ABOVE.value:
-            z = z + 1
-        elif direction == Direction.FRONT.value:
-            y = y - 1
-        elif direction == Direction.BEHIND.value:
-            y = y + 1
-        else:
-            print("ERROR: {}".format(direction))
-            exit()
-        x = x % self.width
-        y = y % self.depth
-        z = z % self.height
-        return self.grid[x][y][z]
+        return self.cells[self.topology.rows[self.topology.index(x, y, z)][direction]]
 
-    def fight(self, x, y, z):
+    def fight(self):
         """
-        Returns the result of a Plant cell's reproduction action.
+        Decide the result of every Plant cell's reproduction action.
 
         In the event that a Cell wants to reproduce it aims to copy itself into
         an adjacent cell the reproducing cell must fight the incumbant cell
         and any other Plants simultaneously aiming to reproduce into the same
         cell.
 
-        This method returns the result of that fight, in other words, tells us
-        which if the cells succeeds in reproducing into the cell.
+        The plant with the most energy wins, as long as it has more than the
+        incumbent. A tie goes to the first in Direction order, seen from the
+        cell being fought over, and a win from the left is lost.
 
         The reproducing cells will have already indicated their intention to
         reproduce by recording the fact in their respective self.reproduce[]
-        arrays.
+        arrays, and were noted by update_cells(). Only their attempts are
+        looked at, so the cost follows the number of attempts rather than the
+        size of the world.
 
-        Args:
-            x, y, z: the cell into which the reproducting is to occur
-
-        Returns:
-            The direction from which the reproduction can occur, or None
-        """
-        cell = self.cell(x, y, z)
-        energy_max = cell.energy
-        best = None
-        for direction in range(len(Direction)):
-            reverse = opposite(direction).value
-            neighbour = self.neighbour(x, y, z, direction)
-            #print(neighbour.energy, energy_max)
-            if neighbour.reproduce[reverse] and neighbour.energy > energy_max:
-                energy_max = neighbour.energy
-                best = direction
-            neighbour.reproduce[reverse] = None
-
-        if best:
-            self.reproduce[x][y][z] = best
-        else:
-            self.reproduce[x][y][z] = None
-
-
-    def apply_message_pass(self, cell, x, y, z):
+        The winning direction of each cell is recorded in self.reproduce, and
+        the cells in self.winners.
+        """
+        cells = self.cells
+        rows = self.topology.rows
+        ghost = self.topology.ghost
+        best = {}
+        for source in self.attempts:
+            cell = cells[source]
+            for direction, target in enumerate(rows[source]):
+                if cell.reproduce[direction] and target != ghost:
+                    # Ranked by energy, then the first direction
+                    claim = (cell.energy, -OPPOSITE[direction])
+                    if target not in best or claim > best[target]:
+                        best[target] = claim
+            cell.reproduce = [None] * len(Direction)
+        self.attempts = []
+
+        self.winners = []
+        for target in sorted(best):
+            energy, reverse = best[target]
+            if reverse and energy > cells[target].energy:
+                self.reproduce[target] = -reverse
+                self.winners.append(target)
+
+    def apply_message_pass(self, cell, index):
         """
         Pass messages between cells
 
@@ -327,43 +508,53 @@ class Grid():
 
         Args:
             cell to apply to
-            x, y, z position in the grid
+            index position in the grid
         """
-        cell.incoming[Direction.LEFT.value] = self.cell(x - 1, y, z).outgoing[Direction.RIGHT.value]
-        cell.incoming[Direction.RIGHT.value] = self.cell(x + 1, y, z).outgoing[Direction.LEFT.value]
-        cell.incoming[Direction.FRONT.value] = self.cell(x, y - 1, z).outgoing[Direction.BEHIND.value]
-        cell.incoming[Direction.BEHIND.value] = self.cell(x, y + 1, z).outgoing[Direction.FRONT.value]
-        cell.incoming[Direction.BELOW.value] = self.cell(x, y, z - 1).outgoing[Direction.ABOVE.value]
-        cell.incoming[Direction.ABOVE.value] = self.cell(x, y, z + 1).outgoing[Direction.BELOW.value]
-        cell.neighbour_type[Direction.LEFT.value] = self.cell(x - 1, y, z).cell_type
-        cell.neighbour_type[Direction.RIGHT.value] = self.cell(x + 1, y, z).cell_type
-        cell.neighbour_type[Direction.FRONT.value] = self.cell(x, y - 1, z).cell_type
-        cell.neighbour_type[Direction.BEHIND.value] = self.cell(x, y + 1, z).cell_type
-        cell.neighbour_type[Direction.BELOW.value] = self.cell(x, y, z - 1).cell_type
-        cell.neighbour_type[Direction.ABOVE.value] = self.cell(x, y, z + 1).cell_type
-        cell.update_water()
-        cell.update_sunlight()
-
-    def apply_pressure(self, cell, x, y, z):
+        if cell.static:
+            return
+        cells = self.cells
+        rows = self.topology.rows[index]
+        for direction, neighbour in enumerate(rows):
+            cell.neighbour_type[direction] = cells[neighbour].cell_type
+        if cell.messages:
+            for direction, neighbour in enumerate(rows):
+                cell.incoming[direction] = cells[neighbour].outgoing[OPPOSITE[direction]]
+        cell_type = cell.cell_type.value
+        if self.flowing[cell_type]:
+            cell.update_water(self.flow_scale[cell_type])
+        if self.sunlight_due:
+            if self.lighting is not None and cell.cell_type == CellType.PLANT:
+                cell.update_sunlight(self.sunlight_scale, *self.lighting.cell_light(index))
+            else:
+                cell.update_sunlight(self.sunlight_scale)
+
+    def apply_pressure(self, cell, index):
         """
         update the pressure values for a cell
 
         This is applied to every cell every tick of the clock.
 
+        The flux of a neighbour updated less often than every tick is scaled
+        up to move the water of the ticks it missed, so it's scaled back
+        down to give the pressure of a single tick.
+
         Args:
             cell to apply to
-            x, y, z position in the grid
+            index position in the grid
         """
         if cell.cell_type == CellType.SOIL or cell.cell_type == CellType.PLANT:
-            for direction in range(len(Direction)):
-                reverse = opposite(direction).value
-                neighbour = self.neighbour(x, y, z, direction)
+            cells = self.cells
+            for direction, neighbour in enumerate(self.topology.rows[index]):
+                neighbour = cells[neighbour]
                 if neighbour.cell_type == CellType.SOIL or neighbour.cell_type == CellType.PLANT:
-                    cell.water_pressure_external[direction] = neighbour.flux[reverse]
+                    # Keep the last pressure from neighbours not updated this tick
+                    if self.flowing[neighbour.cell_type.value]:
+                        scale = self.flow_scale[neighbour.cell_type.value]
+                        cell.water_pressure_external[direction] = neighbour.flux[OPPOSITE[direction]] / scale
                 else:
                     cell.water_pressure_external[direction] = 9999.0
 
-    def apply_resources(self, cell, x, y, z):
+    def apply_resources(self, cell, index):
         """
         Update the resources for a cell
 
@@ -371,37 +562,68 @@ class Grid():
 
         Args:
             cell to apply to
-            x, y, z position in the grid
+            index position in the grid
         """
         water_incoming = 0
         energy_incoming = 0
-        for direction in range(len(Direction)):
-            reverse = opposite(direction).value
-            neighbour = self.neighbour(x, y, z, direction)
+        cells = self.cells
+        for direction, neighbour in enumerate(self.topology.rows[index]):
+            reverse = OPPOSITE[direction]
+            neighbour = cells[neighbour]
             water_incoming += neighbour.flux[reverse]
-            energy_incoming += neighbour.energy_outgoing[reverse]
-            neighbour.energy_outgoing[reverse] = 0
+            if neighbour.energy_outgoing[reverse]:
+                energy_incoming += neighbour.energy_outgoing[reverse]
+                neighbour.energy_outgoing[reverse] = 0
             #cell.water -= cell.flux[direction]
             #neighbour.flux[reverse] = 0
         cell.apply_flux(water_incoming, energy_incoming)
+        if water_incoming != 0:
+            self.changed.add(index)
 
-    def apply_reproduce(self, cell, x, y, z):
+    def apply_reproduce(self, cell, index):
         """
         Update the reproduction status of a cell
 
-        This is applied to every cell every tick of the clock.
+        This is applied to every cell that won its fight.
 
         Args:
             cell to apply to
-            x, y, z position in the grid
+            index position in the grid
         """
-        direction = self.reproduce[x][y][z]
+        direction = self.reproduce[index]
         if direction != None:
-            child = copy.deepcopy(self.neighbour(x, y, z, direction))
-            self.grid[x][y][z] = child
-            child.water = 0
-            child.energy = 0
-        self.reproduce[x][y][z] = False
+            self.cells[index] = self.cells[self.topology.rows[index][direction]].spawn()
+            if self.profiler is not None:
+                self.profiler.count("reproductions")
+            if self.lighting is not None:
+                self.lighting.changed(index)
+            if self.weather is not None:
+                self.weather.changed(index)
+        self.reproduce[index] = None
+
+    def apply_flux_limits(self):
+        """
+        Apply the flux constraints to every Soil and Plant cell at once
+
+        Gathers the fluxes into a single array and applies the batched flux
+        limiter, rather than calling update_flux on each cell in turn. The
+        result is the same as calling Cell.update_flux on each cell.
+        """
+        cells = self.cells
+        indices = [
+            index for index in self.active_cells()
+            if cells[index].cell_type == CellType.SOIL or cells[index].cell_type == CellType.PLANT
+        ]
+        if not indices:
+            return
+
+        flux = np.array([cells[index].flux for index in indices], dtype=float)
+        water = np.array([cells[index].water for index in indices], dtype=float)
+        flux, limited = limit_flux(flux, water, self.profiler)
+        for index, cell_flux, cell_water in zip(indices, flux.tolist(), limited.tolist()):
+            cells[index].flux = array("d", cell_flux)
+            cells[index].water = cell_water
+        self.changed.update(np.asarray(indices)[limited != water].tolist())
 
     def apply_flux_reset(self, cell):
         """
@@ -413,9 +635,10 @@ class Grid():
             cell to apply to
             x, y, z position in the grid
         """
-        cell.flux = [0] * len(Direction)
+        if not cell.static:
+            cell.flux = face_array()
 
-    def apply_colour(self, x, y, z):
+    def apply_colour(self, cell, index):
         """
         Record the colour of a cell for use by the renderer
 
@@ -423,54 +646,259 @@ class Grid():
 
         Args:
             cell to apply to
-            x, y, z position in the grid
+            index position in the grid
+        """
+        # Plant colours can carry a stray fifth element
+        self.colours[index] = cell.colour[:4]
+
+    def start_tick(self):
+        """
+        Work out which subsystems are updated this tick
+
+        See Schedule.
+        """
+        schedule = self.schedule
+        water_due = schedule.due("water", self.ticks)
+        pumping_due = schedule.due("pumping", self.ticks)
+        self.flowing = [False, False, water_due, pumping_due]
+        self.flow_scale = [1, 1, schedule.period("water"), schedule.period("pumping")]
+        self.sunlight_due = schedule.due("sunlight", self.ticks)
+        self.sunlight_scale = schedule.period("sunlight")
+        self.reproduction_due = schedule.due("reproduction", self.ticks)
+        if self.sunlight_due and self.lighting is not None:
+            self.lighting.update(self.ticks, CellTypes(self.cells))
+
+    def set_sun(self, sun):
+        """
+        Light the world with a sun that casts shadows and moves over the day
+
+        Args:
+            sun Sun to use, or None to light every Plant face touching Air
+                evenly, as when the world is created
+        """
+        self.lighting = None if sun is None else Lighting(self.width, self.depth, self.height, self.periodic, sun)
+
+    def set_climate(self, climate):
+        """
+        Let it rain on the world and the water evaporate from its surface
+
+        Args:
+            climate Climate to use, or None for no weather, as when the
+                world is created
+        """
+        self.weather = None if climate is None else Weather(self.width, self.depth, self.height, self.periodic,
+            climate)
+
+    def apply_weather(self):
+        """
+        Apply the rain and evaporation due this tick to the surface cells
+
+        The cells whose water changed are added to the active set of the
+        next tick.
+
+        Returns:
+            List of the flat indices of the cells whose water changed
+        """
+        weather = self.weather
+        if weather is None:
+            return []
+        cells = self.cells
+        wet, rain = weather.rain(self.ticks, CellTypes(cells))
+        watered = wet.tolist()
+        for index in watered:
+            cells[index].water += rain
+        dry, loss = weather.drying(self.ticks, CellTypes(cells))
+        for index in dry.tolist():
+            cell = cells[index]
+            lost = min(max(cell.water, 0.0), loss)
+            if lost:
+                cell.water -= lost
+                watered.append(index)
+        self.changed.update(watered)
+        return watered
+
+    def finish_tick(self):
+        """
+        Prepare for the next tick
+        """
+        watered = self.apply_weather()
+        # Only the cells updated this tick, or reached by the weather, can
+        # have changed. They're noted before the active set moves on to the
+        # next tick.
+        updated = self.active_cells()
+        if watered:
+            updated = sorted(set(updated).union(watered))
+        self.updated = updated
+        if self.recorder is not None:
+            self.record_tick(self.ticks + 1, updated)
+        self.update_active()
+        self.ticks += 1
+
+    def record_tick(self, tick, indices=None):
+        """
+        Pass the state of some cells to the recorder
+
+        Args:
+            tick number of the tick being recorded
+            indices sequence of the cells to pass, or None for every cell
+        """
+        if indices is None:
+            cells = self.cells[:self.topology.size]
+        else:
+            cells = [self.cells[index] for index in indices]
+        count = len(cells)
+        # Looking up the type of each class once is much quicker than
+        # taking the value of every cell's CellType
+        classes = [type(cell) for cell in cells]
+        codes = {cls: cls.cell_type.value for cls in set(classes)}
+        self.recorder.record(
+            tick,
+            np.fromiter(map(codes.__getitem__, classes), np.int8, count),
+            np.fromiter([cell.water for cell in cells], float, count),
+            np.fromiter([cell.energy for cell in cells], float, count),
+            np.fromiter(chain.from_iterable([cell.colour[:4] for cell in cells]), float,
+                4 * count).reshape(count, 4),
+            indices,
+        )
+
+    def start_recording(self, recorder):
+        """
+        Record the world as it is now and after every tick that follows
+
+        Args:
+            recorder Recorder to write to
+        """
+        self.recorder = recorder
+        self.record_tick(self.ticks)
+
+    def clear_attempts(self):
+        """
+        Discard the Plant cells' reproduction intentions
+
+        Used in place of fight on ticks when reproduction isn't due.
+        """
+        cells = self.cells
+        for index in self.attempts:
+            cells[index].reproduce = [None] * len(Direction)
+        self.attempts = []
+
+    def apply_fights(self):
         """
-        self.colours[x][y][z] = self.grid[x][y][z].colour
+        Allow cells to try to reproduce, if reproduction is due this tick
+        """
+        if self.reproduction_due:
+            self.fight()
+        else:
+            self.clear_attempts()
+
+    def apply_reproductions(self):
+        """
+        Reproduce successful cells, if reproduction is due this tick
+
+        The cells are reproduced in index order.
+        """
+        if self.reproduction_due:
+            cells = self.cells
+            for index in self.winners:
+                self.apply_reproduce(cells[index], index)
+            self.winners = []
 
     def preupdate(self):
         """
         All updates that must happen before the main Cell update
         """
+        self.start_tick()
 
         # Copy outgoing edge state to incoming edge state
-        self.apply(lambda cell, x, y, z: self.apply_message_pass(cell, x, y, z))
+        self.apply(lambda cell, index: self.apply_message_pass(cell, index))
 
-    def postupdate(self):
+    def update_cells(self):
         """
-        All updates that must happen after the main Cell update
+        The main Cell update cycle
+
+        The cells that try to reproduce are noted for fight().
         """
+        cells = self.cells
+        attempts = []
+        for index in self.active_cells():
+            cell = cells[index]
+            cell.update()
+            if any(cell.reproduce):
+                attempts.append(index)
+        self.attempts = attempts
+
+    def postupdate_phases(self):
+        """
+        The updates that must happen after the main Cell update
+
+        Returns:
+            List of (name, function) pairs in the order they're applied
+        """
+        return [
+            # Transfer the pressures
+            ("pressure", lambda: self.apply(lambda cell, index: self.apply_pressure(cell, index))),
+
+            # Apply the flux constraints
+            ("flux", lambda: self.apply_flux_limits()),
 
-        # Transfer the pressures
-        self.apply(lambda cell, x, y, z: self.apply_pressure(cell, x, y, z))
+            # Move the water and energy
+            ("resources", lambda: self.apply(lambda cell, index: self.apply_resources(cell, index))),
 
-        # Apply the flux constraints
-        self.apply(lambda cell, x, y, z: cell.update_flux())
+            # Reset the flux values
+            ("flux_reset", lambda: self.apply(lambda cell, index: self.apply_flux_reset(cell))),
 
-        # Move the water and energy
-        self.apply(lambda cell, x, y, z: self.apply_resources(cell, x, y, z))
+            # Allow cells to try to reproduce
+            ("fight", lambda: self.apply_fights()),
 
-        # Reset the flux values
-        self.apply(lambda cell, x, y, z: self.apply_flux_reset(cell))
+            # Reproduce successful cells
+            ("reproduce", lambda: self.apply_reproductions()),
+        ]
 
-        # Allow cells to try to reproduce
-        self.apply(lambda cell, x, y, z: self.fight(x, y, z))
+    def postupdate(self):
+        """
+        All updates that must happen after the main Cell update
+        """
+        for name, phase in self.postupdate_phases():
+            phase()
+
+    def phases(self):
+        """
+        Every update in a tick, in order
 
-        # Reproduce successful cells
-        self.apply(lambda cell, x, y, z: self.apply_reproduce(cell, x, y, z))
+        Calling each function in turn is equivalent to calling update().
+
+        Returns:
+            List of (name, function) pairs
+        """
+        return [
+            ("message_pass", lambda: self.preupdate()),
+            ("update", lambda: self.update_cells()),
+        ] + self.postupdate_phases() + [
+            ("finish", lambda: self.finish_tick()),
+        ]
 
     def update(self):
         """
         The main update calls
 
         Calls the pre update, then the main update, then the post update cycle.
+
+        If a profiler is attached the phases are run through it instead, so
+        that each can be timed.
         """
+        if self.profiler is not None:
+            self.profiler.tick(self.phases(), lambda: len(self.active_cells()))
+            return
+
         self.preupdate()
 
         # Perform the main Cell update cycle
-        self.apply(lambda cell, x, y, z: cell.update())
+        self.update_cells()
 
         self.postupdate()
 
+        self.finish_tick()
+
     def display_slice(self, z):
         """
         Output a slice of the world to the console.
@@ -483,26 +911,95 @@ class Grid():
         for y in range(self.depth):
             line = ''
             for x in range(self.width):
-                character = str(self.grid[x][y][z].water)
+                character = str(self.cell(x, y, z).water)
                 line += "{:3} ".format(character)
             print(line)
 
+    def species_at(self, index):
+        """
+        Returns the import path of the plant species occupying a cell
+
+        Args:
+            index position in the grid
+
+        Returns:
+            Import path of the species, or None if the cell isn't a Plant
+        """
+        cell = self.cells[index]
+        if cell.cell_type == CellType.PLANT:
+            return class_name(type(cell))
+        return None
+
+    def statistics(self):
+        """
+        Summarise the current state of the world
+
+        Returns:
+            Dictionary of cell counts and resource totals, overall and for
+            each plant species
+        """
+        cells = self.cells[:self.topology.size]
+        counts = {name: 0 for name in CELL_TYPE_NAMES}
+        species = {}
+        for cell in cells:
+            counts[CELL_TYPE_NAMES[cell.cell_type.value]] += 1
+            if cell.cell_type == CellType.PLANT:
+                totals = species.setdefault(class_name(type(cell)), {"cells": 0, "water": 0.0, "energy": 0.0})
+                totals["cells"] += 1
+                totals["water"] += cell.water
+                totals["energy"] += cell.energy
+        return {
+            "cells": counts,
+            "water": math.fsum(cell.water for cell in cells),
+            "species": species,
+        }
+
+    def run(self, ticks):
+        """
+        Run the world without rendering
+
+        Performs the updates back to back, with no locking or copying of
+        colours for the renderer.
+
+        Args:
+            ticks number of updates to perform
+
+        Returns:
+            Time taken in seconds
+        """
+        start = perf_counter()
+        for _ in range(ticks):
+            self.update()
+        return perf_counter() - start
+
     def grid_update(self):
         """
         Perform the main update loop for the GridWorld
 
         This is separate from the rendering and user intear
         """
+        self.publish_frame()
         input("Press Enter to continue...")
         while True:
             self.update()
-            with self.render_lock:
-                for x in range(self.width):
-                    for y in range(self.depth):
-                        for z in range(self.height):
-                            self.colours[x][y][z] = self.grid[x][y][z].colour
+            self.publish_frame()
             #sleep(0.1)
 
+    def publish_frame(self):
+        """
+        Colour the cells and publish the colours to the renderer
+
+        Only the cells updated during the last tick, or reached by the
+        weather, can have changed colour, see finish_tick(). The colours of
+        the rest are kept from when the world was populated or last
+        changed.
+        """
+        cells = self.cells
+        updated = self.updated
+        for index in (range(self.topology.size) if updated is None else updated):
+            self.apply_colour(cells[index], index)
+        self.frames.publish(self.colours)
+
     def start_grid_thread(self):
         """
         Start the world update thread.
@@ -510,7 +1007,7 @@ class Grid():
         Starts the thread used for updating the world based on the Gridworld
         physics rules.
         """
-        self.render_lock = Lock()
+        self.frames = FrameBuffer(self.topology.size)
         t = Thread(target=lambda : self.grid_update(), args=[])
         t.start()
 
@@ -521,53 +1018,361 @@ class Grid():
         Transfers the colours from the cells over to the mesh grid for
         rendering.
 
-        This is threadsafe, but will potentially block the render thread so
-        should be kept as fast as possible.
+        Only the latest complete frame published by the update thread is
+        used, so this never waits for the update thread. If no new frame has
+        been published since the last call nothing is done.
         """
-        with self.render_lock:
-            count = 0
-            for x in range(self.width):
-                for y in range(self.depth):
-                    for z in range(self.height):
-                        voxel = self.voxels[count]
-                        colour = self.colours[x][y][z]
-                        voxel.prop.color = "#{:02x}{:02x}{:02x}".format(
-                            int(colour[0] * 255),
-                            int(colour[1] * 255),
-                            int(colour[2] * 255)
-                        )
-                        voxel.prop.opacity = colour[3]
-                        count += 1
-
-    def main(self):
+        colours = self.frames.latest()
+        if colours is not None:
+            self.voxels.set_colours(colours)
+
+    def start_grid_process(self, seed):
+        """
+        Start the world update in a separate process
+
+        The world is populated and updated in a child process, which
+        publishes its frames through a SharedFrameBuffer. This process only
+        displays them, so rendering doesn't compete with the update for the
+        interpreter lock.
+
+        Args:
+            seed for the random number generator used to populate the world
+
+        Returns:
+            Tuple of the child process and the event used to start it, which
+            must be kept until the process has started
+        """
+        context = get_context("spawn")
+        frames = SharedFrameBuffer(self.width * self.depth * self.height, lock=context.Lock())
+        start = context.Event()
+        process = context.Process(target=simulate, args=(self, seed, frames.attach_args(), start),
+            daemon=True)
+        process.start()
+        self.frames = frames
+
+        def wait_for_enter():
+            input("Press Enter to continue...")
+            start.set()
+        Thread(target=wait_for_enter, daemon=True).start()
+        return process, start
+
+    def main(self, seed=4, process=False):
         """
         Main execution thread.
 
         Spawns a thread to perform the update. The main thread is used to
         manage the user interface and rendering.
+
+        Args:
+            seed for the random number generator used to populate the world
+            process run the update in a separate process rather than a
+                thread, see start_grid_process()
         """
+        # Only pay for the Qt/VTK imports when a window is wanted
+        import src.voxels as vxm
+
         print("Preparing grid world...")
-        random.seed(4)
-        self.populate()
+        if process:
+            simulation, start = self.start_grid_process(seed)
+        else:
+            random.seed(seed)
+            self.populate()
 
         # Create the scene
         pl, self.voxels = vxm.draw(self.width, self.depth, self.height)
         pl.add_callback(lambda : self.update_colours(), interval=50)
         print("...Prepared")
 
-        self.start_grid_thread()
+        if not process:
+            self.start_grid_thread()
         pl.show()
 
+        try:
+            while True:
+                pl.render()
+                pl.app.processEvents()
+        finally:
+            if process:
+                simulation.terminate()
+                simulation.join()
+                self.frames.unlink()
+
+def simulate(grid, seed, frames, start):
+    """
+    Populate and update a world in a child process
+
+    See Grid.start_grid_process.
+
+    Args:
+        grid the Grid to run, not yet populated
+        seed for the random number generator used to populate the world
+        frames arguments used to attach to the SharedFrameBuffer
+        start event set when the update should begin
+    """
+    random.seed(seed)
+    grid.populate()
+    grid.frames = SharedFrameBuffer(*frames)
+    grid.publish_frame()
+    start.wait()
+    try:
         while True:
-            pl.render()
-            pl.app.processEvents()
+            grid.update()
+            grid.publish_frame()
+    finally:
+        grid.frames.close()
+
+def parse_args(argv=None):
+    """
+    Parse the command line arguments
+
+    Args:
+        argv list of arguments, or None to use sys.argv
+
+    Returns:
+        Parsed arguments
+    """
+    parser = argparse.ArgumentParser(description="Plantworld cell-based grid world")
+    parser.add_argument("--headless", action="store_true",
+        help="run the simulation without opening a window")
+    parser.add_argument("--width", type=int, default=Grid.width, help="grid size in x")
+    parser.add_argument("--depth", type=int, default=Grid.depth, help="grid size in y")
+    parser.add_argument("--height", type=int, default=Grid.height, help="grid size in z")
+    parser.add_argument("--seed", type=int, default=4, help="random seed used to populate the world")
+    parser.add_argument("--species", nargs="+", default=["src.plants.Plant"], metavar="NAME",
+        help="import paths of the plant species to seed the world with, in turn, for example "
+        "src.plantlang.Shrub")
+    parser.add_argument("--ticks", type=int, default=100, help="number of ticks to run when headless")
+    parser.add_argument("--backend", choices=["objects", "arrays", "mapped", "parallel"], default="objects",
+        help="cell storage to use when headless")
+    parser.add_argument("--processes", type=int, metavar="N",
+        help="with --backend parallel, the number of worker processes (default one per CPU)")
+    parser.add_argument("--map-dir", metavar="DIR",
+        help="with --backend mapped, keep the world's files in DIR, carrying on from the world "
+        "already there if there is one")
+    parser.add_argument("--chunk-width", type=int, metavar="SLABS",
+        help="with --backend mapped, the number of x slabs swept through memory at a time")
+    parser.add_argument("--no-wrap", dest="periodic", action="store_false",
+        help="don't wrap the world at its edges")
+    parser.add_argument("--stats", metavar="FILE",
+        help="write the final statistics to FILE as JSON rather than to stdout")
+    parser.add_argument("--profile", nargs="?", const="", metavar="FILE",
+        help="time each phase and include the totals in the statistics; "
+        "with FILE, also write the figures for every tick to FILE as JSON lines")
+    parser.add_argument("--save", metavar="FILE",
+        help="save a checkpoint of the world to FILE when headless")
+    parser.add_argument("--resume", metavar="FILE",
+        help="carry on from the checkpoint in FILE rather than populating a new world; "
+        "its size and schedule are used")
+    parser.add_argument("--record", metavar="FILE",
+        help="record every tick to FILE, for viewing with replay.py")
+    parser.add_argument("--keyframe-every", type=int, default=100, metavar="TICKS",
+        help="ticks between the keyframes of a recording")
+    parser.add_argument("--process", action="store_true",
+        help="run the simulation in a separate process from the window")
+    parser.add_argument("--water-period", type=int, default=1, metavar="TICKS",
+        help="update the flow of water through the soil every TICKS ticks")
+    parser.add_argument("--pump-period", type=int, default=1, metavar="TICKS",
+        help="update the flow of water through plants every TICKS ticks")
+    parser.add_argument("--sun-period", type=int, default=1, metavar="TICKS",
+        help="give plants sunlight every TICKS ticks")
+    parser.add_argument("--reproduce-period", type=int, default=1, metavar="TICKS",
+        help="let plants reproduce every TICKS ticks")
+    parser.add_argument("--lighting", action="store_true",
+        help="let plants and terrain shade the plants below them from the sun")
+    parser.add_argument("--day-length", type=int, default=0, metavar="TICKS",
+        help="move the sun across the sky over a day of TICKS ticks, half of it night; implies --lighting")
+    parser.add_argument("--rain-period", type=int, default=0, metavar="TICKS",
+        help="let a shower fall on part of the world once every TICKS ticks")
+    parser.add_argument("--rain", type=float, default=8.0, metavar="WATER",
+        help="water added to each surface cell a shower falls on")
+    parser.add_argument("--rain-radius", type=int, default=6, metavar="CELLS",
+        help="radius of each shower")
+    parser.add_argument("--evaporation", type=float, default=0.0, metavar="WATER",
+        help="water evaporating from each surface Soil cell per tick")
+    return parser.parse_args(argv)
+
+def schedule_from_args(args):
+    """
+    Create the update schedule given on the command line
+
+    Args:
+        args parsed command line arguments
+
+    Returns:
+        Schedule
+    """
+    return Schedule(water=args.water_period, pumping=args.pump_period,
+        sunlight=args.sun_period, reproduction=args.reproduce_period)
+
+def sun_from_args(args):
+    """
+    Create the sun given on the command line
+
+    Args:
+        args parsed command line arguments
+
+    Returns:
+        Sun, or None if plants are lit evenly
+    """
+    if not (args.lighting or args.day_length):
+        return None
+    return Sun(args.day_length)
+
+def climate_from_args(args):
+    """
+    Create the climate given on the command line
+
+    The showers are placed using the seed of the world.
+
+    Args:
+        args parsed command line arguments
+
+    Returns:
+        Climate, or None if there's no weather
+    """
+    if not (args.rain_period or args.evaporation):
+        return None
+    return Climate(args.rain_period, args.rain, args.rain_radius, args.evaporation, seed=args.seed)
+
+def species_from_args(args):
+    """
+    Load the plant species given on the command line
+
+    Args:
+        args parsed command line arguments
+
+    Returns:
+        Tuple of Plant subclasses
+    """
+    species = []
+    for name in args.species:
+        module, _, cls = name.rpartition(".")
+        species.append(getattr(importlib.import_module(module), cls))
+    return tuple(species)
+
+def headless(args):
+    """
+    Run the world without a window and report the final state
+
+    Args:
+        args parsed command line arguments
+    """
+    grid = Grid()
+    grid.width = args.width
+    grid.depth = args.depth
+    grid.height = args.height
+    grid.periodic = args.periodic
+    grid.schedule = schedule_from_args(args)
+    grid.species = species_from_args(args)
+
+    random.seed(args.seed)
+    start = perf_counter()
+    if args.backend == "mapped" and args.map_dir and MappedGrid.exists(args.map_dir):
+        grid = MappedGrid.open(args.map_dir, args.chunk_width)
+    elif args.backend == "mapped":
+        grid = MappedGrid(args.width, args.depth, args.height, args.periodic, args.map_dir,
+            args.chunk_width)
+        grid.schedule = schedule_from_args(args)
+        grid.species = species_from_args(args)
+        grid.populate()
+    elif args.resume and args.backend == "arrays":
+        grid = ArrayGrid.load_checkpoint(args.resume)
+    elif args.resume and args.backend == "parallel":
+        grid = ParallelGrid.load_checkpoint(args.resume)
+    elif args.resume:
+        grid.load_checkpoint(args.resume)
+    elif args.backend in ("arrays", "parallel"):
+        # Populate the arrays directly rather than building the cells first
+        backend = ArrayGrid if args.backend == "arrays" else ParallelGrid
+        grid = backend(args.width, args.depth, args.height, args.periodic)
+        grid.schedule = schedule_from_args(args)
+        grid.species = species_from_args(args)
+        grid.populate()
+    else:
+        grid.populate()
+    if args.backend == "parallel":
+        grid.processes = args.processes
+    # A world that's carried on keeps its own sun and climate unless they're
+    # given
+    sun = sun_from_args(args)
+    if sun is not None:
+        grid.set_sun(sun)
+    climate = climate_from_args(args)
+    if climate is not None:
+        grid.set_climate(climate)
+    populate_time = perf_counter() - start
+
+    exporter = None
+    if args.profile is not None:
+        grid.profiler = Profiler()
+        if args.profile:
+            exporter = JsonLinesExporter(args.profile)
+            grid.profiler.add_exporter(exporter)
+
+    recorder = None
+    if args.record:
+        recorder = Recorder(args.record, grid.width, grid.depth, grid.height, args.keyframe_every)
+        grid.start_recording(recorder)
+
+    run_time = grid.run(args.ticks)
+
+    if exporter:
+        exporter.close()
+    if recorder:
+        recorder.close()
+
+    if args.save:
+        grid.save_checkpoint(args.save)
+    if args.backend == "mapped" and args.map_dir:
+        grid.flush()
+    if args.backend == "parallel":
+        grid.close()
+
+    stats = {
+        "width": grid.width,
+        "depth": grid.depth,
+        "height": grid.height,
+        "periodic": grid.periodic,
+        "seed": args.seed,
+        "backend": args.backend,
+        "ticks": args.ticks,
+        "schedule": grid.schedule.periods,
+        "populate_seconds": populate_time,
+        "run_seconds": run_time,
+        "ticks_per_second": args.ticks / run_time if run_time > 0 else None,
+    }
+    stats.update(grid.statistics())
+    if grid.profiler is not None:
+        stats["profile"] = grid.profiler.report()
+
+    if args.stats:
+        with open(args.stats, "w") as output:
+            json.dump(stats, output, indent=2)
+    else:
+        json.dump(stats, sys.stdout, indent=2)
+        print()
+
+    if args.backend == "mapped" and not args.map_dir:
+        shutil.rmtree(grid.directory)
 
 if __name__ == "__main__":
     """
     Gridworld entry point
     """
-    grid = Grid()
-    grid.main()
+    args = parse_args()
+    if args.headless:
+        headless(args)
+    else:
+        grid = Grid()
+        grid.width = args.width
+        grid.depth = args.depth
+        grid.height = args.height
+        grid.periodic = args.periodic
+        grid.schedule = schedule_from_args(args)
+        grid.species = species_from_args(args)
+        grid.set_sun(sun_from_args(args))
+        grid.set_climate(climate_from_args(args))
+        grid.main(args.seed, args.process)
 
 
 